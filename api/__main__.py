@@ -1,21 +1,59 @@
+from .startup import FirstResponse, timeline  # first, to time the imports after it
+
+import asyncio
+import datetime
+import os
 from typing import Union
 
-import uvicorn
-from fastapi import FastAPI
+from fastapi import BackgroundTasks, FastAPI, Header, Query, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 
 from pydantic.dataclasses import dataclass
 
+from . import engines
+from .admission import Admission, AdmissionMiddleware
+from .analytics import GameStore
+from .compute import Rejected, Scheduler, unless_abandoned
+from .events import Channels
 from .game import Game
-from .models import Point, Line
+from .models import Grid, Point, Line
+from .players import PLAYERS
+from .profiling import Profiler, ProfilingMiddleware, capture
+from .puzzle import puzzles
+from .sessions import DEFAULT_SESSION, Sessions
+from .static import CLIENT, StaticAssets, matches
+from .traffic import Recorder, RecorderMiddleware
+from .wire import reply
+
+timeline.mark('imports')
 
 app = FastAPI()
 
+admission = Admission.from_environment()  # None unless admission control is enabled, see api/admission.py
+if admission is not None:
+    app.add_middleware(AdmissionMiddleware, admission=admission)  # before CORS, so that a 503 has its headers
+
 # add middleware to allow the client to request this api cross-origin without access control headers
 # see https://fastapi.tiangolo.com/tutorial/cors/
 app.add_middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], expose_headers=['*'])
 
-game = Game()
+profiler = Profiler.from_environment()  # None unless profiling is enabled, see api/profiling.py
+if profiler is not None:
+    app.add_middleware(ProfilingMiddleware, profiler=profiler)
+
+recorder = Recorder.from_environment()  # None unless recording is enabled, see api/traffic.py
+if recorder is not None:
+    app.add_middleware(RecorderMiddleware, recorder=recorder)  # outside admission control, so shed requests are too
+
+engine = engines.from_environment()  # the reference engine behind a cache of positions, see api/engines.py
+sessions = Sessions(idle=float(os.environ.get('SESSION_IDLE', 60)), engine=engine)  # idle seconds until hibernation
+channels = Channels()  # spectators of each session
+boot = os.urandom(4).hex()  # in ETags, since snapshot versions start again when the process does
+batch_workers = 8  # the most threads the sessions of a multi-session batch are spread over
+analytics = GameStore.from_environment()  # None unless analytics are enabled, see api/analytics.py
+scheduler = Scheduler.from_environment()  # None if computer moves are disabled, see api/compute.py
 
 
 @dataclass
@@ -23,6 +61,7 @@ class StateUpdate:
     newLine: Union[Line, None] = None
     heading: Union[str, None] = None
     message: Union[str, None] = None
+    legalNodes: Union[str, None] = None  # opt-in, see respond()
 
 
 @dataclass
@@ -31,6 +70,34 @@ class Payload:
     body: Union[StateUpdate, Point, str]
 
 
+@dataclass
+class PuzzleSetup:
+    day: datetime.date
+    size: int
+    moves: int  # N, of a puzzle that wins in N
+    player: int  # to move
+    lines: list[Line]
+    solution: Union[Line, None]  # only if asked for
+    payload: Payload  # of the last click that set the game up
+
+
+@dataclass
+class Clicks:
+    points: list[Point]
+    last: bool = False  # respond with the payload of the last click only
+
+
+@dataclass
+class SessionClick:
+    session: str
+    point: Point
+
+
+@dataclass
+class SessionClicks:
+    clicks: list[SessionClick]
+
+
 @dataclass
 class Error:
     error: str
@@ -39,7 +106,11 @@ class Error:
         return self.error
 
 
-def respond() -> Payload:
+def respond(game: Game, legal=False) -> Payload:
+    """
+    :param legal: add the nodes the next click may be, as a bitmask over node indices (y * size + x) in hex,
+    so that a client can reject invalid clicks without a round trip
+    """
 
     match game.state:
 
@@ -107,7 +178,7 @@ def respond() -> Payload:
                     You must choose a node in an octilinear direction that does not intersect the path.
                     Try again.
                     ''',
-                    newline=None,
+                    newLine=None,
                 ),
             )
 
@@ -131,30 +202,339 @@ def respond() -> Payload:
                 )
             )
 
+    if legal:
+        response.body.legalNodes = format(game.legal_nodes(), 'x')
     print(response)
     return response
 
 
 @app.get('/initialize', response_model=Payload)
-def initialize():
-    global game
-    game = Game()
-    return respond()
+def initialize(session: str = DEFAULT_SESSION, legal: bool = False, accept: Union[str, None] = Header(None)):
+    if scheduler is not None:
+        scheduler.cancel(session)  # the computer moves of the old game are not wanted
+    with capture():
+        game = sessions.reset(session)
+        response = respond(game, legal)
+    channels.publish(session, response.msg, response)  # spectators clear the board
+    return reply(accept, response)
 
 
-@app.post('/node-clicked', response_model=Payload)
-def on_click(point: Point):
+def click(session: str, game: Game, point: Point, legal=False) -> Payload:
     print('clicked:', point)
-    game(point)
-    return respond()
+    with capture():
+        game(point)
+        response = respond(game, legal)
+    if game.state in ('VALID_END_NODE', 'GAME_OVER'):  # spectators only see accepted moves
+        channels.publish(session, response.msg, response)
+    if game.state == 'GAME_OVER' and analytics is not None:
+        analytics.add(game)
+    return response
+
+
+def precompute(game: Game, background_tasks: BackgroundTasks):
+    """
+    once a line has been played, the next player's valid end nodes are computed after the response has been sent
+    """
+    if game.state == 'VALID_END_NODE':
+        background_tasks.add_task(game.precompute)
+
+
+@app.post('/node-clicked', response_model=Payload)
+def on_click(
+        point: Point,
+        background_tasks: BackgroundTasks,
+        session: str = DEFAULT_SESSION,
+        legal: bool = False,
+        accept: Union[str, None] = Header(None),
+):
+    game = sessions[session]
+    response = click(session, game, point, legal)
+    precompute(game, background_tasks)
+    return reply(accept, response)
+
+
+@app.post('/nodes-clicked', response_model=list[Payload])
+def on_clicks(
+        clicks: Clicks,
+        background_tasks: BackgroundTasks,
+        session: str = DEFAULT_SESSION,
+        legal: bool = False,
+        accept: Union[str, None] = Header(None),
+):
+    """
+    plays a sequence of clicks in one request, as if each had been sent to /node-clicked,
+    stopping at the first click that is invalid or fails
+    """
+    game = sessions[session]
+    responses = []
+    for point in clicks.points:
+        responses.append(click(session, game, point, legal))
+        if game.state in ('INVALID_START_NODE', 'INVALID_END_NODE', 'ERROR'):
+            break
+    precompute(game, background_tasks)
+    return reply(accept, responses[-1:] if clicks.last else responses)
+
+
+@app.post('/games/nodes-clicked', response_model=list[Payload])
+async def on_session_clicks(
+        clicks: SessionClicks,
+        background_tasks: BackgroundTasks,
+        legal: bool = False,
+        accept: Union[str, None] = Header(None),
+):
+    """
+    plays the clicks of many sessions in one request, each as if it had been sent to /node-clicked for its session,
+    and responds with their payloads in the same order. the clicks of a session are played in order,
+    and the sessions are spread over a few threads
+    """
+    by_session: dict[str, list[tuple[int, Point]]] = {}
+    for i, entry in enumerate(clicks.clicks):
+        by_session.setdefault(entry.session, []).append((i, entry.point))
+    groups = list(by_session.items())
+    responses: list[Union[Payload, None]] = [None] * len(clicks.clicks)
+
+    def play(share: list[tuple[str, list[tuple[int, Point]]]]):
+        for session, entries in share:
+            game = sessions[session]
+            for i, point in entries:
+                responses[i] = click(session, game, point, legal)
+            precompute(game, background_tasks)
+
+    workers = min(batch_workers, len(groups))
+    await asyncio.gather(*(run_in_threadpool(play, groups[worker::workers]) for worker in range(workers)))
+    return reply(accept, responses)
 
 
 @app.post('/error', response_model=Payload)
-def on_error(error: Error):
+def on_error(error: Error, session: str = DEFAULT_SESSION, accept: Union[str, None] = Header(None)):
+    game = sessions[session]
     game.error = str(error)
     game.state = 'ERROR'
-    return respond()  # this response will be ignored by the client, but it must be sent
+    with capture():
+        return reply(accept, respond(game))  # this response will be ignored by the client, but it must be sent
+
+
+@app.post('/computer-move', response_model=Payload)
+async def computer_move(
+        request: Request,
+        background_tasks: BackgroundTasks,
+        session: str = DEFAULT_SESSION,
+        player: str = 'search',
+        seconds: float = Query(1.0, gt=0, le=10),
+        move: Union[str, None] = Query(None, regex=r'^\d+,\d+$'),
+        legal: bool = False,
+        accept: Union[str, None] = Header(None),
+):
+    """
+    plays the line a computer player chooses for the player to move, as if its two clicks had been sent to
+    /node-clicked. the computer player thinks for at most seconds in the compute pool, see api/compute.py.
+    given a move, as the start and end node indices that a recording noted, plays it instead, see api/traffic.py
+    """
+    if player not in PLAYERS or (scheduler is None and move is None):
+        return JSONResponse({'detail': f'no computer player {player}'}, status_code=404)
+    game = sessions[session]
+    if game.state == 'GAME_OVER':
+        return reply(accept, respond(game, legal))
+    if game.start_node is not None:
+        return JSONResponse({'detail': 'a line has been started, finish it first'}, status_code=409)
+
+    if move is not None:
+        move = tuple(map(int, move.split(',')))
+        if max(move) >= len(game.grid.points):
+            return JSONResponse({'detail': f'no node {max(move)} on a {game.grid.size}x{game.grid.size} grid'},
+                                status_code=422)
+    else:
+        lines = bytes(game.lines)
+        try:
+            move = await unless_abandoned(
+                request.receive, scheduler.move(session, player, game.grid.size, lines, seconds))
+        except Rejected as rejection:
+            headers = {'Retry-After': str(rejection.retry_after)} if rejection.retry_after else None
+            return JSONResponse({'detail': str(rejection)}, status_code=rejection.status, headers=headers)
+        if move is None:  # the client went away, so nobody reads this
+            return Response(status_code=499)
+        if sessions[session] is not game or game.lines != lines or game.start_node is not None:
+            return JSONResponse({'detail': 'the game changed while the computer player was thinking'},
+                                status_code=409)
+    request.state.replay = {'move': f'{move[0]},{move[1]}'}  # recorded, so that a replay plays the same move
+
+    def play() -> Payload:
+        start, end = (game.grid.points[node] for node in move)
+        click(session, game, start, legal)
+        return click(session, game, end, legal)
+
+    response = await run_in_threadpool(play)
+    precompute(game, background_tasks)
+    return reply(accept, response)
+
+
+@app.get('/puzzle', response_model=PuzzleSetup)
+def puzzle(
+        request: Request,
+        background_tasks: BackgroundTasks,
+        session: str = DEFAULT_SESSION,
+        size: int = Query(4, ge=2, le=26),  # the grid sizes that records, and so puzzles, can be written for
+        moves: int = Query(1, ge=1),
+        day: Union[datetime.date, None] = None,
+        solution: bool = False,
+        legal: bool = False,
+        accept: Union[str, None] = Header(None),
+):
+    """
+    sets the session's game up at the puzzle of the day (today by default) for the grid size, in which the player to
+    move can win in the given number of moves, see api/puzzle.py, as if the game had been initialized and the clicks
+    of its lines sent to /node-clicked. the solution is only sent if asked for
+    """
+    day = day or datetime.date.today()
+    request.state.replay = {'day': day.isoformat()}  # recorded, so that a replay on another day sets up this puzzle
+    found = puzzles.daily(size, moves, day)
+    if found is None:
+        return JSONResponse({'detail': f'no {size}x{size} puzzles in {moves}'}, status_code=404)
+    if scheduler is not None:
+        scheduler.cancel(session)
+    with capture():
+        game = sessions.reset(session, size)
+        response = respond(game, legal)
+    channels.publish(session, response.msg, response)  # spectators clear the board
+    points = game.grid.points
+    for line in found.lines:
+        for node in line:
+            response = click(session, game, points[node], legal)
+    precompute(game, background_tasks)
+
+    def line(start: int, end: int) -> Line:
+        return Line(start=points[start], end=points[end])
+
+    return reply(accept, PuzzleSetup(
+        day=day,
+        size=size,
+        moves=moves,
+        player=game.player,
+        lines=[line(*played) for played in found.lines],
+        solution=line(*found.solution) if solution else None,
+        payload=response,
+    ))
+
+
+@app.get('/games/{session}/events')
+async def events(session: str):
+    """
+    streams the accepted moves of a game to spectators as server-sent events
+    """
+    return StreamingResponse(
+        channels.stream(session),
+        media_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},  # don't let proxies hold frames back
+    )
+
+
+@app.get('/state')
+def state(session: str = DEFAULT_SESSION, if_none_match: Union[str, None] = Header(None)):
+    """
+    the game as it was after its last accepted move, read from its immutable snapshot without locking the game,
+    with an ETag of the snapshot version, so that a poller gets a 304 until the next move. not async, since reading
+    the snapshot of a hibernating game rehydrates it
+    """
+    snapshot = sessions.snapshot(session)
+    if snapshot is None:
+        return JSONResponse({'detail': f'unknown session {session}'}, status_code=404)
+    headers = {'ETag': f'"{boot}-{snapshot.version}"', 'Cache-Control': 'no-cache'}
+    if if_none_match is not None and matches(if_none_match, headers['ETag']):
+        return Response(status_code=304, headers=headers)
+    line = snapshot.new_line
+    return JSONResponse(
+        {
+            'version': snapshot.version,
+            'size': snapshot.size,
+            'state': snapshot.state,
+            'player': snapshot.player,
+            'winner': snapshot.winner,
+            'path': [{'x': node.x, 'y': node.y} for node in snapshot.path],
+            'newLine': None if line is None else {
+                'start': {'x': line[0].x, 'y': line[0].y},
+                'end': {'x': line[1].x, 'y': line[1].y},
+            },
+        },
+        headers=headers,
+    )
+
+
+@app.get('/sessions')
+def sessions_memory():
+    """
+    reports the number of games and the memory used per game, live and hibernating
+    """
+    return sessions.memory()
+
+
+@app.get('/engine')
+def engine_stats():
+    """
+    names the rules engine, and reports how often it answered from the cache of positions
+    and, in shadow mode, how often and how much faster it agreed with the reference
+    """
+    return engine.stats()
+
+
+@app.get('/admission')
+def admission_stats():
+    """
+    reports the requests active, waiting and shed at each gate, see api/admission.py
+    """
+    return admission.stats() if admission is not None else {}
+
+
+@app.get('/compute')
+def compute_stats():
+    """
+    reports the computer moves waiting and running, and how long they waited and thought, see api/compute.py
+    """
+    return scheduler.stats() if scheduler is not None else {}
+
+
+@app.get('/profiles')
+def profiles():
+    """
+    lists the most recent request profiles, see api/profiling.py
+    """
+    return profiler.captures() if profiler is not None else []
+
+
+@app.get('/startup')
+def startup_report():
+    """
+    reports how long each phase of starting up took, see api/startup.py
+    """
+    return timeline.to_dict()
+
+
+@app.on_event('startup')
+def started():
+    timeline.mark('server')
+
+
+@app.on_event('shutdown')
+def shutdown():
+    if analytics is not None:
+        analytics.flush()
+    if recorder is not None:
+        recorder.close()
+    if scheduler is not None:
+        scheduler.shutdown()
+
+
+app.add_middleware(FirstResponse)  # last, so it is outermost
+timeline.mark('app')
+
+Grid()  # the default grid, whose tables are usually cached on disk, see api/tables.py
+timeline.mark('grids')
+
+if CLIENT.exists():
+    app.mount('/client', StaticAssets(CLIENT))  # compressed and fingerprinted once, at startup, see api/static.py
+timeline.mark('client')
 
 
 if __name__ == '__main__':
-    uvicorn.run(app)
+    import uvicorn  # only to run the API, not to import the app
+
+    uvicorn.run(app, port=int(os.environ.get('PORT', 8000)))
@@ -0,0 +1,220 @@
+"""
+Admission control
+
+The sync endpoints run in a threadpool of 40 threads. Under a spike, requests beyond that queue up unseen, and the
+latency of every request grows without bound. Instead, each request must be admitted twice before it is handled:
+
+    by its endpoint's gate, which lets a bounded number of its requests in at once (limit) and keeps a bounded
+    number waiting (queue), so that one busy endpoint can't take every thread
+    by the shared gate (ADMISSION_LIMIT requests at once, 32 by default, fewer than the threads), whose waiting
+    requests are let in by priority, so that cheap requests like /initialize and /state go ahead of expensive ones
+
+A request that finds its endpoint's queue full, or that waits longer than ADMISSION_WAIT seconds (2 by default),
+is shed with a fast 503 and a Retry-After header of how long its endpoint's queue should take to drain.
+Spectator event streams, which stay open, the client's files, and computer moves, which have a queue of their own
+(see api/compute.py), are not limited. Admission control is off unless ADMISSION=1, and /admission reports the
+requests active, waiting, admitted, shed and timed out at each gate, e.g.
+
+    ADMISSION=1 ADMISSION_LIMIT=16 ADMISSION_WAIT=0.5 python -m api
+    curl localhost:8000/admission
+"""
+import asyncio
+import heapq
+import itertools
+import math
+import os
+from typing import NamedTuple, Union
+
+from starlette.responses import JSONResponse
+
+
+class Policy(NamedTuple):
+    limit: int  # requests handled at once
+    queue: int  # requests waiting, beyond which they are shed
+    priority: int  # at the shared gate, lower goes first
+
+
+POLICIES = {
+    '/initialize': Policy(16, 64, 0),
+    '/state': Policy(32, 128, 0),
+    '/sessions': Policy(2, 8, 0),
+    '/engine': Policy(2, 8, 0),
+    '/node-clicked': Policy(16, 64, 1),
+    '/error': Policy(4, 16, 1),
+    '/nodes-clicked': Policy(8, 32, 2),  # a whole sequence of clicks
+    '/games/nodes-clicked': Policy(4, 16, 2),  # clicks of many sessions, over several threads
+}
+DEFAULT = Policy(8, 32, 1)
+
+
+def exempt(path: str) -> bool:
+    """
+    :return: True for the requests that are never limited
+    """
+    return path in ('/admission', '/computer-move') or path.startswith('/client') or path.endswith('/events')
+
+
+class Gate:
+    """
+    Lets a bounded number of requests in at once, and keeps a bounded number waiting in priority order
+
+    Gates are only used from the event loop, so they need no locks. A request that leaves hands its place straight to
+    the first of the waiting requests, so a request that arrives meanwhile can't jump the queue.
+    """
+
+    def __init__(self, limit: int, queue: int):
+        self.limit = limit
+        self.queue = queue
+        self.active = 0
+        self.waiting = 0
+        self.most_waiting = 0
+        self.admitted = 0
+        self.shed = 0
+        self.timed_out = 0
+        self.seconds = 0.0  # a moving average of the time requests are in, to estimate how long the queue will take
+        self._waiters: list[tuple[int, int, asyncio.Future]] = []  # a heap by priority, then arrival
+        self._arrivals = itertools.count()
+
+    async def enter(self, priority=0, wait: Union[float, None] = None) -> bool:
+        """
+        :param wait: the most seconds to wait, None to wait as long as it takes
+        :return: True once the request is in, False if it was shed because the queue was full or the wait too long
+        """
+        if self.active < self.limit and not self.waiting:
+            self.active += 1
+            self.admitted += 1
+            return True
+        if self.waiting >= self.queue or wait is not None and wait <= 0:
+            self.shed += 1
+            return False
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._arrivals), future))
+        self.waiting += 1
+        self.most_waiting = max(self.most_waiting, self.waiting)
+        try:
+            await asyncio.wait_for(future, wait)
+        except asyncio.TimeoutError:
+            self.timed_out += 1
+            return False
+        except asyncio.CancelledError:  # e.g. the client went away
+            if future.done() and not future.cancelled():
+                self.leave()  # it was handed a place just as it was cancelled
+            raise
+        finally:
+            self.waiting -= 1
+        self.admitted += 1
+        return True
+
+    def leave(self, seconds: Union[float, None] = None):
+        """
+        :param seconds: how long the request was in
+        """
+        if seconds is not None:
+            self.seconds += 0.1 * (seconds - self.seconds)
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():  # not timed out or cancelled
+                future.set_result(None)  # its place is this request's
+                return
+        self.active -= 1
+
+    def retry_after(self) -> int:
+        """
+        :return: the whole seconds the requests waiting should take to get in, at least 1
+        """
+        return max(1, math.ceil((self.waiting + 1) * self.seconds / self.limit))
+
+    def stats(self) -> dict:
+        return {
+            'limit': self.limit,
+            'queue': self.queue,
+            'active': self.active,
+            'waiting': self.waiting,
+            'most_waiting': self.most_waiting,
+            'admitted': self.admitted,
+            'shed': self.shed,
+            'timed_out': self.timed_out,
+            'seconds': self.seconds,
+        }
+
+
+class Admission:
+    """
+    The gates of each endpoint and the shared gate, which decide whether a request is handled or shed
+    """
+
+    def __init__(self, policies: dict[str, Policy] = None, limit=32, wait=2.0):
+        """
+        :param limit: the requests handled at once across all endpoints
+        :param wait: the most seconds a request waits to be admitted
+        """
+        self.policies = POLICIES if policies is None else policies
+        self.wait = wait
+        self.gates = {path: Gate(policy.limit, policy.queue) for path, policy in self.policies.items()}
+        self.default = Gate(DEFAULT.limit, DEFAULT.queue)
+        self.shared = Gate(limit, sum(gate.queue for gate in self.gates.values()) + DEFAULT.queue)
+
+    @classmethod
+    def from_environment(cls) -> Union['Admission', None]:
+        """
+        :return: admission control configured by the environment, or None if it is not enabled
+        """
+        if os.environ.get('ADMISSION', '0') in ('', '0'):
+            return None
+        return cls(limit=int(os.environ.get('ADMISSION_LIMIT', 32)), wait=float(os.environ.get('ADMISSION_WAIT', 2)))
+
+    def stats(self) -> dict:
+        return {
+            'shared': self.shared.stats(),
+            'endpoints': {
+                **{path: gate.stats() for path, gate in self.gates.items()},
+                'default': self.default.stats(),
+            },
+        }
+
+
+class AdmissionMiddleware:
+    """
+    ASGI middleware that admits each request through its endpoint's gate and the shared gate, or sheds it with a 503
+    """
+
+    def __init__(self, app, admission: Admission):
+        self.app = app
+        self.admission = admission
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or exempt(scope['path']):
+            return await self.app(scope, receive, send)
+
+        admission = self.admission
+        path = scope['path']
+        policy = admission.policies.get(path, DEFAULT)
+        gate = admission.gates.get(path, admission.default)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + admission.wait
+        if not await gate.enter(policy.priority, admission.wait):
+            return await self.shed(gate, scope, receive, send)
+        if not await admission.shared.enter(policy.priority, deadline - loop.time()):
+            gate.leave()
+            return await self.shed(gate, scope, receive, send)
+
+        admitted = loop.time()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            seconds = loop.time() - admitted
+            admission.shared.leave(seconds)
+            gate.leave(seconds)
+
+    @staticmethod
+    async def shed(gate: Gate, scope, receive, send):
+        response = JSONResponse(
+            {'detail': 'Service Unavailable: too many requests, try again later'},
+            status_code=503,
+            headers={'Retry-After': str(gate.retry_after())},
+        )
+        message = {'more_body': True}
+        while message.get('more_body'):  # read the body, or the server closes the connection, which clients reuse
+            message = await receive()
+        await response(scope, receive, send)
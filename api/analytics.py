@@ -0,0 +1,136 @@
+"""
+Analytics of completed games
+
+When enabled (ANALYTICS=<file>) every game that ends is added to a batch, and each batch of games (ANALYTICS_BATCH)
+is appended to the file as a block of columns, so a query only reads the columns it needs (see api/queries.py):
+
+    header:   magic (4s), version (B), reserved (3x), games (I), lines (I)
+    columns:  grid size (B per game), winner (B per game), lines played (H per game),
+              transitions (7 H per game, the number of times the game entered each of Game.STATES, in order),
+              nodes (2 B per line, the start and end node index of each line, game after game)
+
+All numbers are little endian. Blocks are only ever appended, and a block that was cut short is ignored.
+The batch still in memory is written when the API shuts down.
+"""
+import os
+import struct
+import sys
+import threading
+from array import array
+from pathlib import Path
+from typing import Iterator, Union
+
+from api.game import Game
+
+MAGIC = b'HTLA'
+VERSION = 1
+HEADER = struct.Struct('<4sB3xII')
+STATES = len(Game.STATES)
+
+# name: array type code, values per game (or per line end)
+COLUMNS = {
+    'size': ('B', 1),
+    'winner': ('B', 1),
+    'lines': ('H', 1),
+    'transitions': ('H', STATES),
+    'nodes': ('B', None),  # as many as the game has line ends
+}
+
+
+class GameStore:
+    """
+    Batches completed games, and appends each batch to the file as a block of columns
+    """
+
+    def __init__(self, path: Union[str, Path] = 'games.columns', batch=1024):
+        self.path = Path(path)
+        self.batch = batch
+        self._columns = self._empty()
+        self._games = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_environment(cls) -> Union['GameStore', None]:
+        """
+        :return: a store configured by the environment, or None if analytics are not enabled
+        """
+        path = os.environ.get('ANALYTICS', '')
+        if path in ('', '0'):
+            return None
+        return cls(path, batch=int(os.environ.get('ANALYTICS_BATCH', 1024)))
+
+    @staticmethod
+    def _empty() -> dict[str, array]:
+        return {name: array(code) for name, (code, _) in COLUMNS.items()}
+
+    def __len__(self):
+        """
+        :return: the number of games waiting to be written
+        """
+        return self._games
+
+    def add(self, game: Game):
+        with self._lock:
+            columns = self._columns  # under the lock, or a flush could write it before the game is added
+            columns['size'].append(game.grid.size)
+            columns['winner'].append(game.winner or 0)
+            columns['lines'].append(len(game.lines) // 2)
+            columns['transitions'].extend(min(count, 0xFFFF) for count in game.transitions)
+            columns['nodes'].frombytes(game.lines)
+            self._games += 1
+            if self._games < self.batch:
+                return
+            columns, games = self._columns, self._games
+            self._columns, self._games = self._empty(), 0
+            self._write(columns, games)  # under the lock, so that blocks are written whole and in order
+
+    def flush(self):
+        """
+        writes the games waiting to be written
+        """
+        with self._lock:
+            columns, games = self._columns, self._games
+            self._columns, self._games = self._empty(), 0
+            if games:
+                self._write(columns, games)
+
+    def _write(self, columns: dict[str, array], games: int):
+        if sys.byteorder == 'big':
+            for column in columns.values():
+                column.byteswap()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, 'ab') as file:
+            file.write(HEADER.pack(MAGIC, VERSION, games, len(columns['nodes']) // 2))
+            for column in columns.values():
+                file.write(column.tobytes())
+
+
+def block_size(games: int, lines: int) -> int:
+    """
+    :return: the bytes of the columns of a block
+    """
+    return sum(
+        array(code).itemsize * (2 * lines if per_game is None else per_game * games)
+        for code, per_game in COLUMNS.values()
+    )
+
+
+def blocks(data: Union[bytes, memoryview]) -> Iterator[tuple[int, dict[str, memoryview]]]:
+    """
+    :return: the number of games and the bytes of each column, of each whole block of the file's data
+    """
+    data = memoryview(data)
+    offset = 0
+    while offset + HEADER.size <= len(data):
+        magic, version, games, lines = HEADER.unpack_from(data, offset)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f'not a version {VERSION} analytics block at byte {offset}')
+        offset += HEADER.size
+        if offset + block_size(games, lines) > len(data):
+            return  # cut short, e.g. while it was being written
+        columns = {}
+        for name, (code, per_game) in COLUMNS.items():
+            length = array(code).itemsize * (2 * lines if per_game is None else per_game * games)
+            columns[name] = data[offset:offset + length]
+            offset += length
+        yield games, columns
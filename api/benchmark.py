@@ -0,0 +1,125 @@
+"""
+Time to first response
+
+How long a new worker takes from launch to its first response is what autoscaling and --reload cycles wait for,
+so it is the benchmark of the API's cold start to track. Each run launches a new `python -m api` and polls /startup
+until it responds, which also gets the phases the API timed itself (see api/startup.py). The difference between the
+time to first response and the API's own total is the interpreter starting up, and the polling.
+
+The medians are appended to a CSV file (startup.csv), so that they can be compared across changes, e.g.
+
+    python -m api.benchmark --runs 10
+    python -m api.benchmark --runs 10 --cold  # with an empty grid table cache in every run
+"""
+import argparse
+import csv
+import datetime
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from pathlib import Path
+
+from api.startup import PHASES
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def launch(environment: dict[str, str], timeout=30.0) -> tuple[float, dict[str, float]]:
+    """
+    starts the API in a new process and polls it until it responds
+    :return: the seconds from launching the process to its first response, and the phases it reported
+    """
+    port = free_port()
+    url = f'http://127.0.0.1:{port}/startup'
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'api'],
+        cwd=Path(__file__).parent.parent,
+        env={**os.environ, **environment, 'PORT': str(port)},
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        while True:
+            try:
+                urllib.request.urlopen(url, timeout=timeout).close()
+                break
+            except OSError:
+                if process.poll() is not None:
+                    raise RuntimeError(f'the API exited with {process.returncode} before it responded')
+                if time.perf_counter() - started > timeout:
+                    raise TimeoutError(f'the API did not respond within {timeout} s')
+                time.sleep(0.002)
+        seconds = time.perf_counter() - started
+        with urllib.request.urlopen(url, timeout=timeout) as response:  # again, now that the first response is timed
+            reported = json.load(response)
+    finally:
+        process.terminate()
+        process.wait()
+    return seconds, reported
+
+
+def benchmark(runs: int, cold=False) -> tuple[list[float], dict[str, list[float]]]:
+    """
+    :param cold: start every run with an empty grid table cache, otherwise the cache is filled by a first run that
+    isn't counted
+    :return: the time to first response of each run, and each phase of each run
+    """
+    times = []
+    phases: dict[str, list[float]] = {}
+    with tempfile.TemporaryDirectory() as directory:
+        if not cold:
+            launch({'GRID_CACHE': directory})
+        for run in range(runs):
+            cache = str(Path(directory) / str(run)) if cold else directory
+            seconds, reported = launch({'GRID_CACHE': cache})
+            times.append(seconds)
+            for phase, phase_seconds in reported.items():
+                phases.setdefault(phase, []).append(phase_seconds)
+    return times, phases
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m api.benchmark', description=__doc__.split('\n\n')[1])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--cold', action='store_true', help='without the grid table cache')
+    parser.add_argument('--output', default='startup.csv', help='the CSV file the medians are appended to')
+    args = parser.parse_args(argv)
+
+    times, phases = benchmark(args.runs, args.cold)
+    medians = {phase: statistics.median(values) for phase, values in phases.items()}
+    print(f'time to first response over {args.runs} runs ({"cold" if args.cold else "warm"} cache):')
+    print(f'  median {statistics.median(times) * 1000:.1f} ms, min {min(times) * 1000:.1f} ms, '
+          f'max {max(times) * 1000:.1f} ms')
+    print('median of each phase, as the API reported it:')
+    for phase, seconds in medians.items():
+        print(f'  {phase:<16}{seconds * 1000:8.1f} ms')
+
+    new = not Path(args.output).exists()
+    with open(args.output, 'a', newline='') as file:
+        writer = csv.writer(file)
+        if new:
+            phases = [phase.replace(' ', '_') + '_ms' for phase in PHASES]
+            writer.writerow(['date', 'python', 'runs', 'cache', 'time_to_first_response_ms', *phases])
+        writer.writerow([
+            datetime.datetime.now().isoformat(timespec='seconds'),
+            '.'.join(map(str, sys.version_info[:3])),
+            args.runs,
+            'cold' if args.cold else 'warm',
+            round(statistics.median(times) * 1000, 1),
+            *(round(medians.get(phase, 0.0) * 1000, 1) for phase in PHASES),
+        ])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,194 @@
+"""
+Opening book
+
+The first lines of a game are the most expensive to search, since the path is short and nearly every line is valid.
+The book holds a move for every position of the first few lines of a game, reduced by symmetry, searched offline.
+
+There is one file per grid size, e.g. books/4.book, made of a header followed by fixed width records sorted by key:
+
+    header:  magic (4s), version (B), grid size (B), most path nodes of any position (B), reserved (B), records (I)
+    record:  path nodes, path diagonals (big endian, as many bytes as the masks need),
+             path ends (B, B, 255 if there is no path), move start (B), move end (B)
+
+The positions of grid sizes small enough are solved exactly (--exact, 4x4 by default, about 2 million positions), so
+their book moves win soonest, or lose latest. The positions of larger grids are searched for --seconds each.
+
+A book is memory mapped the first time a position of its size is looked up, and the record is found by binary
+search, so a lookup costs a canonical transform and a few comparisons of bytes.
+
+usage:
+    python -m api.book --sizes 4 5 6 --lines 2 --seconds 1 --exact 4
+"""
+import argparse
+import mmap
+import struct
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Union
+
+from api.position import Position
+
+BOOKS = Path(__file__).parent / 'books'
+MAGIC = b'HTLB'
+VERSION = 1
+HEADER = struct.Struct('<4sBBBBI')
+NO_PATH = 255
+
+
+class Book:
+    """
+    The opening book for one grid size
+    """
+
+    def __init__(self, path: Path):
+        with open(path, 'rb') as file:
+            self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.size, self.max_nodes, _, self.count = HEADER.unpack_from(self._map)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f'{path} is not a version {VERSION} opening book')
+        self.key_size = key_size(self.size)
+        self.record_size = self.key_size + 2
+
+    def __len__(self):
+        return self.count
+
+    def find(self, key: bytes) -> Union[tuple[int, int], None]:
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            offset = HEADER.size + middle * self.record_size
+            record = self._map[offset:offset + self.key_size]
+            if record < key:
+                low = middle + 1
+            elif record > key:
+                high = middle
+            else:
+                return self._map[offset + self.key_size], self._map[offset + self.key_size + 1]
+        return None
+
+
+class OpeningBook:
+    """
+    The opening books of all grid sizes, each loaded on first use
+    """
+
+    def __init__(self, directory: Path = BOOKS):
+        self.directory = directory
+        self._books: dict[int, Union[Book, None]] = {}
+
+    def book(self, size: int) -> Union[Book, None]:
+        try:
+            return self._books[size]
+        except KeyError:
+            path = self.directory / f'{size}.book'
+            book = self._books[size] = Book(path) if path.exists() else None
+            return book
+
+    def lookup(self, position: Position) -> Union[tuple[int, int], None]:
+        """
+        :return: the book move (start, end) for the position, or None if the position is not in the book
+        """
+        book = self.book(position.size)
+        if book is None or position.nodes.bit_count() > book.max_nodes:
+            return None
+        symmetry, canonical = position.canonical
+        move = book.find(encode_key(canonical))
+        if move is None:
+            return None
+        inverse = position.grid.inverses[symmetry]  # the book move is for the canonical position
+        return inverse[move[0]], inverse[move[1]]
+
+
+opening_book = OpeningBook()
+
+
+def key_size(size: int) -> int:
+    return mask_size(size * size) + mask_size(2 * (size - 1) ** 2) + 2
+
+
+def mask_size(bits: int) -> int:
+    return (bits + 7) // 8
+
+
+def encode_key(position: Position) -> bytes:
+    size = position.size
+    ends = (NO_PATH, NO_PATH) if position.start is None else position.key[3:]
+    return position.nodes.to_bytes(mask_size(size * size), 'big') \
+        + position.diagonals.to_bytes(mask_size(2 * (size - 1) ** 2), 'big') \
+        + bytes(ends)
+
+
+def openings(size: int, lines: int) -> list[Position]:
+    """
+    :return: the canonical positions of the first lines of a game, which are not already over
+    """
+    frontier = {Position(size).key: Position(size)}
+    positions = []
+    for _ in range(lines):
+        positions.extend(frontier.values())
+        children = {}
+        for position in frontier.values():
+            for move in position.moves():
+                child = position.play(*move)
+                if not child.game_over:
+                    _, child = child.canonical
+                    children.setdefault(child.key, child)
+        frontier = children
+    return positions
+
+
+_solver = None  # in a worker process, kept across the positions of a book solved exactly
+
+
+def search(position: Position, seconds: float, exact=False) -> tuple[int, int]:
+    if exact:
+        global _solver
+        from api.puzzle import Solver
+        if _solver is None:
+            _solver = Solver(budget=float('inf'))
+        return _solver.best(position)
+    from api.players import SearchPlayer  # players consult the book, so they are imported late
+    return SearchPlayer(seed=0).choose(position, deadline=time.perf_counter() + seconds)
+
+
+def write(path: Path, size: int, moves: dict[bytes, tuple[int, int]], max_nodes: int):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'wb') as file:
+        file.write(HEADER.pack(MAGIC, VERSION, size, max_nodes, 0, len(moves)))
+        for key in sorted(moves):
+            file.write(key + bytes(moves[key]))
+
+
+def generate(size: int, lines: int, seconds: float, processes=None, directory: Path = BOOKS, exact=False) -> int:
+    """
+    searches, or solves if exact, the first lines of a game for the grid size and writes the book
+    :return: the number of positions in the book
+    """
+    positions = openings(size, lines)
+    with ProcessPoolExecutor(processes) as pool:
+        moves = pool.map(search, positions, [seconds] * len(positions), [exact] * len(positions))
+        book = {encode_key(position): move for position, move in zip(positions, moves)}
+    write(directory / f'{size}.book', size, book, max(position.nodes.bit_count() for position in positions))
+    return len(book)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m api.book', description=__doc__.split('\n\n')[1])
+    parser.add_argument('--sizes', nargs='+', type=int, default=[4, 5, 6])
+    parser.add_argument('--lines', type=int, default=2, help='the number of opening lines to search')
+    parser.add_argument('--seconds', type=float, default=1.0, help='search time per position')
+    parser.add_argument('--exact', nargs='*', type=int, default=[4], help='the grid sizes to solve exactly')
+    parser.add_argument('--processes', type=int, default=None, help='defaults to the number of CPUs')
+    parser.add_argument('--directory', type=Path, default=BOOKS)
+    args = parser.parse_args(argv)
+
+    for size in args.sizes:
+        started = time.perf_counter()
+        count = generate(size, args.lines, args.seconds, args.processes, args.directory, size in args.exact)
+        print(f'{size}x{size}: {count} positions in {time.perf_counter() - started:.1f}s', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
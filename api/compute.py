@@ -0,0 +1,356 @@
+"""
+Computer moves in a process pool
+
+Computer players think for up to seconds per move, which would take one of the request threads and hold the GIL
+from every other request. Instead /computer-move hands its position to a scheduler, which runs it in a pool of
+COMPUTE_PROCESSES worker processes (one per CPU by default) and awaits the move without taking a thread.
+
+Jobs wait in a queue per session, and a free process takes the next job of the next session in turn, so one session
+asking for many moves can't hold the others up. A session may have PER_SESSION jobs at once, and COMPUTE_QUEUE (64)
+jobs may wait in all. Each job has a deadline: it waits at most COMPUTE_WAIT seconds (2 by default) to be started,
+and then thinks for at most its seconds. A job that finds the queue full or waits too long is rejected with a 503.
+
+A job is cancelled as soon as its session is reset through /initialize, or its request is abandoned (the client went
+away). A waiting job is dropped from the queue. A running job's process is told through a shared flag, and its player
+gives up at its next deadline check, so the process is free again within a fraction of a second (160 ms into a 6x6
+search, which finishes the region it is solving first).
+
+The time jobs waited to be started and the time they spent thinking are reported separately at /compute, with the
+time between (sending the job to its process and back), to size the pool: long waits and short thinking mean too few
+processes. Workers are started with spawn, since forking a process with threads is unsafe, on the first move.
+"""
+import asyncio
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Coroutine, Union
+
+from api.players import PLAYERS, Player
+from api.position import Position
+
+PER_SESSION = 2  # jobs a session may have, waiting and running
+SOLVED = 2 ** 20  # positions a worker's search player remembers across moves before starting again
+SAMPLES = 1000  # the latest jobs the reported times are over
+
+
+class Rejected(Exception):
+    """
+    The job was not run, or its move was not wanted
+    """
+
+    def __init__(self, reason: str, status=503, retry_after: Union[int, None] = None):
+        super().__init__(reason)
+        self.status = status
+        self.retry_after = retry_after
+
+
+class Job:
+
+    __slots__ = ('session', 'player', 'lines', 'size', 'seconds', 'submitted', 'started', 'future', 'slot')
+
+    def __init__(self, session: str, player: str, size: int, lines: bytes, seconds: float, submitted: float):
+        self.session = session
+        self.player = player
+        self.size = size
+        self.lines = lines
+        self.seconds = seconds
+        self.submitted = submitted
+        self.started = None
+        self.future: Union[asyncio.Future, None] = None
+        self.slot = None  # the cancellation flag of a running job
+
+
+# in a worker process
+_flags = None
+_players: dict[str, Player] = {}
+
+
+def _initialize(flags):
+    global _flags
+    _flags = flags
+
+
+def think(player: str, size: int, lines: bytes, seconds: float, slot: int) -> tuple[tuple[int, int], float]:
+    """
+    runs in a worker process
+    :return: the move for the position after the lines, and the seconds it took to choose
+    """
+    started = time.perf_counter()
+    thinker = _players.get(player)
+    if thinker is None:
+        thinker = _players[player] = PLAYERS[player]()  # kept, so that a search player remembers what it solved
+    if len(getattr(thinker, 'solved', ())) > SOLVED:
+        thinker.solved.clear()
+        thinker.splits.clear()
+    position = Position(size)
+    for start, end in zip(lines[::2], lines[1::2]):
+        position = position.play(start, end)
+
+    thinking = threading.Event()
+
+    def watch():
+        while not thinking.wait(0.005):
+            if _flags is not None and _flags[slot]:
+                thinker.deadline = 0.0  # the search gives up at its next deadline check
+    watcher = threading.Thread(target=watch, daemon=True)
+    watcher.start()
+    try:
+        move = thinker.move(position, started + seconds)
+    finally:
+        thinking.set()
+        watcher.join()
+    return move, time.perf_counter() - started
+
+
+class Scheduler:
+    """
+    A fair queue of each session's jobs in front of a process pool
+
+    The scheduler is only used from the event loop, so it needs no locks, except to cancel a session's jobs from
+    another thread.
+    """
+
+    def __init__(self, processes: Union[int, None] = None, queue=64, wait=2.0, per_session=PER_SESSION):
+        """
+        :param queue: the most jobs waiting to be started
+        :param wait: the most seconds a job waits to be started
+        """
+        self.processes = processes or os.cpu_count() or 1
+        self.queue = queue
+        self.wait = wait
+        self.per_session = per_session
+        self.waiting = 0
+        self.counts = {'submitted': 0, 'completed': 0, 'rejected': 0, 'expired': 0, 'cancelled': 0, 'failed': 0}
+        self.times = {name: deque(maxlen=SAMPLES) for name in ('wait', 'compute', 'transfer')}  # seconds
+        self._queues: dict[str, deque[Job]] = {}  # the jobs waiting for each session
+        self._turns: deque[str] = deque()  # the sessions with jobs waiting, in turn
+        self._jobs: dict[str, set[Job]] = {}  # the jobs of each session, waiting and running
+        self._slots = list(range(self.processes))  # cancellation flags free for running jobs
+        self._pool = None
+        self._flags = None
+        self._loop: Union[asyncio.AbstractEventLoop, None] = None
+
+    @classmethod
+    def from_environment(cls) -> Union['Scheduler', None]:
+        """
+        :return: a scheduler configured by the environment, or None if computer moves are disabled
+        """
+        if os.environ.get('COMPUTE', '1') == '0':
+            return None
+        return cls(
+            processes=int(os.environ.get('COMPUTE_PROCESSES', 0)) or None,
+            queue=int(os.environ.get('COMPUTE_QUEUE', 64)),
+            wait=float(os.environ.get('COMPUTE_WAIT', 2)),
+        )
+
+    @property
+    def running(self) -> int:
+        return self.processes - len(self._slots)
+
+    def _start(self):
+        context = multiprocessing.get_context('spawn')
+        self._flags = context.RawArray('b', self.processes)
+        self._pool = ProcessPoolExecutor(self.processes, context, initializer=_initialize, initargs=(self._flags,))
+
+    async def move(self, session: str, player: str, size: int, lines: bytes, seconds: float) -> tuple[int, int]:
+        """
+        :param lines: the start and end node index of each line played, see Game.lines
+        :return: the (start, end) node indices of the move the player chose
+        :raises Rejected: if the job was rejected, took too long or was cancelled
+        """
+        loop = self._loop = asyncio.get_running_loop()
+        jobs = self._jobs.setdefault(session, set())
+        if self.waiting >= self.queue or len(jobs) >= self.per_session:
+            self.counts['rejected'] += 1
+            if not jobs:
+                del self._jobs[session]
+            raise Rejected('too many computer moves, try again later', retry_after=self.retry_after())
+
+        job = Job(session, player, size, lines, seconds, loop.time())
+        job.future = loop.create_future()
+        jobs.add(job)
+        queue = self._queues.get(session)
+        if queue is None:
+            queue = self._queues[session] = deque()
+            self._turns.append(session)
+        queue.append(job)
+        self.waiting += 1
+        self.counts['submitted'] += 1
+        loop.call_later(self.wait, self._expire, job)
+        self._dispatch()
+        try:
+            # the deadline is the job's own once it has started, so this only bounds a worker that has hung
+            return await asyncio.wait_for(asyncio.shield(job.future), self.wait + seconds + 5.0)
+        except asyncio.TimeoutError:
+            rejection = Rejected('the computer player took too long', status=504)
+            self._cancel_job(job, 'failed', rejection)
+            raise rejection
+        except asyncio.CancelledError:  # the request was abandoned
+            self._cancel_job(job, 'cancelled')
+            raise
+
+    def _dispatch(self):
+        """
+        starts the next jobs in turn while there are free processes
+        """
+        while self._slots and self._turns:
+            session = self._turns.popleft()
+            queue = self._queues[session]
+            job = queue.popleft()
+            if queue:
+                self._turns.append(session)  # its next job waits for the other sessions' turns
+            else:
+                del self._queues[session]
+            self.waiting -= 1
+            if job.future.done():
+                continue
+
+            if self._pool is None:
+                self._start()
+            job.slot = self._slots.pop()
+            job.started = self._loop.time()
+            self._flags[job.slot] = 0
+            try:
+                running = self._pool.submit(think, job.player, job.size, job.lines, job.seconds, job.slot)
+            except BrokenProcessPool as error:
+                self._replace(self._pool)
+                self._slots.append(job.slot)
+                self._finish(job, 'failed', Rejected(f'the computer player failed: {error!r}', status=500))
+                continue
+            loop, pool = self._loop, self._pool
+            running.add_done_callback(lambda done, job=job: loop.call_soon_threadsafe(self._done, job, pool, done))
+
+    def _done(self, job: Job, pool: ProcessPoolExecutor, running):
+        self._slots.append(job.slot)
+        if not job.future.done():
+            try:
+                move, seconds = running.result()
+            except Exception as error:
+                if isinstance(error, BrokenProcessPool):  # a worker died, e.g. out of memory
+                    self._replace(pool)
+                self._finish(job, 'failed', Rejected(f'the computer player failed: {error!r}', status=500))
+            else:
+                elapsed = self._loop.time() - job.started
+                self.times['wait'].append(job.started - job.submitted)
+                self.times['compute'].append(seconds)
+                self.times['transfer'].append(max(0.0, elapsed - seconds))
+                self._finish(job, 'completed', tuple(move))
+        self._dispatch()
+
+    def _replace(self, pool: ProcessPoolExecutor):
+        """
+        drops a broken pool, so that the next job starts a new one
+        """
+        if pool is self._pool:
+            pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def _expire(self, job: Job):
+        if job.started is None:
+            rejection = Rejected('waited too long for a computer player', retry_after=self.retry_after())
+            self._cancel_job(job, 'expired', rejection)
+
+    def _finish(self, job: Job, outcome: str, result: Union[tuple[int, int], Exception]):
+        self.counts[outcome] += 1
+        jobs = self._jobs.get(job.session)
+        if jobs is not None:
+            jobs.discard(job)
+            if not jobs:
+                del self._jobs[job.session]
+        if isinstance(result, Exception):
+            job.future.set_exception(result)
+        else:
+            job.future.set_result(result)
+
+    def _cancel_job(self, job: Job, outcome='cancelled', rejection: Union[Rejected, None] = None):
+        if job.future.done():
+            return
+        if job.started is None:  # it frees its place in the queue now
+            queue = self._queues[job.session]
+            queue.remove(job)
+            self.waiting -= 1
+            if not queue:
+                del self._queues[job.session]
+                self._turns.remove(job.session)
+        else:
+            self._flags[job.slot] = 1  # its process stops thinking, and the slot is freed once it has
+        self._finish(job, outcome, rejection or Rejected('the game was reset', status=409))
+        job.future.exception()  # retrieved, since nobody may be waiting for it
+
+    def cancel(self, session: str):
+        """
+        cancels the jobs of the session, e.g. when its game is reset. Safe to call from any thread
+        """
+        if session not in self._jobs or self._loop is None:
+            return
+
+        def cancel():
+            for job in list(self._jobs.get(session, ())):
+                self._cancel_job(job)
+        try:
+            if asyncio.get_running_loop() is self._loop:
+                return cancel()
+        except RuntimeError:  # not on the event loop's thread
+            pass
+        self._loop.call_soon_threadsafe(cancel)
+
+    def retry_after(self) -> int:
+        """
+        :return: the whole seconds the jobs waiting should take to be started, at least 1
+        """
+        compute = self.times['compute']
+        seconds = sum(compute) / len(compute) if compute else 1.0
+        return max(1, round((self.waiting + 1) * seconds / self.processes))
+
+    def stats(self) -> dict:
+        def summary(seconds: deque) -> dict:
+            ordered = sorted(seconds)
+            if not ordered:
+                return {'p50_ms': 0.0, 'p90_ms': 0.0, 'p99_ms': 0.0, 'max_ms': 0.0}
+            return {
+                **{f'p{q}_ms': ordered[min(len(ordered) - 1, len(ordered) * q // 100)] * 1000 for q in (50, 90, 99)},
+                'max_ms': ordered[-1] * 1000,
+            }
+
+        return {
+            'processes': self.processes,
+            'running': self.running,
+            'waiting': self.waiting,
+            'sessions': len(self._jobs),
+            **self.counts,
+            **{name: summary(seconds) for name, seconds in self.times.items()},
+        }
+
+    def shutdown(self):
+        if self._pool is not None:
+            if self._flags is not None:
+                for slot in range(self.processes):
+                    self._flags[slot] = 1
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+async def unless_abandoned(receive, thinking: Coroutine) -> Union[tuple[int, int], None]:
+    """
+    :param receive: the request's ASGI receive, whose next message is a disconnect once the body has been read
+    :return: the move, or None if the client went away first, in which case the job is cancelled
+    """
+    async def disconnected():
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+
+    move = asyncio.ensure_future(thinking)
+    watch = asyncio.ensure_future(disconnected())
+    try:
+        await asyncio.wait((move, watch), return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        watch.cancel()
+    if not move.done():
+        move.cancel()
+        await asyncio.wait((move,))  # so that its job has been cancelled
+        return None
+    return move.result()
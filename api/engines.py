@@ -0,0 +1,294 @@
+"""
+Rules engines
+
+A Game asks its engine for the valid end nodes of a start node, which is also how it decides that the game is over.
+The reference engine is the original Path and Line logic. Faster engines can be rolled out behind it in shadow mode:
+a sampled fraction of their answers is checked against the reference engine by a background thread, off the request
+path, counting mismatches and timing both engines on the same moves, e.g.
+
+    RULES_ENGINE=bitmask RULES_SHADOW_RATE=0.05 python -m api
+    curl localhost:8000/engine
+
+Whichever engine is chosen, the API puts a process-wide cache of positions in front of it (POSITION_CACHE positions,
+0 to disable), since the games of all sessions pass through the same positions, the openings above all.
+"""
+import os
+import queue
+import random
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Union
+
+from api.errors import InvalidLine
+from api.models import Grid, Line, Path, Point
+from api.position import Position
+
+
+class Engine:
+    """
+    Decides which lines may be played
+    """
+
+    name = None
+
+    def __str__(self):
+        return self.name
+
+    def valid_end_nodes(self, grid: Grid, path: Path, start_node: Point) -> set[Point]:
+        """
+        :return: the nodes that would end a line from the start node that is octilinear and does not intersect the path
+        """
+        raise NotImplementedError
+
+    def stats(self) -> dict:
+        return {'engine': self.name}
+
+
+class ReferenceEngine(Engine):
+    """
+    builds each line that could be played, and checks it against every segment of the path
+    """
+
+    name = 'reference'
+
+    def valid_end_nodes(self, grid, path, start_node):
+        nodes = set()
+        for node in grid.nodes_octilinear_to(start_node) - set(path.nodes):  # only these could form a Line
+            try:
+                line = Line(start=start_node, end=node)
+            except InvalidLine:
+                continue
+
+            if not path.intersects(line):
+                nodes.add(node)
+
+        return nodes
+
+
+class BitmaskEngine(Engine):
+    """
+    reduces the path to masks of its nodes and diagonals, and walks the grid's precomputed rays (see Position)
+    """
+
+    name = 'bitmask'
+
+    def valid_end_nodes(self, grid, path, start_node):
+        index = grid.index
+        if start_node not in index:
+            return ReferenceEngine().valid_end_nodes(grid, path, start_node)  # off the grid, never played
+        nodes, diagonals = masks(grid, path)
+        start = index[start_node]
+        points = grid.points
+        return {points[end] for end in Position(grid.size, nodes, diagonals, start, start).valid_end_nodes(start)}
+
+
+def masks(grid: Grid, path: Path) -> tuple[int, int]:
+    """
+    :return: the masks of the nodes and the diagonals of the path, as a Position has them
+    """
+    index = grid.index
+    lines = grid.lines
+    nodes = diagonals = 0
+    previous = None
+    for node in path.nodes:
+        node = index[node]
+        nodes |= 1 << node
+        if previous is not None:
+            diagonals |= lines[previous, node][1]  # the path nodes are one step apart
+        previous = node
+    return nodes, diagonals
+
+
+ENGINES = {engine.name: engine for engine in (ReferenceEngine, BitmaskEngine)}
+
+
+class Shadow(Engine):
+    """
+    answers with an engine, and checks a sample of its answers against the reference engine in a background thread
+    """
+
+    def __init__(self, engine: Engine, sample_rate=0.01, reference: Engine = None, backlog=1000, keep=20):
+        """
+        :param backlog: the most answers waiting to be checked, beyond which samples are dropped
+        :param keep: the number of the latest mismatches kept to look at
+        """
+        self.engine = engine
+        self.reference = reference or ReferenceEngine()
+        self.name = f'{engine.name} (shadowed by {self.reference.name})'
+        self.sample_rate = sample_rate
+        self.calls = 0
+        self.checked = 0
+        self.dropped = 0
+        self.seconds = 0.0  # by the engine, on the answers checked
+        self.reference_seconds = 0.0
+        self.mismatches: deque[dict] = deque(maxlen=keep)
+        self.mismatched = 0
+        self._queue = queue.Queue(maxsize=backlog)
+        self._worker: Union[threading.Thread, None] = None
+        self._lock = threading.Lock()
+
+    def valid_end_nodes(self, grid, path, start_node):
+        self.calls += 1  # only ever approximate under threads, like the other counters that aren't under the lock
+        if not (self.sample_rate and random.random() < self.sample_rate):
+            return self.engine.valid_end_nodes(grid, path, start_node)
+        started = time.perf_counter()
+        nodes = self.engine.valid_end_nodes(grid, path, start_node)
+        seconds = time.perf_counter() - started
+        try:
+            # the path's node list is replaced, never changed, when the path is extended, so it can be shared
+            self._queue.put_nowait((grid, path.nodes, start_node, frozenset(nodes), seconds))
+        except queue.Full:
+            self.dropped += 1
+        else:
+            self._start()
+        return nodes
+
+    def _start(self):
+        if self._worker is None:
+            with self._lock:
+                if self._worker is None:
+                    self._worker = threading.Thread(target=self._check, name='rules-shadow', daemon=True)
+                    self._worker.start()
+
+    def _check(self):
+        while True:
+            grid, nodes, start_node, answer, seconds = self._queue.get()
+            started = time.perf_counter()
+            expected = self.reference.valid_end_nodes(grid, Path(nodes), start_node)
+            reference_seconds = time.perf_counter() - started
+            with self._lock:
+                self.checked += 1
+                self.seconds += seconds
+                self.reference_seconds += reference_seconds
+                if answer != expected:
+                    self.mismatched += 1
+                    self.mismatches.append({
+                        'size': grid.size,
+                        'path': [str(node) for node in nodes],
+                        'start': str(start_node),
+                        'missing': sorted(map(str, expected - answer)),
+                        'extra': sorted(map(str, answer - expected)),
+                    })
+            self._queue.task_done()
+
+    def join(self):
+        """
+        waits until every sampled answer has been checked
+        """
+        self._queue.join()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'engine': self.engine.name,
+                'reference': self.reference.name,
+                'sample_rate': self.sample_rate,
+                'calls': self.calls,
+                'checked': self.checked,
+                'dropped': self.dropped,
+                'mismatched': self.mismatched,
+                'mismatches': list(self.mismatches),
+                'seconds_per_check': self.seconds / self.checked if self.checked else None,
+                'reference_seconds_per_check': self.reference_seconds / self.checked if self.checked else None,
+                'speedup': self.reference_seconds / self.seconds if self.seconds else None,
+            }
+
+
+class Cached(Engine):
+    """
+    answers from a bounded, least recently used cache of positions shared by every game, asking the engine on a miss
+
+    A position is keyed as Position.key has it: the grid size, the masks of the path's nodes and diagonals, and its
+    ends in either order. The path's nodes alone are not enough, since paths through the same nodes may occupy
+    different diagonals. Each position keeps the valid end nodes of the start nodes that have been asked about,
+    which for a position with a path are its two ends, so whether the game is over is known from the cache too.
+    """
+
+    def __init__(self, engine: Engine, capacity=10_000):
+        """
+        :param capacity: the most positions kept, beyond which the least recently used is evicted
+        """
+        self.engine = engine
+        self.name = f'{engine.name} (cached)'
+        self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._positions: OrderedDict[tuple, dict[Point, frozenset[Point]]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._last = (None, None)  # the node list of the last path keyed, and its key
+
+    def key(self, grid: Grid, path: Path) -> tuple[int, int, int, int, int]:
+        nodes = path.nodes
+        last_nodes, key = self._last
+        if last_nodes is nodes:  # the game asks about both ends of a path in turn, and the list is never changed
+            return key
+        if not nodes:
+            key = grid.size, 0, 0, -1, -1
+        else:
+            index = grid.index
+            start, end = index[path._start], index[path._end]
+            key = (grid.size, *masks(grid, path), min(start, end), max(start, end))
+        self._last = nodes, key
+        return key
+
+    def valid_end_nodes(self, grid, path, start_node):
+        if start_node not in grid.index:
+            return self.engine.valid_end_nodes(grid, path, start_node)  # off the grid, not worth keeping
+        key = self.key(grid, path)
+        with self._lock:
+            ends = self._positions.get(key)
+            if ends is not None:
+                self._positions.move_to_end(key)
+                nodes = ends.get(start_node)
+                if nodes is not None:
+                    self.hits += 1
+                    return nodes
+            self.misses += 1
+
+        nodes = frozenset(self.engine.valid_end_nodes(grid, path, start_node))  # shared, so it must not change
+        with self._lock:
+            ends = self._positions.get(key)
+            if ends is None:
+                ends = self._positions[key] = {}
+                while len(self._positions) > self.capacity:
+                    self._positions.popitem(last=False)
+                    self.evictions += 1
+            ends[start_node] = nodes
+        return nodes
+
+    def clear(self):
+        with self._lock:
+            self._positions.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def __len__(self):
+        return len(self._positions)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            cache = {
+                'positions': len(self._positions),
+                'capacity': self.capacity,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else None,
+            }
+        return {**self.engine.stats(), 'cache': cache}
+
+
+def from_environment() -> Engine:
+    """
+    :return: the engine named by RULES_ENGINE (the reference engine by default),
+    shadowed by the reference engine if RULES_SHADOW_RATE is more than 0,
+    behind a cache of POSITION_CACHE positions (10,000 by default) unless that is 0
+    """
+    engine = ENGINES[os.environ.get('RULES_ENGINE', ReferenceEngine.name)]()
+    sample_rate = float(os.environ.get('RULES_SHADOW_RATE', 0))
+    if sample_rate > 0 and not isinstance(engine, ReferenceEngine):
+        engine = Shadow(engine, sample_rate)  # only the answers that miss the cache are checked
+    capacity = int(os.environ.get('POSITION_CACHE', 10_000))
+    return Cached(engine, capacity) if capacity > 0 else engine
@@ -0,0 +1,129 @@
+import asyncio
+import json
+from typing import AsyncIterator, Union
+
+from fastapi.encoders import jsonable_encoder
+
+
+class Subscriber:
+    """
+    A spectator of a game, fed server-sent event frames through a bounded queue
+    """
+
+    def __init__(self, maxsize: int):
+        self.queue: asyncio.Queue[Union[bytes, None]] = asyncio.Queue(maxsize)
+
+    def put(self, frame: bytes) -> bool:
+        """
+        :return: False if the spectator has fallen too far behind to take the frame
+        """
+        try:
+            self.queue.put_nowait(frame)
+            return True
+        except asyncio.QueueFull:
+            return False
+
+    def close(self):
+        """
+        makes room for the end of stream marker (None), discarding the oldest frame if necessary
+        """
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(None)
+
+
+class Channel:
+    """
+    Fans the updates of a single game out to all of its spectators
+
+    Each update is serialised once and the same frame is queued for every subscriber.
+    A subscriber whose queue is full is dropped rather than allowed to hold up the rest.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.subscribers: set[Subscriber] = set()
+        self.dropped = 0
+        self._loop: Union[asyncio.AbstractEventLoop, None] = None
+
+    def subscribe(self) -> Subscriber:
+        self._loop = asyncio.get_running_loop()  # the loop serving the spectators, publishers may be in other threads
+        subscriber = Subscriber(self.maxsize)
+        self.subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        self.subscribers.discard(subscriber)
+
+    def publish(self, frame: bytes):
+        """
+        thread safe, the frame is handed to the event loop to be fanned out
+        """
+        if self.subscribers and self._loop is not None:
+            self._loop.call_soon_threadsafe(self._fan_out, frame)
+
+    def _fan_out(self, frame: bytes):
+        for subscriber in list(self.subscribers):  # copy, since slow subscribers are dropped as we go
+            if not subscriber.put(frame):
+                self.unsubscribe(subscriber)
+                subscriber.close()
+                self.dropped += 1
+
+
+class Channels:
+    """
+    The spectator channels of all games, keyed by session id
+    """
+
+    def __init__(self, maxsize=64, keep_alive=15.0):
+        """
+        :param maxsize: the number of frames a spectator may fall behind before it is dropped
+        :param keep_alive: seconds between comment frames sent to idle streams so dead connections are detected
+        """
+        self.maxsize = maxsize
+        self.keep_alive = keep_alive
+        self._channels: dict[str, Channel] = {}
+
+    def __len__(self) -> int:
+        return sum(len(channel.subscribers) for channel in self._channels.values())
+
+    def publish(self, session: str, event: str, data):
+        """
+        serialises the data once as a server-sent event frame and fans it out to the session's spectators
+        nothing is serialised if nobody is watching
+        """
+        channel = self._channels.get(session)
+        if channel is None or not channel.subscribers:
+            return
+        channel.publish(encode(event, data))
+
+    async def stream(self, session: str) -> AsyncIterator[bytes]:
+        """
+        yields the frames published to the session until the spectator disconnects or is dropped
+        """
+        channel = self._channels.get(session)
+        if channel is None:
+            channel = self._channels[session] = Channel(self.maxsize)
+        subscriber = channel.subscribe()
+        try:
+            yield b': connected\n\n'
+            while True:
+                try:
+                    frame = await asyncio.wait_for(subscriber.queue.get(), self.keep_alive)
+                except asyncio.TimeoutError:
+                    frame = b': keep-alive\n\n'
+                if frame is None:  # dropped for being too slow
+                    return
+                yield frame
+        finally:
+            channel.unsubscribe(subscriber)
+            if not channel.subscribers and self._channels.get(session) is channel:
+                del self._channels[session]
+
+
+def encode(event: str, data) -> bytes:
+    """
+    :return: a server-sent event frame (see https://html.spec.whatwg.org/multipage/server-sent-events.html)
+    """
+    data = json.dumps(jsonable_encoder(data), separators=(',', ':'))
+    return f'event: {event}\ndata: {data}\n\n'.encode()
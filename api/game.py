@@ -1,6 +1,31 @@
-from api.errors import InvalidStartNode, InvalidEndNode, UnknownState, InvalidLine
+import itertools
+import struct
+from typing import NamedTuple, Union
+
+from api.engines import Engine, ReferenceEngine
+from api.errors import InvalidStartNode, InvalidEndNode, UnknownState
 from api.models import Grid, Line, Path, Point
 
+# version, grid size, player, state, start node, end node, new line start, new line end, path length, lines played,
+# snapshot version, then the number of times each of the STATES has been entered
+HIBERNATED = struct.Struct('<BBBBBBBBHHQ7H')
+NO_NODE = 255
+
+_versions = itertools.count(1)  # snapshot versions, unique across the games of the process
+
+
+class Snapshot(NamedTuple):
+    """
+    The state of a game after an accepted move, which never changes once it has been published
+    """
+    version: int
+    size: int
+    state: str
+    player: int
+    winner: Union[int, None]
+    path: tuple[Point, ...]
+    new_line: Union[tuple[Point, Point], None]
+
 
 class Game:
 
@@ -35,10 +60,15 @@ class Game:
         'ERROR',
     )
 
-    def __init__(self, grid_size=4):
+    engine: Engine = ReferenceEngine()  # decides which lines may be played, see api/engines.py
+
+    def __init__(self, grid_size=4, engine: Union[Engine, None] = None):
         """
         resets the game
+        :param engine: the rules engine of this game, the reference engine by default
         """
+        if engine is not None:
+            self.engine = engine
         self._state = 'INITIALIZE'
         self.grid = Grid(grid_size)
         self._start_node = None
@@ -47,6 +77,10 @@ class Game:
         self.path = Path()
         self.player = 1
         self.error = None
+        self._end_nodes = (0, {})  # the valid end nodes of each start node, for a path of this many nodes
+        self.lines = bytearray()  # the start and end node index of each line played, in order
+        self.transitions = [0] * len(self.STATES)  # the number of times each state has been entered
+        self.snapshot = self._snapshot()
 
     def __call__(self, point: Point):
 
@@ -63,8 +97,11 @@ class Game:
                     self.end_node = point
                     self.new_line = Line(start=self.start_node, end=self.end_node)
                     self.path.extend(self.new_line)
+                    size = self.grid.size
+                    self.lines += bytes(node.y * size + node.x for node in (self.start_node, self.end_node))
                     self.state = 'VALID_END_NODE' if not self.game_over else 'GAME_OVER'
                     self.next_player()
+                    self.snapshot = self._snapshot()
                 except InvalidEndNode:
                     self.state = 'INVALID_END_NODE'
                     self.try_again()
@@ -73,6 +110,27 @@ class Game:
             self.state = 'ERROR'
             # raise e  # for debugging
 
+    def _snapshot(self, state: Union[str, None] = None, version: Union[int, None] = None) -> Snapshot:
+        """
+        :param state: the state of the last accepted move, if the game is no longer in it
+        :param version: the version of the snapshot, if it is being made again
+        :return: a new snapshot of the game. It is published by replacing self.snapshot, which is atomic,
+        so readers in other threads see either the last snapshot or this one, and never a move half played
+        """
+        size = self.grid.size
+        # the last line played rather than new_line, which an invalid click clears, so that a snapshot made again is
+        # the same as the one published
+        line = None if not self.lines else tuple(Point(x=node % size, y=node // size) for node in self.lines[-2:])
+        return Snapshot(
+            next(_versions) if version is None else version,
+            self.grid.size,
+            state or self.state,
+            self.player,
+            self.winner,
+            tuple(self.path.nodes),
+            line,
+        )
+
     @property
     def state(self):
         return self._state
@@ -81,6 +139,7 @@ class Game:
     def state(self, state):
         if state in self.STATES:
             self._state = state
+            self.transitions[self.STATES.index(state)] += 1
         else:
             raise UnknownState
 
@@ -92,8 +151,11 @@ class Game:
     def start_node(self, node: Point):
         # on the first turn all nodes are valid start nodes.
         # once the first path segment has been defined, subsequent segments must start on either end of the path
-        choices = self.grid.nodes if self.state == 'INITIALIZE' else self.path.extrema
-        if node in choices or node is None:
+        if node is None:  # e.g. trying again on the first turn, when the path has no extrema yet
+            self._start_node = node
+            return
+        choices = self.grid.nodes if not self.path else self.path.extrema
+        if node in choices:
             self._start_node = node
         else:
             self._start_node = None
@@ -105,8 +167,11 @@ class Game:
 
     @end_node.setter
     def end_node(self, node: Point):
+        if node is None:  # clearing the turn, there is no need to work out the choices
+            self._end_node = node
+            return
         choices = self.valid_end_nodes(self.start_node)
-        if node in choices or node is None:
+        if node in choices:
             self._end_node = node
         else:
             self._end_node = None
@@ -120,19 +185,115 @@ class Game:
          a) the end_node setter to determine if the selected point is a valid end node
          b) the game_over property to determine if the game is over, i.e. neither the start nor the end of the path has
             any valid end nodes.
+
+        The path only ever grows, so the result is remembered until the path has more nodes.
         """
+        path = self.path
+        length, cache = self._end_nodes
+        if length != len(path.nodes):
+            length, cache = self._end_nodes = (len(path.nodes), {})
+        try:
+            return cache[start_node]
+        except KeyError:
+            nodes = cache[start_node] = self._valid_end_nodes(start_node, path)
+            return nodes
+
+    def _valid_end_nodes(self, start_node: Point, path: Path) -> set[Point]:
+        return self.engine.valid_end_nodes(self.grid, path, start_node)
 
-        nodes = set()
-        for node in self.grid.nodes - set(self.path.nodes):
-            try:
-                line = Line(start=start_node, end=node)
-            except InvalidLine:
-                continue
+    def legal_nodes(self) -> int:
+        """
+        :return: a bitmask over node indices (y * size + x) of the points the next click may be without being invalid,
+        the valid start nodes or, once a start node has been selected, its valid end nodes. 0 if the game is over
+        """
+        if self.state == 'GAME_OVER':
+            return 0
+        if self.start_node is None:
+            choices = self.grid.nodes if not self.path else self.path.extrema
+        else:
+            choices = self.valid_end_nodes(self.start_node)
+        index = self.grid.index
+        return sum(1 << index[node] for node in choices)
+
+    def precompute(self):
+        """
+        computes the valid end nodes of both ends of the path, ahead of the next player's turn
+
+        This is run in the background after a line has been played. It works on a copy of the path, and only adds
+        to the end nodes remembered for that path, some of which game_over has already worked out in the request.
+        It never replaces the end nodes remembered, so it stops if they are for another path, e.g. a longer one.
+        """
+        nodes = self.path.nodes  # extending the path replaces the list, it never changes this one
+        if not nodes:
+            return
+        path = Path(nodes)
+        remembered = self._end_nodes
+        length, cache = remembered
+        if length != len(nodes):
+            return  # the path has grown since, or its end nodes were never looked at
+        for start_node in path.extrema:
+            if start_node not in cache:
+                nodes = self._valid_end_nodes(start_node, path)
+                if self._end_nodes is not remembered:
+                    return  # replaced for a longer path while this was worked out
+                cache[start_node] = nodes
+
+    def to_bytes(self) -> bytes:
+        """
+        :return: the game in a compact form: the header, the node indices of the path in order,
+        the start and end node indices of the lines played, then any error message
+        """
+        size = self.grid.size
+
+        def index(node: Union[Point, None]) -> int:
+            return NO_NODE if node is None else node.y * size + node.x
+
+        new_line = (None, None) if self.new_line is None else (self.new_line.start, self.new_line.end)
+        header = HIBERNATED.pack(
+            3,  # version
+            size,
+            self.player,
+            self.STATES.index(self.state),
+            index(self.start_node),
+            index(self.end_node),
+            *(index(node) for node in new_line),
+            len(self.path.nodes),
+            len(self.lines) // 2,
+            self.snapshot.version,
+            *(min(count, 0xFFFF) for count in self.transitions),
+        )
+        error = b'' if self.error is None else str(self.error).encode()
+        return header + bytes(index(node) for node in self.path.nodes) + self.lines + error
+
+    @classmethod
+    def from_bytes(cls, data: bytes, engine: Union[Engine, None] = None):
+        """
+        :return: the game as it was when to_bytes() was called, played with the engine
+        """
+        _, size, player, state, start_node, end_node, new_line_start, new_line_end, length, lines, version, \
+            *transitions = HIBERNATED.unpack_from(data)
 
-            if not self.path.intersects(line):
-                nodes.add(node)
+        def point(index: int) -> Union[Point, None]:
+            return None if index == NO_NODE else Point(x=index % size, y=index // size)
 
-        return nodes
+        game = cls(size, engine)
+        game._state = cls.STATES[state]
+        game.player = player
+        game._start_node = point(start_node)
+        game._end_node = point(end_node)
+        if new_line_start != NO_NODE:
+            game.new_line = Line(start=point(new_line_start), end=point(new_line_end))
+        path = data[HIBERNATED.size:HIBERNATED.size + length]
+        game.path = Path([point(index) for index in path])
+        game.lines = bytearray(data[HIBERNATED.size + length:HIBERNATED.size + length + 2 * lines])
+        game.transitions = transitions
+        error = data[HIBERNATED.size + length + 2 * lines:]
+        game.error = error.decode() if error else None
+        if not game.path:
+            game.snapshot = game._snapshot('INITIALIZE', version)
+        else:  # the game may have been hibernated half way through a turn
+            game.snapshot = game._snapshot('GAME_OVER' if game.game_over else 'VALID_END_NODE', version)
+        return game
 
     def try_again(self):
         self.new_line = self.end_node = self.start_node = None
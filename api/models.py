@@ -1,9 +1,11 @@
 import math
+import threading
 from copy import copy
 from typing import Union
 
 from pydantic.dataclasses import dataclass
 
+from api import tables as cache
 from api.errors import PathDiscontinuity, InvalidLine, InvalidPath
 from api.utils import is_octilinear, is_horizontal, is_diagonal, is_vertical
 
@@ -22,21 +24,126 @@ class Point:
         return int(round(math.atan2(delta_y, delta_x) * 180 / math.pi))
 
 
+# the eight octilinear steps, clockwise from east (y increases downwards)
+STEPS = ((1, 0), (1, 1), (0, 1), (-1, 1), (-1, 0), (-1, -1), (0, -1), (1, -1))
+
+# the symmetries of a square grid whose last row and column are n, the identity first
+SYMMETRIES = (
+    lambda x, y, n: (x, y),
+    lambda x, y, n: (n - y, x),  # rotations
+    lambda x, y, n: (n - x, n - y),
+    lambda x, y, n: (y, n - x),
+    lambda x, y, n: (n - x, y),  # reflections
+    lambda x, y, n: (x, n - y),
+    lambda x, y, n: (y, x),
+    lambda x, y, n: (n - y, n - x),
+)
+
+
 class Grid:
     """
     A Cartesian Grid starting at a specified point
+
+    A grid of a given size never changes, so there is one Grid per size, shared read only by every Game and Position.
+    Grid(size) returns it from a bounded registry, building it and its lookup tables on first use.
+
+    Nodes are referred to by index (y * size + x) in the tables, and sets of nodes by bitmasks of those indices.
+    Each diagonal step of a line occupies one of the two diagonals of a unit square,
+    and a line may not cross a diagonal of the path, so both diagonals of every square have a bit too.
     """
-    def __init__(self, size=4):
+
+    registry_size = 8  # grid sizes kept at once, the first built is dropped to make room
+    _registry: dict[int, 'Grid'] = {}
+    _lock = threading.Lock()
+
+    def __new__(cls, size=4):
+        grid = cls._registry.get(size)  # no lock, this is on every Game's and Position's path
+        if grid is not None:
+            return grid
+        grid = super().__new__(cls)
+        grid._build(size)
+        with cls._lock:
+            grid = cls._registry.setdefault(size, grid)  # another thread may have built it first
+            while len(cls._registry) > cls.registry_size:
+                del cls._registry[next(iter(cls._registry))]
+        return grid
+
+    def __getnewargs__(self):
+        return self.size,  # unpickled grids are the shared grid of their size
+
+    def __getstate__(self):
+        return None
+
+    def _build(self, size: int):
         self.size = size
-        self.nodes = {Point(x=i, y=j) for i in range(size) for j in range(size)}
+        self.points = tuple(Point(x=i % size, y=i // size) for i in range(size * size))
+        self.nodes = frozenset(self.points)
         # creates a set of x,y Points in a 4 x 4 grid
         # adapted from Paddy3118 in https://stackoverflow.com/questions/5450067/python-2d-array-access-with-points-x-y
+        self.index = {point: i for i, point in enumerate(self.points)}
+
+        tables = cache.load(size)  # see api/tables.py
+        if tables is None:
+            tables = self._tables()
+            cache.save(size, tables)
+
+        # rays[i] lists the lines that start at node i, one tuple per direction, shortest line first.
+        # each line is (end, nodes, diagonals, crossings) where the masks accumulate along the ray:
+        #   nodes: the nodes of the line other than its start
+        #   diagonals: the diagonals the line occupies
+        #   crossings: the diagonals the line would cross
+        self.rays = tables['rays']
+        self.lines = {
+            (start, line[0]): line[1:] for start, rays in enumerate(self.rays) for ray in rays for line in ray
+        }
+        # neighbours[i] is the mask of the nodes one step from node i
+        self.neighbours = tables['neighbours']
+        self._octilinear = {
+            self.points[start]: frozenset(self.points[line[0]] for ray in rays for line in ray)
+            for start, rays in enumerate(self.rays)
+        }
+
+        # symmetries[s] maps node indices, and masks of nodes and diagonals, to their images under SYMMETRIES[s]
+        self.symmetries = tables['symmetries']
+        self.inverses = tables['inverses']
+        self._node_bytes = tables['node_bytes']
+        self._diagonal_bytes = tables['diagonal_bytes']
+
+    def _tables(self) -> dict[str, tuple]:
+        """
+        :return: the lookup tables of the grid, which are only numbers, so they can be cached on disk
+        """
+        size = self.size
+        rays = tuple(
+            tuple(ray for ray in (self._ray(i, step) for step in STEPS) if ray)
+            for i in range(size * size)
+        )
+        n = size - 1
+        symmetries = tuple(
+            tuple(self.index[Point(x=x, y=y)] for x, y in (symmetry(p.x, p.y, n) for p in self.points))
+            for symmetry in SYMMETRIES
+        )
+        return {
+            'rays': rays,
+            'neighbours': tuple(sum(1 << ray[0][0] for ray in node_rays) for node_rays in rays),
+            'symmetries': symmetries,
+            'inverses': tuple(tuple(sorted(range(size * size), key=lambda i: nodes[i])) for nodes in symmetries),
+            'node_bytes': tuple(_byte_tables(nodes) for nodes in symmetries),
+            'diagonal_bytes': tuple(
+                _byte_tables(tuple(self._diagonal_image(bit, symmetry) for bit in range(2 * n * n)))
+                for symmetry in SYMMETRIES
+            ),
+        }
 
     def nodes_octilinear_to(self, point: Point) -> set[Point, ...]:
         '''
         determines which nodes in the grid would form an octilinear line with the given point
         :return nodes: the set of nodes
         '''
+        try:
+            return self._octilinear[point]  # precomputed for the nodes of the grid
+        except KeyError:
+            pass
 
         nodes = set()  # container for the node
 
@@ -51,6 +158,65 @@ class Grid:
 
         return nodes.intersection(self.nodes)  # remove nodes beyond the Grid
 
+    def transform(self, symmetry: int, nodes: int, diagonals: int) -> tuple[int, int]:
+        """
+        :return: the images of the masks of nodes and diagonals under the symmetry
+        """
+        return _apply(self._node_bytes[symmetry], nodes), _apply(self._diagonal_bytes[symmetry], diagonals)
+
+    def _diagonal(self, x: int, y: int, dx: int, dy: int) -> tuple[int, int]:
+        """
+        :return: the bit of the diagonal occupied by the step, and the bit of the diagonal that would cross it
+        """
+        square = 2 * (min(y, y + dy) * (self.size - 1) + min(x, x + dx))
+        sense = 0 if dx == dy else 1  # '\' or '/'
+        return 1 << (square + sense), 1 << (square + 1 - sense)
+
+    def _diagonal_image(self, bit: int, symmetry) -> int:
+        square, sense = divmod(bit, 2)
+        y, x = divmod(square, self.size - 1)
+        ends = ((x, y), (x + 1, y + 1)) if sense == 0 else ((x + 1, y), (x, y + 1))
+        (x, y), (x2, y2) = (symmetry(x, y, self.size - 1) for x, y in ends)
+        diagonal, _ = self._diagonal(x, y, x2 - x, y2 - y)
+        return diagonal.bit_length() - 1
+
+    def _ray(self, start: int, step: tuple[int, int]) -> tuple[tuple[int, int, int, int], ...]:
+        dx, dy = step
+        x, y = start % self.size, start // self.size
+        nodes = diagonals = crossings = 0
+        ray = []
+        while 0 <= x + dx < self.size and 0 <= y + dy < self.size:
+            if dx and dy:
+                diagonal, crossing = self._diagonal(x, y, dx, dy)
+                diagonals |= diagonal
+                crossings |= crossing
+            x, y = x + dx, y + dy
+            end = y * self.size + x
+            nodes |= 1 << end
+            ray.append((end, nodes, diagonals, crossings))
+        return tuple(ray)
+
+
+def _byte_tables(permutation: tuple[int, ...]) -> tuple[tuple[int, ...], ...]:
+    """
+    :return: for each byte of a mask, the image of every value of that byte under the permutation of its bits
+    """
+    return tuple(
+        tuple(
+            sum(1 << image for bit, image in enumerate(permutation[offset:offset + 8]) if value >> bit & 1)
+            for value in range(256)
+        )
+        for offset in range(0, len(permutation), 8)
+    )
+
+
+def _apply(tables: tuple[tuple[int, ...], ...], mask: int) -> int:
+    image = 0
+    for table in tables:
+        image |= table[mask & 255]
+        mask >>= 8
+    return image
+
 
 class Path:
     """
@@ -170,7 +336,7 @@ class Path:
             if not is_diagonal(a.direction) or not is_diagonal(b.direction):
                 return False
 
-            if abs(a.direction - b.direction) != 90:
+            if abs(a.direction - b.direction) % 180 != 90:  # perpendicular, in either sense
                 return False
 
             if a._start.y == b._start.y:
@@ -0,0 +1,188 @@
+import random
+import time
+from typing import Union
+
+from api.book import opening_book
+from api.position import Position
+from api.regions import BUDGET, solve
+
+
+class Timeout(Exception):
+    pass
+
+
+class Player:
+    """
+    A computer player
+
+    Players choose a move, i.e. the (start, end) node indices of a line, for the player to move in a Position.
+    A move must be returned before the deadline (a time.perf_counter() value) if one is given.
+    Opening moves are taken from the opening book when it has them.
+    """
+
+    name = None
+    book = True
+
+    def __init__(self, seed=None):
+        self.random = random.Random(seed)
+
+    def __str__(self):
+        return self.name
+
+    def move(self, position: Position, deadline: Union[float, None] = None) -> tuple[int, int]:
+        move = opening_book.lookup(position) if self.book else None
+        return move if move is not None else self.choose(position, deadline)
+
+    def choose(self, position: Position, deadline: Union[float, None] = None) -> tuple[int, int]:
+        raise NotImplementedError
+
+
+class RandomPlayer(Player):
+    """
+    plays any valid line
+    """
+
+    name = 'random'
+    book = False  # the baseline for the other players
+
+    def choose(self, position, deadline=None):
+        return self.random.choice(position.moves())
+
+
+class GreedyPlayer(Player):
+    """
+    looks two lines ahead: never draws the last line if it can help it,
+    forces the opponent to draw the last line if it can, and otherwise avoids being forced
+    """
+
+    name = 'greedy'
+
+    def choose(self, position, deadline=None):
+        moves = position.moves()
+        self.random.shuffle(moves)
+        safe = []
+        ongoing = []
+        for move in moves:
+            child = position.play(*move)
+            replies = child.moves()
+            if not replies:
+                continue  # the last line loses
+            ongoing.append(move)
+            if self.forced(child):
+                return move  # every reply is the last line
+            if not any(self.forced(child.play(*reply)) for reply in replies):
+                safe.append(move)
+        return (safe or ongoing or moves)[0]
+
+    @staticmethod
+    def forced(position: Position) -> Union[bool, None]:
+        """
+        :return: None if the game is over, True if every line the player to move may play is the last
+        """
+        moves = position.moves()
+        if not moves:
+            return None
+        return all(not position.play(*move).moves() for move in moves)
+
+
+class SearchPlayer(Player):
+    """
+    searches for a forced win, deepening one line at a time until the deadline or the depth limit
+
+    Every position is won or lost for the player to move, so values are +1 (won), -1 (lost)
+    or 0 (not yet known at the searched depth). Known values are remembered across moves.
+    The player who draws the last line loses, so a player with no valid lines has won.
+    Once the path ends can no longer reach each other's free nodes the position is solved exactly, see api/regions.py,
+    until a position can't be solved within the budget, after which the rest of the move is searched as usual.
+    """
+
+    name = 'search'
+
+    def __init__(self, seed=None, depth=64, budget=BUDGET):
+        super().__init__(seed)
+        self.depth = depth
+        self.budget = budget  # the most pairs of states a split position is solved over, 0 to never solve them
+        self.solved: dict[tuple, int] = {}  # position key: value for the player to move
+        self.splits: dict[tuple, bool] = {}  # position key: whether it has split, for the positions searched again
+        self.exhausted = False  # a split position could not be solved within the budget, during this move
+        self.deadline = None
+        self.visits = 0
+
+    def choose(self, position, deadline=None):
+        self.deadline = deadline
+        self.exhausted = False
+        moves = self.children(position)
+        self.random.shuffle(moves)
+        best = moves[0][0]
+        try:
+            for depth in range(1, self.depth + 1):
+                values = [(-self.negamax(child, depth - 1), move) for move, child in moves]
+                winning = [move for value, move in values if value == 1]
+                if winning:
+                    return winning[0]
+                unknown = [move for value, move in values if value == 0]
+                if not unknown:
+                    return best  # lost whatever we play
+                best = unknown[0]
+                moves = [(move, child) for move, child in moves if move in unknown]  # don't search the losses again
+        except Timeout:
+            pass
+        return best
+
+    @staticmethod
+    def children(position: Position) -> list[tuple[tuple[int, int], Position]]:
+        """
+        :return: the moves that lead to distinct positions, e.g. either direction of the first line
+        """
+        children = {}
+        for move in position.moves():
+            child = position.play(*move)
+            children.setdefault(child.key, (move, child))
+        return list(children.values())
+
+    def negamax(self, position: Position, depth: int, split=False) -> int:
+        """
+        :param split: True if the position is known to have split, as every position after a split position has
+        """
+        key = position.key
+        value = self.solved.get(key)
+        if value is not None:
+            return value
+
+        self.visits += 1
+        if self.deadline is not None and not self.visits % 256 and time.perf_counter() > self.deadline:
+            raise Timeout
+
+        won = None
+        if self.budget and not self.exhausted:
+            if not split:
+                split = self.splits.get(key)
+                if split is None:
+                    split = self.splits[key] = position.split
+            if split:
+                won = solve(position, self.budget, self.solved, self.deadline, split=True)  # the game over too
+                self.exhausted = won is None
+        if won is not None:
+            value = 1 if won else -1
+        else:
+            moves = position.moves()
+            if not moves:
+                value = 1  # the opponent drew the last line
+            elif depth == 0:
+                return 0
+            else:
+                value = -1
+                for move in moves:
+                    child = -self.negamax(position.play(*move), depth - 1, split)
+                    if child == 1:
+                        value = 1
+                        break
+                    value = max(value, child)
+                if value == 0:
+                    return 0  # only known to this depth
+
+        self.solved[key] = value
+        return value
+
+
+PLAYERS = {player.name: player for player in (RandomPlayer, GreedyPlayer, SearchPlayer)}
@@ -0,0 +1,176 @@
+from typing import Union
+
+from api.models import SYMMETRIES, Grid, Path, Point
+
+
+class Position:
+    """
+    An immutable game position: the nodes and diagonals of the path, and the path ends
+
+    This is the same state the Game keeps in its Path, reduced to a few integers.
+    It is hashable so that computer players can remember the positions they have searched.
+    """
+
+    __slots__ = ('size', 'nodes', 'diagonals', 'start', 'end')
+
+    def __init__(self, size=4, nodes=0, diagonals=0, start: Union[int, None] = None, end: Union[int, None] = None):
+        self.size = size
+        self.nodes = nodes
+        self.diagonals = diagonals
+        self.start = start  # the node index of path._start
+        self.end = end  # the node index of path._end
+
+    @classmethod
+    def from_path(cls, path: Path, size=4):
+        position = cls(size)
+        for start, end in zip(path.nodes, path.nodes[1:]):
+            position = position.play(position.grid.index[start], position.grid.index[end])
+        return position
+
+    def __repr__(self):
+        return f'Position(size={self.size}, path={[str(point) for point in self.path]})'
+
+    def __eq__(self, other):
+        return isinstance(other, Position) and self.key == other.key
+
+    def __hash__(self):
+        return hash(self.key)
+
+    def __bool__(self):
+        """
+        :return: True if a line has been played, like a Path
+        """
+        return self.start is not None
+
+    @property
+    def key(self) -> tuple[int, int, int, int, int]:
+        """
+        the path ends are unordered, since either end may be extended
+        """
+        if self.start is None:
+            return self.size, 0, 0, -1, -1
+        return self.size, self.nodes, self.diagonals, min(self.start, self.end), max(self.start, self.end)
+
+    def transform(self, symmetry: int) -> 'Position':
+        """
+        :return: the image of this position under one of the SYMMETRIES
+        """
+        if self.start is None:
+            return self
+        grid = self.grid
+        nodes, diagonals = grid.transform(symmetry, self.nodes, self.diagonals)
+        image = grid.symmetries[symmetry]
+        return Position(self.size, nodes, diagonals, image[self.start], image[self.end])
+
+    @property
+    def canonical(self) -> tuple[int, 'Position']:
+        """
+        :return: the symmetry that maps this position to the least of its images, and that image
+        symmetrical positions have the same canonical image
+        """
+        images = ((symmetry, self.transform(symmetry)) for symmetry in range(len(SYMMETRIES)))
+        return min(images, key=lambda image: image[1].key)
+
+    @property
+    def grid(self) -> Grid:
+        return Grid(self.size)
+
+    @property
+    def path(self) -> list[Point]:
+        """
+        :return: the path nodes, in no particular order
+        """
+        return [point for i, point in enumerate(self.grid.points) if self.nodes >> i & 1]
+
+    @property
+    def valid_start_nodes(self) -> tuple[int, ...]:
+        if self.start is None:
+            return tuple(range(self.size * self.size))
+        return self.start, self.end
+
+    def valid_end_nodes(self, start: int) -> list[int]:
+        """
+        :return: the indices of the nodes that would end a line from the start node without intersecting the path
+        """
+        ends = []
+        for ray in self.grid.rays[start]:
+            for end, nodes, diagonals, crossings in ray:
+                if self.nodes & nodes or self.diagonals & crossings:
+                    break  # any longer line in this direction would also intersect the path
+                ends.append(end)
+        return ends
+
+    def is_valid(self, start: int, end: int) -> bool:
+        """
+        :return: True if the line from start to end may be played, without generating all the valid end nodes
+        """
+        try:
+            nodes, _, crossings = self.grid.lines[start, end]
+        except KeyError:  # not an octilinear line of the grid
+            return False
+        if self.start is not None and start != self.start and start != self.end:
+            return False
+        return not (self.nodes & nodes or self.diagonals & crossings)
+
+    def moves(self) -> list[tuple[int, int]]:
+        """
+        :return: the (start, end) node indices of all the lines the player to move may play
+        """
+        return [(start, end) for start in self.valid_start_nodes for end in self.valid_end_nodes(start)]
+
+    def play(self, start: int, end: int) -> 'Position':
+        """
+        :return: the position after the line has been played. The line is assumed to be valid
+        """
+        nodes, diagonals, _ = self.grid.lines[start, end]
+        if self.start is None:
+            return Position(self.size, nodes | 1 << start, diagonals, start, end)
+        if start == self.end:  # the same preference as Path.extend
+            return Position(self.size, self.nodes | nodes, self.diagonals | diagonals, self.start, end)
+        return Position(self.size, self.nodes | nodes, self.diagonals | diagonals, end, self.end)
+
+    def region(self, end: int, until=0) -> int:
+        """
+        :param until: a mask of nodes at which to stop as soon as one is reached
+        :return: the mask of the free nodes that lines from the path end could ever reach
+
+        This is a flood fill from the end over steps to free nodes that do not cross a diagonal of the path.
+        Lines only ever extend the path from its ends through free nodes, one such step at a time.
+        """
+        rays = self.grid.rays
+        blocked = self.nodes
+        region = 0
+        frontier = [end]
+        while frontier:
+            node = frontier.pop()
+            for ray in rays[node]:
+                step, nodes, _, crossings = ray[0]
+                if not (blocked & nodes or self.diagonals & crossings):
+                    blocked |= nodes
+                    region |= nodes
+                    if nodes & until:
+                        return region
+                    frontier.append(step)
+        return region
+
+    @property
+    def split(self) -> bool:
+        """
+        True if the path ends can reach no free node in common, so that the lines played from one end can never
+        affect the lines that may be played from the other: the game has split into two independent games.
+        (A diagonal from one end can't cross a diagonal from the other, since the free corners of the square would be
+        in both regions.)
+        """
+        if self.start is None:
+            return False
+        region = self.region(self.start)
+        return not region or not self.region(self.end, until=region) & region
+
+    @property
+    def game_over(self) -> bool:
+        """
+        The game is over if neither end of the path has any valid end nodes.
+        The player to move has won, since the other player drew the last line (see Game.winner).
+        """
+        return self.start is not None \
+            and not self.valid_end_nodes(self.start) and not self.valid_end_nodes(self.end)
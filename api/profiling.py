@@ -0,0 +1,165 @@
+"""
+Opt-in profiling of individual requests
+
+When profiling is enabled (PROFILE=1) a request is profiled if it has an X-Profile header, or at random at the
+sample rate (PROFILE_SAMPLE_RATE, 0 to 1). The game engine and response work of the request is run under cProfile,
+and if asked for (X-Profile: memory, or PROFILE_MEMORY=1) under tracemalloc too. Profiles are written to a directory
+(PROFILE_DIRECTORY) which keeps only the most recent captures (PROFILE_KEEP), e.g.
+
+    PROFILE=1 python -m api
+    curl -H 'X-Profile: 1' -X POST localhost:8000/node-clicked -d '{"x": 0, "y": 0}'
+    python -m pstats profiles/<capture>.prof
+
+When profiling is disabled the middleware is not installed and capture() costs a context variable lookup.
+"""
+import cProfile
+import itertools
+import os
+import random
+import re
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Union
+
+
+class Capture:
+    """
+    The profile of one request
+    """
+
+    def __init__(self, name: str, memory: bool):
+        self.name = name
+        self.memory = memory
+        self.profile = cProfile.Profile()
+        self.snapshots: list[tracemalloc.Snapshot] = []
+
+
+_capture: ContextVar[Union[Capture, None]] = ContextVar('capture', default=None)
+_tracing = threading.Lock()  # tracemalloc is process wide, so only one request traces memory at a time
+
+
+def capture():
+    """
+    :return: a context manager that profiles the work inside it if the current request is being profiled
+    """
+    current = _capture.get()
+    return nullcontext() if current is None else _profile(current)
+
+
+@contextmanager
+def _profile(current: Capture):
+    tracing = current.memory and _tracing.acquire(blocking=False)
+    if tracing:
+        tracemalloc.start()
+        current.snapshots.append(tracemalloc.take_snapshot())
+    current.profile.enable()
+    try:
+        yield
+    finally:
+        current.profile.disable()
+        if tracing:
+            current.snapshots.append(tracemalloc.take_snapshot())
+            tracemalloc.stop()
+            _tracing.release()
+
+
+class Profiler:
+    """
+    Decides which requests to profile, and keeps their profiles in a rotating directory
+    """
+
+    header = b'x-profile'
+
+    def __init__(self, directory: Union[str, Path] = 'profiles', sample_rate=0.0, memory=False, keep=100):
+        self.directory = Path(directory)
+        self.sample_rate = sample_rate
+        self.memory = memory
+        self.keep = keep
+        self._sequence = itertools.count()
+
+    @classmethod
+    def from_environment(cls) -> Union['Profiler', None]:
+        """
+        :return: a profiler configured by the environment, or None if profiling is not enabled
+        """
+        if os.environ.get('PROFILE', '0') in ('', '0'):
+            return None
+        return cls(
+            directory=os.environ.get('PROFILE_DIRECTORY', 'profiles'),
+            sample_rate=float(os.environ.get('PROFILE_SAMPLE_RATE', 0)),
+            memory=os.environ.get('PROFILE_MEMORY', '0') not in ('', '0'),
+            keep=int(os.environ.get('PROFILE_KEEP', 100)),
+        )
+
+    def wanted(self, scope) -> Union[Capture, None]:
+        """
+        :return: a Capture if the request should be profiled
+        """
+        header = dict(scope['headers']).get(self.header)
+        if header is None and not (self.sample_rate and random.random() < self.sample_rate):
+            return None
+        slug = re.sub(r'[^a-z0-9]+', '-', scope['path'].lower()).strip('-') or 'root'
+        name = f'{time.strftime("%Y%m%d-%H%M%S")}-{next(self._sequence):06d}-{scope["method"]}-{slug}'
+        return Capture(name, self.memory or header == b'memory')
+
+    def save(self, current: Capture):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        current.profile.dump_stats(self.directory / f'{current.name}.prof')
+        if len(current.snapshots) == 2:
+            before, after = current.snapshots
+            stats = after.compare_to(before, 'lineno')
+            with open(self.directory / f'{current.name}.memory.txt', 'w') as file:
+                file.writelines(f'{stat}\n' for stat in stats[:50])
+        for stale in self.captures()[self.keep:]:
+            for path in self.directory.glob(f'{stale["name"]}.*'):
+                path.unlink(missing_ok=True)
+
+    def captures(self) -> list[dict]:
+        """
+        :return: the saved captures, most recent first
+        """
+        if not self.directory.exists():
+            return []
+        profiles = sorted(self.directory.glob('*.prof'), key=lambda path: path.stat().st_mtime, reverse=True)
+        return [
+            {
+                'name': path.stem,
+                'profile': str(path),
+                'memory': str(path.with_suffix('.memory.txt')) if path.with_suffix('.memory.txt').exists() else None,
+                'bytes': path.stat().st_size,
+                'created': path.stat().st_mtime,
+            }
+            for path in profiles
+        ]
+
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware that marks the requests to be profiled, saves their profiles,
+    and names the capture in an X-Profile-Capture response header
+    """
+
+    def __init__(self, app, profiler: Profiler):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        current = self.profiler.wanted(scope) if scope['type'] == 'http' else None
+        if current is None:
+            return await self.app(scope, receive, send)
+
+        async def send_with_header(message):
+            if message['type'] == 'http.response.start':
+                message['headers'] = [*message.get('headers', []), (b'x-profile-capture', current.name.encode())]
+            await send(message)
+
+        token = _capture.set(current)
+        try:
+            await self.app(scope, receive, send_with_header)
+        finally:
+            _capture.reset(token)
+            self.profiler.save(current)
@@ -0,0 +1,303 @@
+"""
+Puzzles
+
+A puzzle is a position in which the player to move can force a win in exactly N of their own moves, i.e. make the
+opponent draw the last line, and only one first move does so in N (others may win more slowly, or lose).
+
+Puzzles are found by playing random games on a grid size and solving the positions of their last lines exhaustively,
+from the end of the game backwards, until a position needs more than --budget positions solved. Every position
+solved in a batch of games is remembered, so each position of a game costs little more than its own lines. Puzzles
+are reduced by symmetry: a puzzle whose canonical position (see Position.canonical) is already in the pool is dropped.
+
+The pool is one file per grid size, e.g. puzzles/4.txt, with one puzzle per line: N, the solution and the position
+as a game record (see api/records.py), e.g.
+
+    1 d4a4 4 a1a3 a1b1 b1d3 a3c3 d3d2 c3d4
+
+Puzzles are appended after the puzzles already in the pool, so a run with another --seed adds new puzzles. Random games
+are played in batches in a process pool, and each batch only depends on its seed, and is taken in the order it was
+submitted, so the pool only depends on --seed (unless --seconds runs out). The puzzles found per second are reported.
+The API serves a puzzle of the day from the pool, see /puzzle.
+
+usage:
+    python -m api.puzzle --sizes 4 5 6 --moves 1 2 3 --count 100
+"""
+import argparse
+import datetime
+import os
+import random
+import sys
+import time
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import NamedTuple, Union
+
+from api.position import Position
+from api.records import format_record, node, notation, split
+
+PUZZLES = Path(__file__).parent / 'puzzles'
+BUDGET = 3_000  # the most positions solved for one position of a random game
+
+
+class TooHard(Exception):
+    pass
+
+
+class Puzzle(NamedTuple):
+    moves: int  # N, the moves of the player to move until the opponent must draw the last line
+    solution: tuple[int, int]  # the start and end node indices of the only first move that wins in N
+    size: int
+    lines: tuple[tuple[int, int], ...]  # the lines played to the position, in order
+
+    def __str__(self):
+        start, end = self.solution
+        solution = notation(start, self.size) + notation(end, self.size)
+        return f'{self.moves} {solution} {format_record(self.size, self.lines)}'
+
+    @classmethod
+    def parse(cls, line: str) -> 'Puzzle':
+        moves, solution, size, *lines = line.split()
+        size = int(size)
+
+        def move(text: str) -> tuple[int, int]:
+            start, end = split(text)
+            return node(start, size), node(end, size)
+
+        return cls(int(moves), move(solution), size, tuple(map(move, lines)))
+
+    @property
+    def position(self) -> Position:
+        position = Position(self.size)
+        for line in self.lines:
+            position = position.play(*line)
+        return position
+
+    @property
+    def player(self) -> int:
+        return 1 + len(self.lines) % 2  # player 1 draws the odd lines
+
+
+class Solver:
+    """
+    Solves positions exactly, by searching every line to the end of the game
+    """
+
+    def __init__(self, budget=BUDGET):
+        """
+        :param budget: the most positions solved by one call of distance(), beyond which it raises TooHard
+        """
+        self.budget = budget
+        self.known: dict[tuple, int] = {}  # position key: distance
+        self._left = budget
+
+    def distance(self, position: Position) -> int:
+        """
+        :return: the lines to the end of the game with best play, positive (or 0 if the game is over) if the player
+        to move wins, negative if they lose. The winner ends the game as soon as they can, the loser as late
+        :raises TooHard: if more than the budget of positions had to be solved
+        """
+        self._left = self.budget
+        return self._distance(position)
+
+    def _distance(self, position: Position) -> int:
+        key = position.key
+        distance = self.known.get(key)
+        if distance is not None:
+            return distance
+
+        self._left -= 1
+        if self._left < 0:
+            raise TooHard
+        win = None
+        loss = 0
+        for child in children(position).values():
+            d = self._distance(child)
+            if d < 0:  # the opponent loses
+                win = -d + 1 if win is None else min(win, -d + 1)
+            else:
+                loss = max(loss, d + 1)
+        distance = self.known[key] = win if win is not None else -loss  # 0 if the opponent drew the last line
+        return distance
+
+    def best(self, position: Position) -> tuple[int, int]:
+        """
+        :return: a move that wins soonest, or if the position is lost, loses latest
+        :raises TooHard: if the position needs more than the budget of positions solved
+        """
+        self.distance(position)
+
+        def rank(child: Position) -> tuple[bool, int]:  # wins first, then the soonest win or the latest loss
+            distance = self.known[child.key]
+            return distance >= 0, -distance
+
+        return min(children(position).items(), key=lambda item: rank(item[1]))[0]
+
+    def puzzle(self, position: Position, lines: tuple[tuple[int, int], ...]) -> Union[Puzzle, None]:
+        """
+        :return: the puzzle of the position, or None if it is lost, or more than one first move wins soonest
+        :raises TooHard: if the position needs more than the budget of positions solved
+        """
+        distance = self.distance(position)
+        if distance <= 0:
+            return None
+        soonest = [move for move, child in children(position).items() if self.known[child.key] == -(distance - 1)]
+        if len(soonest) != 1:
+            return None
+        return Puzzle(distance // 2, soonest[0], position.size, lines)
+
+
+def children(position: Position) -> dict[tuple[int, int], Position]:
+    """
+    :return: the position after each line that may be played, one line for each distinct position
+    """
+    children = {}
+    for move in position.moves():
+        child = position.play(*move)
+        children.setdefault(child.key, (move, child))
+    return dict(children.values())
+
+
+def sample(size: int, seed: int, games: int, moves: tuple[int, ...], budget=BUDGET) -> tuple[list[Puzzle], int]:
+    """
+    plays random games and solves their last positions, from the end backwards
+    :return: the puzzles of N in moves found, and the positions solved, the same for the same arguments
+    """
+    solver = Solver(budget)  # for this batch only, as a position remembered costs no budget
+    rng = random.Random(f'{size}/{seed}')
+    puzzles = []
+    solved = 0
+    for _ in range(games):
+        positions = [Position(size)]
+        lines = []
+        while True:
+            choices = positions[-1].moves()
+            if not choices:
+                break
+            lines.append(rng.choice(choices))
+            positions.append(positions[-1].play(*lines[-1]))
+        for i in range(len(positions) - 2, 0, -1):  # the last position is over, and the first has no path
+            try:
+                puzzle = solver.puzzle(positions[i], tuple(lines[:i]))
+            except TooHard:
+                break  # the earlier positions are harder still
+            solved += 1
+            if puzzle is not None and puzzle.moves in moves:
+                puzzles.append(puzzle)
+    return puzzles, solved
+
+
+def canonical(puzzle: Puzzle) -> tuple:
+    """
+    :return: the key of the least symmetrical image of the puzzle's position, the same for symmetrical puzzles
+    """
+    return puzzle.position.canonical[1].key
+
+
+def read(path: Path) -> list[Puzzle]:
+    if not path.exists():
+        return []
+    with open(path) as file:
+        return [Puzzle.parse(line) for line in file if line.strip()]
+
+
+class Puzzles:
+    """
+    The pool of puzzles of each grid size, each read on first use
+    """
+
+    def __init__(self, directory: Path = PUZZLES):
+        self.directory = directory
+        self._pools: dict[int, dict[int, list[Puzzle]]] = {}  # grid size: N: puzzles
+
+    def pool(self, size: int) -> dict[int, list[Puzzle]]:
+        try:
+            return self._pools[size]
+        except KeyError:
+            pool = {}
+            for puzzle in read(self.directory / f'{size}.txt'):
+                pool.setdefault(puzzle.moves, []).append(puzzle)
+            self._pools[size] = pool
+            return pool
+
+    def daily(self, size: int, moves: int, day: datetime.date) -> Union[Puzzle, None]:
+        """
+        :return: the puzzle of the day for the grid size and N, the same all day, or None if there are none
+        """
+        puzzles = self.pool(size).get(moves)
+        if not puzzles:
+            return None
+        return puzzles[random.Random(f'{day.isoformat()}/{size}/{moves}').randrange(len(puzzles))]
+
+
+puzzles = Puzzles()
+
+
+def generate(size: int, moves: tuple[int, ...], count: int, seconds: float, processes=None, batch=20, budget=BUDGET,
+             seed=0, directory: Path = PUZZLES, file=sys.stderr) -> Counter:
+    """
+    adds puzzles of the grid size to its pool, until it has count puzzles of each N or the time is up
+    :return: the puzzles of each N added
+    """
+    path = directory / f'{size}.txt'
+    pool = read(path)
+    seen = {canonical(puzzle) for puzzle in pool}
+    have = Counter(puzzle.moves for puzzle in pool)
+    added = Counter()
+    solved = 0
+    started = time.perf_counter()
+    directory.mkdir(parents=True, exist_ok=True)
+    with ProcessPoolExecutor(processes) as executor, open(path, 'a') as output:
+        batches = iter(range(seed, seed + 2 ** 31))
+        pending = deque(executor.submit(sample, size, next(batches), batch, moves, budget)
+                        for _ in range(2 * (processes or os.cpu_count() or 1)))  # so that no process waits for a batch
+
+        def done() -> bool:
+            return all(have[n] >= count for n in moves) or time.perf_counter() - started > seconds
+
+        while pending:
+            found, positions = pending.popleft().result()  # in order, so the puzzles added don't depend on timing
+            solved += positions
+            for puzzle in found:
+                key = canonical(puzzle)
+                if have[puzzle.moves] >= count or key in seen:
+                    continue
+                seen.add(key)
+                have[puzzle.moves] += 1
+                added[puzzle.moves] += 1
+                output.write(f'{puzzle}\n')
+            output.flush()
+            if done():
+                for future in pending:
+                    future.cancel()
+                break
+            pending.append(executor.submit(sample, size, next(batches), batch, moves, budget))
+
+    elapsed = time.perf_counter() - started
+    total = sum(added.values())
+    print(f'{size}x{size}: {total} puzzles in {elapsed:.1f} s, {total / elapsed:,.1f} puzzles per second, '
+          f'{solved / elapsed:,.0f} positions solved per second, ' + ', '.join(f'{added[n]} in {n}' for n in moves),
+          file=file)
+    return added
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m api.puzzle', description=__doc__.split('\n\n')[1])
+    parser.add_argument('--sizes', nargs='+', type=int, default=[4, 5, 6])
+    parser.add_argument('--moves', nargs='+', type=int, default=[1, 2, 3], help='N, of puzzles that win in N')
+    parser.add_argument('--count', type=int, default=100, help='puzzles of each N and grid size in the pool')
+    parser.add_argument('--seconds', type=float, default=600.0, help='the most time per grid size')
+    parser.add_argument('--budget', type=int, default=BUDGET, help='the most positions solved per position')
+    parser.add_argument('--batch', type=int, default=20, help='random games per batch')
+    parser.add_argument('--processes', type=int, default=None, help='defaults to the number of CPUs')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--directory', type=Path, default=PUZZLES)
+    args = parser.parse_args(argv)
+
+    for size in args.sizes:
+        generate(size, tuple(args.moves), args.count, args.seconds, args.processes, args.batch, args.budget,
+                 args.seed, args.directory)
+
+
+if __name__ == '__main__':
+    main()
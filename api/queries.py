@@ -0,0 +1,110 @@
+"""
+Queries over the analytics of completed games (see api/analytics.py)
+
+The file is memory mapped and each column is read as a NumPy array, so millions of games are aggregated without
+making a Python object per game. NumPy is only needed here: pip install numpy
+
+usage:
+    python -m api.queries games.columns
+"""
+import argparse
+import mmap
+from pathlib import Path
+from typing import Union
+
+import numpy as np
+
+from api.analytics import COLUMNS, STATES, blocks
+from api.game import Game
+from api.models import Grid
+
+DTYPES = {'B': '<u1', 'H': '<u2', 'I': '<u4'}
+INVALID = [Game.STATES.index('INVALID_START_NODE'), Game.STATES.index('INVALID_END_NODE')]
+CLICKS = INVALID + [Game.STATES.index(state) for state in ('VALID_START_NODE', 'VALID_END_NODE', 'GAME_OVER')]
+
+
+def load(path: Union[str, Path]) -> dict[str, np.ndarray]:
+    """
+    :return: each column of all the games in the file, transitions as one row per game,
+    and the offset of each game's first line end in nodes
+    """
+    with open(path, 'rb') as file:
+        data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) if Path(path).stat().st_size else b''
+    parts = {name: [] for name in COLUMNS}
+    for _, columns in blocks(data):
+        for name, (code, _) in COLUMNS.items():
+            parts[name].append(np.frombuffer(columns[name], dtype=DTYPES[code]))
+    table = {
+        name: np.concatenate(arrays) if arrays else np.empty(0, dtype=DTYPES[COLUMNS[name][0]])
+        for name, arrays in parts.items()
+    }
+    table['transitions'] = table['transitions'].reshape(-1, STATES)
+    table['offsets'] = np.concatenate(([0], np.cumsum(2 * table['lines'].astype(np.int64))[:-1]))
+    return table
+
+
+def game_lengths(table: dict[str, np.ndarray]) -> dict[int, tuple[int, float]]:
+    """
+    :return: the number of games and the average lines per game, by grid size
+    """
+    games = np.bincount(table['size'])
+    lines = np.bincount(table['size'], weights=table['lines'])
+    return {int(size): (int(games[size]), float(lines[size] / games[size])) for size in np.flatnonzero(games)}
+
+
+def invalid_click_rate(table: dict[str, np.ndarray]) -> float:
+    """
+    :return: the fraction of clicks that were invalid start or end nodes
+    """
+    transitions = table['transitions'].sum(axis=0, dtype=np.int64)
+    clicks = transitions[CLICKS].sum()
+    return float(transitions[INVALID].sum() / clicks) if clicks else 0.0
+
+
+def opening_win_rates(table: dict[str, np.ndarray], size: int) -> dict[tuple[int, int], tuple[int, float]]:
+    """
+    :return: the number of games and the rate at which the first player won, by opening line (start, end),
+    with symmetrical openings counted together under the least of their images
+    """
+    nodes = size * size
+    games = (table['size'] == size) & (table['lines'] > 0)
+    offsets = table['offsets'][games]
+    openings = canonical_lines(size)[table['nodes'][offsets].astype(np.int64) * nodes + table['nodes'][offsets + 1]]
+    counts = np.bincount(openings, minlength=nodes * nodes)
+    wins = np.bincount(openings, weights=table['winner'][games] == 1, minlength=nodes * nodes)
+    return {
+        divmod(int(opening), nodes): (int(counts[opening]), float(wins[opening] / counts[opening]))
+        for opening in np.flatnonzero(counts)
+    }
+
+
+def canonical_lines(size: int) -> np.ndarray:
+    """
+    :return: a lookup table from any line (start * nodes + end) to the least of its images under the SYMMETRIES,
+    in either direction, so that a column of lines is reduced by symmetry with one lookup per line
+    """
+    nodes = size * size
+    starts, ends = np.divmod(np.arange(nodes * nodes), nodes)
+    symmetries = np.array(Grid(size).symmetries)  # node index images, one row per symmetry
+    images = np.minimum(symmetries[:, starts], symmetries[:, ends]) * nodes \
+        + np.maximum(symmetries[:, starts], symmetries[:, ends])
+    return images.min(axis=0)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m api.queries', description=__doc__.split('\n\n')[1])
+    parser.add_argument('path', type=Path, nargs='?', default=Path('games.columns'))
+    args = parser.parse_args(argv)
+
+    table = load(args.path)
+    print(f'{len(table["size"])} games, {invalid_click_rate(table):.1%} of clicks invalid')
+    for size, (games, lines) in game_lengths(table).items():
+        print(f'\n{size}x{size}: {games} games, {lines:.1f} lines per game')
+        grid = Grid(size)
+        rates = sorted(opening_win_rates(table, size).items(), key=lambda item: -item[1][0])
+        for (start, end), (count, rate) in rates[:10]:
+            print(f'  {grid.points[start]} to {grid.points[end]}: {count} games, player 1 won {rate:.0%}')
+
+
+if __name__ == '__main__':
+    main()
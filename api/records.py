@@ -0,0 +1,157 @@
+"""
+Game records
+
+A game record is one line of text: the grid size followed by the lines played, each written as its start and end
+nodes in column letter, row number notation (a1 is Point(x=0, y=0), b3 is Point(x=1, y=2)), e.g. the sample game:
+
+    4 a1a3 a1b1 b1d3 a3c3 d3d2 c3d4 d4a4 d2d1 d1c1
+
+Archives of records are replayed by streaming them through a process pool in chunks. For each record the number of
+lines played, the winner (if the game was finished) and the first invalid line (if any) are written as CSV.
+
+usage:
+    python -m api.records replay games.txt --output replayed.csv
+    python -m api.records generate --games 100000 --sizes 4 5 > games.txt
+"""
+import argparse
+import csv
+import itertools
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, Iterator, NamedTuple, Union
+
+from api.position import Position
+
+COLUMNS = 'abcdefghijklmnopqrstuvwxyz'
+
+
+class Replay(NamedTuple):
+    record: int  # the line number of the record in the archive
+    size: int  # 0 if the record has no valid grid size
+    lines: int  # the valid lines played
+    winner: Union[int, None]  # 1 or 2 if the game is over
+    invalid: Union[int, None]  # the number of the first invalid line, counting from 1, 0 if the grid size is invalid
+
+
+def node(notation: str, size: int) -> int:
+    x, y = COLUMNS.index(notation[0]), int(notation[1:]) - 1
+    if not (0 <= x < size and 0 <= y < size):
+        raise ValueError(notation)
+    return y * size + x
+
+
+def notation(node: int, size: int) -> str:
+    return f'{COLUMNS[node % size]}{node // size + 1}'
+
+
+def format_record(size: int, moves: Iterable[tuple[int, int]]) -> str:
+    return ' '.join([str(size), *(notation(start, size) + notation(end, size) for start, end in moves)])
+
+
+def split(move: str) -> tuple[str, str]:
+    """
+    :return: the start and end of a line in notation, the row numbers may have more than one digit
+    """
+    for i in range(2, len(move)):
+        if move[i] in COLUMNS:
+            return move[:i], move[i:]
+    raise ValueError(move)
+
+
+def replay(number: int, record: str) -> Replay:
+    size, *moves = record.split()
+    try:
+        size = int(size)
+    except ValueError:
+        size = 0
+    if not 2 <= size <= len(COLUMNS):
+        return Replay(number, 0, 0, None, 0)
+    position = Position(size)
+    for i, move in enumerate(moves):
+        try:
+            start, end = (node(n, size) for n in split(move))
+        except ValueError:
+            return Replay(number, size, i, None, i + 1)
+        if not position.is_valid(start, end):
+            return Replay(number, size, i, None, i + 1)
+        position = position.play(start, end)
+    # player 1 draws the odd lines, and whoever drew the last line lost (see Game.winner)
+    winner = (1 + len(moves) % 2) if position.game_over else None
+    return Replay(number, size, len(moves), winner, None)
+
+
+def replay_chunk(chunk: list[tuple[int, str]]) -> list[Replay]:
+    return [replay(number, record) for number, record in chunk]
+
+
+def chunks(records: Iterable[str], size: int) -> Iterator[list[tuple[int, str]]]:
+    """
+    numbers the records, skipping blank lines and comments, and groups them for the workers
+    """
+    numbered = ((number, record) for number, record in enumerate(records, 1) if record.strip()[:1] not in ('', '#'))
+    while chunk := list(itertools.islice(numbered, size)):
+        yield chunk
+
+
+def replay_archive(records: Iterable[str], processes=None, chunk_size=2000) -> Iterator[Replay]:
+    """
+    replays an archive of records in parallel, yielding the replays in archive order as they complete
+    """
+    with ProcessPoolExecutor(processes) as pool:
+        for replays in pool.map(replay_chunk, chunks(records, chunk_size)):
+            yield from replays
+
+
+def generate(games: int, sizes: list[int], seed=0) -> Iterator[str]:
+    """
+    yields records of random games, for testing
+    """
+    rng = random.Random(seed)
+    for _ in range(games):
+        position = Position(rng.choice(sizes))
+        moves = []
+        while playable := position.moves():
+            move = rng.choice(playable)
+            moves.append(move)
+            position = position.play(*move)
+        yield format_record(position.size, moves)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m api.records', description=__doc__.split('\n\n')[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    replaying = commands.add_parser('replay', help='validate and replay an archive of records')
+    replaying.add_argument('archive', type=argparse.FileType('r'), help='- for standard input')
+    replaying.add_argument('--output', type=argparse.FileType('w'), default=sys.stdout)
+    replaying.add_argument('--processes', type=int, default=None, help='defaults to the number of CPUs')
+    replaying.add_argument('--chunk-size', type=int, default=2000, help='records per task')
+
+    generating = commands.add_parser('generate', help='write records of random games')
+    generating.add_argument('--games', type=int, default=1000)
+    generating.add_argument('--sizes', nargs='+', type=int, default=[4])
+    generating.add_argument('--seed', type=int, default=0)
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'generate':
+        for record in generate(args.games, args.sizes, args.seed):
+            print(record)
+        return
+
+    started = time.perf_counter()
+    writer = csv.writer(args.output)
+    writer.writerow(Replay._fields)
+    count = invalid = 0
+    for result in replay_archive(args.archive, args.processes, args.chunk_size):
+        writer.writerow(result)
+        count += 1
+        invalid += result.invalid is not None
+    elapsed = time.perf_counter() - started
+    print(f'{count} records, {invalid} invalid, {count / elapsed * 60:,.0f} records per minute', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
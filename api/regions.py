@@ -0,0 +1,103 @@
+"""
+Region decomposition
+
+Once the free nodes that one end of the path could ever reach are disjoint from those the other end could reach
+(see Position.split), the lines played from one end never change the lines that may be played from the other,
+and the game is the sum of two smaller games, each with a single end.
+
+Sums of games are usually solved by combining a value per game, but that does not work here: the player who draws
+the last line of the whole game loses, which is not decided by either game alone. Instead each game's states are
+numbered as they are found, with their lines generated once, and the sum is searched over pairs of state numbers,
+so a line is generated once per state of one game rather than once for every pair of states.
+"""
+import time
+from typing import Union
+
+from api.position import Position
+
+BUDGET = 200_000  # pairs of states searched in one call, beyond which the position is left to the ordinary search
+
+
+class Exhausted(Exception):
+    pass
+
+
+class Region:
+    """
+    The game played from one end of the path, the rest of the path left as it is.
+    States are numbered as they are found, the starting state 0.
+    """
+
+    def __init__(self, position: Position, end: int):
+        self.size = position.size
+        self.lines = position.grid.lines
+        self.states = [(position.nodes, position.diagonals, end)]
+        self.index = {self.states[0]: 0}
+        self._children: list[Union[tuple[int, ...], None]] = [None]
+
+    def children(self, state: int) -> tuple[int, ...]:
+        """
+        :return: the numbers of the states after each line that may be played in the state
+        """
+        children = self._children[state]
+        if children is None:
+            nodes, diagonals, start = self.states[state]
+            children = []
+            for stop in Position(self.size, nodes, diagonals, start, start).valid_end_nodes(start):
+                line_nodes, line_diagonals, _ = self.lines[start, stop]
+                child = nodes | line_nodes, diagonals | line_diagonals, stop
+                number = self.index.setdefault(child, len(self.states))
+                if number == len(self.states):
+                    self.states.append(child)
+                    self._children.append(None)
+                children.append(number)
+            children = self._children[state] = tuple(children)
+        return children
+
+
+def solve(
+        position: Position,
+        budget=BUDGET,
+        solved: Union[dict[tuple, int], None] = None,
+        deadline: Union[float, None] = None,
+        split: Union[bool, None] = None,
+) -> Union[bool, None]:
+    """
+    :param solved: values already known by position key (+1 won, -1 lost for the player to move), which is added to
+    :param deadline: a time.perf_counter() value after which to give up
+    :param split: whether the position has split, if it is already known
+    :return: True if the player to move in a split position has won, with best play,
+    or None if the position has not split or can't be solved within the budget or before the deadline
+    """
+    if not (position.split if split is None else split):
+        return None
+    solved = {} if solved is None else solved
+    size = position.size
+    a = Region(position, position.start)
+    b = Region(position, position.end)
+    searched = 0
+
+    def search(i: int, j: int) -> bool:
+        nonlocal searched
+        nodes_a, diagonals_a, end_a = a.states[i]
+        nodes_b, diagonals_b, end_b = b.states[j]
+        key = size, nodes_a | nodes_b, diagonals_a | diagonals_b, min(end_a, end_b), max(end_a, end_b)  # Position.key
+        value = solved.get(key)
+        if value is not None:
+            return value == 1
+        searched += 1
+        if searched > budget or deadline is not None and searched % 256 == 1 and time.perf_counter() > deadline:
+            raise Exhausted
+        lines_a = a.children(i)
+        lines_b = b.children(j)
+        # the opponent drew the last line, or we can play a line that leaves them lost
+        won = (not lines_a and not lines_b) \
+            or any(not search(child, j) for child in lines_a) \
+            or any(not search(i, child) for child in lines_b)
+        solved[key] = 1 if won else -1
+        return won
+
+    try:
+        return search(0, 0)
+    except Exhausted:
+        return None
@@ -0,0 +1,318 @@
+"""
+Self-play across machines
+
+A coordinator hands out batches of seeded games (tournament matches, see api/tournament.py) to workers over TCP,
+and collects their results. A worker plays its batches in a process pool, so a machine's worker uses all of its CPUs,
+and throughput grows with the workers that connect. Each worker is kept WINDOW batches ahead, so that its pool is not
+idle while results travel.
+
+A worker tells the coordinator that it is alive every HEARTBEAT seconds. A worker that disconnects, or that sends
+nothing for --timeout seconds while it has batches, is dropped and its batches are handed to the next worker that asks,
+ahead of the batches not yet handed out. A batch that a worker fails to play is handed out again in the same way, until
+it has failed RETRIES times, when the coordinator tells the workers it is done and gives up with the error. Results are
+written to a CSV file (selfplay.csv) as they arrive, and the tournament report is printed at the end.
+
+The protocol is newline delimited JSON, with matches and results as lists of their fields:
+
+    worker:         ["hello", VERSION, name, processes]
+    coordinator:    ["batch", id, [match, ...]], ... then ["done"] once every game has been played
+    worker:         ["results", id, [result, ...]] or ["failed", id, error], and ["alive"] every HEARTBEAT seconds
+
+There is no authentication, so the coordinator only listens on localhost unless it is given --host.
+
+usage:
+    python -m api.selfplay coordinate --host 0.0.0.0 --players random greedy search --sizes 4 5 --games 1000
+    python -m api.selfplay work --host coordinator.example.com --processes 8  # on each machine
+    python -m api.selfplay local --workers 4 --games 100  # a coordinator and local worker processes, for testing
+"""
+import argparse
+import asyncio
+import csv
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Union
+
+from api.players import PLAYERS
+from api.tournament import Match, Result, play, report, schedule
+
+VERSION = 2
+PORT = 7100
+WINDOW = 2  # batches each worker has at once
+HEARTBEAT = 10.0  # seconds
+LIMIT = 2 ** 24  # the longest message, in bytes
+RETRIES = 3  # the times a batch may fail before the coordinator gives up
+
+
+async def send(writer: asyncio.StreamWriter, *message):
+    writer.write(json.dumps(message, separators=(',', ':')).encode() + b'\n')
+    await writer.drain()
+
+
+async def receive(reader: asyncio.StreamReader) -> list:
+    line = await reader.readline()
+    if not line:
+        raise ConnectionError('disconnected')
+    return json.loads(line)
+
+
+class Coordinator:
+    """
+    Hands out batches of matches to the workers that connect, and collects their results
+    """
+
+    def __init__(self, matches: list[Match], batch=50, timeout=60.0, output: Union[str, Path, None] = None):
+        """
+        :param batch: the matches in a batch
+        :param timeout: the most seconds a worker with batches may send nothing, before it is taken to be dead,
+        several HEARTBEATs
+        :param output: the CSV file results are written to as they arrive
+        """
+        self.batches = {i: matches[start:start + batch] for i, start in enumerate(range(0, len(matches), batch))}
+        self.pending = deque(self.batches)  # the ids of the batches not yet handed out
+        self.results: dict[int, list[Result]] = {}
+        self.timeout = timeout
+        self.output = output
+        self.workers: dict[str, int] = {}  # games played by each worker
+        self.reassigned = 0
+        self.failures: Counter[int] = Counter()  # the times each batch has failed
+        self.error: Union[str, None] = None  # why the coordinator gave up
+        self._changed = asyncio.Event()
+        self._finished = asyncio.Event()
+        self._handlers: set[asyncio.Task] = set()
+        self._writer = None
+
+    @property
+    def finished(self) -> bool:
+        return len(self.results) == len(self.batches)
+
+    def _notify(self):
+        """
+        wakes the workers that wait for batches
+        """
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def serve(self, host='127.0.0.1', port=PORT, started: Union[asyncio.Future, None] = None) -> list[Result]:
+        """
+        :param started: set to the port once the coordinator is listening, e.g. when given port 0
+        :return: the results of every match, in the order of the matches
+        :raises RuntimeError: if a batch failed RETRIES times
+        """
+        server = await asyncio.start_server(self.handle, host, port, limit=LIMIT)
+        if started is not None:
+            started.set_result(server.sockets[0].getsockname()[1])
+        file = open(self.output, 'w', newline='') if self.output else None
+        try:
+            if file:
+                self._writer = csv.writer(file)
+                self._writer.writerow(Result._fields)
+            async with server:
+                if not self.finished:
+                    await self._finished.wait()
+                if self._handlers:  # let the workers hear that they are done
+                    await asyncio.wait(self._handlers, timeout=HEARTBEAT)
+        finally:
+            if file:
+                file.close()
+        if self.error is not None:
+            raise RuntimeError(self.error)
+        return [result for i in sorted(self.results) for result in self.results[i]]
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        mine: set[int] = set()
+        name = None
+        handler = asyncio.current_task()
+        self._handlers.add(handler)
+        try:
+            hello, version, name, processes = await asyncio.wait_for(receive(reader), self.timeout)
+            if hello != 'hello' or version != VERSION:
+                raise ConnectionError(f'{name} speaks version {version}, not {VERSION}')
+            name = f'{name} ({writer.get_extra_info("peername")})'
+            self.workers.setdefault(name, 0)
+            print(f'{name} connected with {processes} processes', file=sys.stderr)
+            while True:
+                if self.error is not None:
+                    await send(writer, 'done')  # the batches it has are not wanted
+                    return
+                while len(mine) < WINDOW and self.pending:
+                    i = self.pending.popleft()
+                    mine.add(i)
+                    await send(writer, 'batch', i, self.batches[i])
+                if not mine:
+                    if self.finished:
+                        await send(writer, 'done')
+                        return
+                    await self._changed.wait()  # for batches that another worker didn't finish
+                    continue
+                kind, *message = await asyncio.wait_for(receive(reader), self.timeout)
+                if kind == 'alive':
+                    continue
+                i, results = message
+                if kind not in ('results', 'failed') or i not in mine:
+                    raise ConnectionError(f'unexpected {kind} {i} from {name}')
+                if kind == 'failed':
+                    mine.discard(i)
+                    self.fail(i, name, results)
+                    continue
+                results = [Result(*result) for result in results]  # before the batch is taken as played
+                if len(results) != len(self.batches[i]):
+                    raise ConnectionError(f'{len(results)} results of the {len(self.batches[i])} matches of batch {i}')
+                mine.discard(i)
+                self.collect(i, results)
+                self.workers[name] += len(results)
+        except (OSError, ConnectionError, asyncio.IncompleteReadError, asyncio.TimeoutError, ValueError,
+                TypeError) as error:  # a malformed message too, e.g. not a list or a result of the wrong fields
+            if mine:
+                print(f'{name} dropped with {len(mine)} batches ({error!r}), reassigning them', file=sys.stderr)
+                self.reassigned += len(mine)
+                self.pending.extendleft(sorted(mine, reverse=True))
+                mine.clear()
+                self._notify()
+        finally:
+            writer.close()
+            self._handlers.discard(handler)
+
+    def fail(self, i: int, name: str, error: str):
+        """
+        hands a batch that a worker failed to play out again, or gives up once it has failed RETRIES times
+        """
+        self.failures[i] += 1
+        print(f'{name} failed to play batch {i} ({error})', file=sys.stderr)
+        if self.failures[i] >= RETRIES:
+            self.error = f'batch {i} failed {self.failures[i]} times, last with {error}'
+            self._finished.set()
+        else:
+            self.reassigned += 1
+            self.pending.appendleft(i)
+        self._notify()
+
+    def collect(self, i: int, results: list[Result]):
+        self.results[i] = results
+        if self._writer is not None:
+            self._writer.writerows(results)
+        if self.finished:
+            self._finished.set()
+            self._notify()  # the workers that wait for batches are done
+
+
+async def work(host='127.0.0.1', port=PORT, processes: Union[int, None] = None, name: Union[str, None] = None) -> int:
+    """
+    plays the batches a coordinator hands out until it is done
+    :return: the number of games played
+    """
+    processes = processes or os.cpu_count() or 1
+    name = name or f'{socket.gethostname()}:{os.getpid()}'
+    reader, writer = await asyncio.open_connection(host, port, limit=LIMIT)
+    loop = asyncio.get_running_loop()
+    played = 0
+    with ProcessPoolExecutor(processes) as pool:
+
+        async def play_batch(i: int, matches: list[list]):
+            nonlocal played
+            try:
+                results = await asyncio.gather(*(loop.run_in_executor(pool, play, Match(*match)) for match in matches))
+            except Exception as error:  # so that the coordinator hands the batch out again, rather than wait for it
+                await send(writer, 'failed', i, repr(error))
+                return
+            await send(writer, 'results', i, results)
+            played += len(results)
+
+        async def heartbeat():
+            while True:
+                await asyncio.sleep(HEARTBEAT)
+                await send(writer, 'alive')
+
+        batches = set()
+        alive = asyncio.create_task(heartbeat())
+        try:
+            await send(writer, 'hello', VERSION, name, processes)
+            while True:
+                kind, *message = await receive(reader)
+                if kind == 'done':
+                    break
+                batch = asyncio.create_task(play_batch(*message))
+                batches.add(batch)
+                batch.add_done_callback(batches.discard)
+        finally:
+            alive.cancel()
+            for batch in batches:
+                batch.cancel()
+            writer.close()
+    return played
+
+
+async def coordinate_local(coordinator: Coordinator, workers: int, processes=1) -> list[Result]:
+    """
+    :return: the results, played by worker processes started on this machine
+    """
+    started = asyncio.get_running_loop().create_future()
+    serving = asyncio.create_task(coordinator.serve('127.0.0.1', 0, started))
+    port = await started
+    command = [sys.executable, '-m', 'api.selfplay', 'work', '--port', str(port), '--processes', str(processes)]
+    cwd = Path(__file__).parent.parent
+    children = [subprocess.Popen([*command, '--name', f'local-{i}'], cwd=cwd) for i in range(workers)]
+    try:
+        return await serving
+    finally:
+        for child in children:
+            child.wait()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m api.selfplay', description=__doc__.split('\n\n')[1])
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    coordinating = commands.add_parser('coordinate', help='hand out games to workers and collect their results')
+    local = commands.add_parser('local', help='coordinate workers in local processes, for testing')
+    for command in (coordinating, local):
+        command.add_argument('--players', nargs='+', choices=sorted(PLAYERS), default=sorted(PLAYERS))
+        command.add_argument('--sizes', nargs='+', type=int, default=[4])
+        command.add_argument('--games', type=int, default=10, help='games per pairing, per grid size')
+        command.add_argument('--seed', type=int, default=0)
+        command.add_argument('--time-control', type=float, default=0.1, help='seconds per move')
+        command.add_argument('--batch', type=int, default=50, help='games per batch')
+        command.add_argument('--timeout', type=float, default=60.0, help='seconds before a silent worker is dropped')
+        command.add_argument('--output', default='selfplay.csv')
+    coordinating.add_argument('--host', default='127.0.0.1', help='0.0.0.0 to accept workers from other machines')
+    coordinating.add_argument('--port', type=int, default=PORT)
+    local.add_argument('--workers', type=int, default=2)
+    local.add_argument('--processes', type=int, default=1, help='per worker')
+
+    working = commands.add_parser('work', help='play the games a coordinator hands out')
+    working.add_argument('--host', default='127.0.0.1')
+    working.add_argument('--port', type=int, default=PORT)
+    working.add_argument('--processes', type=int, default=None, help='defaults to the number of CPUs')
+    working.add_argument('--name', default=None)
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'work':
+        played = asyncio.run(work(args.host, args.port, args.processes, args.name))
+        print(f'played {played} games', file=sys.stderr)
+        return
+
+    matches = list(schedule(args.players, args.sizes, args.games, args.time_control, args.seed))
+    coordinator = Coordinator(matches, args.batch, args.timeout, args.output)
+    started = time.perf_counter()
+    if args.command == 'coordinate':
+        results = asyncio.run(coordinator.serve(args.host, args.port))
+    else:
+        results = asyncio.run(coordinate_local(coordinator, args.workers, args.processes))
+    elapsed = time.perf_counter() - started
+
+    report(results)
+    print(f'\n{len(results)} games in {elapsed:.1f} s, {len(results) / elapsed:,.1f} games per second, '
+          f'{coordinator.reassigned} batches reassigned', file=sys.stderr)
+    for name, games in coordinator.workers.items():
+        print(f'  {name}: {games} games', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+import random
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Union
+
+from api.engines import Engine
+from api.game import Game, Snapshot
+
+DEFAULT_SESSION = 'default'  # the Elm client does not know about sessions, so it always plays this one
+
+
+class Sessions:
+    """
+    A registry of the games being played, keyed by session id
+
+    Games that have not been played for a while are hibernated, i.e. kept as compact bytes (see Game.to_bytes)
+    rather than as live objects, and are rehydrated when they are next played.
+    """
+
+    def __init__(self, idle=60.0, engine: Union[Engine, None] = None):
+        """
+        :param idle: seconds without a request after which a game is hibernated
+        :param engine: the rules engine of every game, the reference engine by default
+        """
+        self.idle = idle
+        self.engine = engine
+        self._games: OrderedDict[str, tuple[Game, float]] = OrderedDict()  # least recently played first
+        self._hibernating: dict[str, bytes] = {}
+        self._swept = time.monotonic()
+        self._lock = threading.Lock()
+
+    def __getitem__(self, session: str) -> Game:
+        """
+        :return: the game for the session, a new game is started if the session is unknown
+        """
+        now = time.monotonic()
+        with self._lock:
+            try:
+                game, _ = self._games.pop(session)
+            except KeyError:
+                data = self._hibernating.pop(session, None)
+                if data is None:
+                    game = Game(engine=self.engine)
+                else:
+                    game = Game.from_bytes(data, self.engine)
+            self._games[session] = game, now
+        if now - self._swept > self.idle / 2:  # amortised, so that no request waits long on the sweep
+            self.hibernate(now - self.idle)
+        return game
+
+    def snapshot(self, session: str) -> Union[Snapshot, None]:
+        """
+        :return: the last snapshot of the session's game (see Game.snapshot), or None if the session is unknown
+
+        This takes no lock and does not count as playing the game. Each dict lookup is atomic, and a game being
+        hibernated or rehydrated meanwhile is in one dict or the other, so it is looked for in the live games again.
+        """
+        for _ in range(2):
+            live = self._games.get(session)
+            if live is not None:
+                return live[0].snapshot
+            data = self._hibernating.get(session)
+            if data is not None:
+                return Game.from_bytes(data, self.engine).snapshot
+        return None
+
+    def __contains__(self, session: str) -> bool:
+        return session in self._games or session in self._hibernating
+
+    def __len__(self) -> int:
+        return len(self._games) + len(self._hibernating)
+
+    def reset(self, session: str, grid_size=4) -> Game:
+        """
+        replaces the game for the session with a new game
+        """
+        game = Game(grid_size, self.engine)
+        with self._lock:
+            self._hibernating.pop(session, None)
+            self._games.pop(session, None)
+            self._games[session] = game, time.monotonic()
+        return game
+
+    def hibernate(self, before: float = float('inf')) -> int:
+        """
+        hibernates the games last played before the given time.monotonic() time, by default all of them
+        :return: the number of games hibernated
+        """
+        count = 0
+        with self._lock:
+            self._swept = time.monotonic()
+            while self._games:
+                session, (game, played) = next(iter(self._games.items()))
+                if played >= before:
+                    break
+                del self._games[session]
+                self._hibernating[session] = game.to_bytes()
+                count += 1
+        return count
+
+    def memory(self, sample=10) -> dict:
+        """
+        :return: the number of live and hibernating games, and the bytes per game of each
+        live games are measured by a sample, since they are large graphs of objects
+        """
+        with self._lock:
+            games = [game for game, _ in self._games.values()]
+            hibernating = list(self._hibernating.values())
+        sampled = random.sample(games, min(sample, len(games)))
+        live_bytes = sum(sizeof(game, {id(game.grid), id(game.engine)}) for game in sampled)  # shared, not counted
+        hibernating_bytes = sum(map(sys.getsizeof, hibernating))
+        return {
+            'live': len(games),
+            'live_bytes_per_game': live_bytes // len(sampled) if sampled else 0,
+            'hibernating': len(hibernating),
+            'hibernating_bytes_per_game': hibernating_bytes // len(hibernating) if hibernating else 0,
+        }
+
+
+def sizeof(obj, seen=None) -> int:
+    """
+    :return: the bytes used by the object and everything it refers to, counting shared objects once
+    """
+    seen = set() if seen is None else seen
+    if id(obj) in seen or isinstance(obj, type):
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(sizeof(key, seen) + sizeof(value, seen) for key, value in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(sizeof(item, seen) for item in obj)
+    if hasattr(obj, '__dict__'):
+        size += sizeof(vars(obj), seen)
+    if hasattr(obj, '__slots__'):
+        size += sum(sizeof(getattr(obj, slot), seen) for slot in obj.__slots__ if hasattr(obj, slot))
+    return size
@@ -0,0 +1,88 @@
+"""
+Cold start
+
+The API times its own start, phase by phase, and prints the report once it has sent its first response:
+
+    imports           the modules of the API and their dependencies (FastAPI, pydantic)
+    app               the app, its middleware and its routes
+    grids             the default grid's tables, from the on-disk cache if they are there (see api/tables.py)
+    client            the client's files, read and compressed (see api/static.py)
+    server            the server starting up, e.g. binding its socket
+    waiting           until the first request arrived
+    first response    handling the first request
+
+The same report is served at /startup. uvicorn is only imported to run the API, and other optional dependencies
+(msgpack) on first use, so importing the app does not pay for them.
+
+This module imports nothing else, so that the imports it times are the API's. Time to first response is benchmarked
+from outside the process by api/benchmark.py.
+"""
+import time
+from typing import Union
+
+PHASES = ('imports', 'app', 'grids', 'client', 'server', 'waiting', 'first response')
+
+
+class Timeline:
+    """
+    The seconds each phase of starting up took, each phase ending where the next begins
+    """
+
+    def __init__(self, started: Union[float, None] = None):
+        self.started = time.perf_counter() if started is None else started
+        self.phases: dict[str, float] = {}
+        self._last = self.started
+
+    def mark(self, phase: str) -> float:
+        """
+        ends the phase now
+        :return: the seconds it took
+        """
+        now = time.perf_counter()
+        self.phases[phase] = seconds = now - self._last
+        self._last = now
+        return seconds
+
+    @property
+    def total(self) -> float:
+        return self._last - self.started
+
+    def report(self) -> str:
+        lines = [f'{phase:<16}{seconds * 1000:8.1f} ms' for phase, seconds in self.phases.items()]
+        lines.append(f'{"total":<16}{self.total * 1000:8.1f} ms')
+        return '\n'.join(lines)
+
+    def to_dict(self) -> dict[str, float]:
+        return {**self.phases, 'total': self.total}
+
+
+timeline = Timeline()  # started when this module is first imported, which api/__main__.py does before anything else
+
+
+class FirstResponse:
+    """
+    ASGI middleware that ends the last phases of the timeline at the first response, and then gets out of the way
+    """
+
+    def __init__(self, app, timeline: Timeline = timeline, quiet=False):
+        self.app = app
+        self.timeline = timeline
+        self.quiet = quiet
+        self.done = False
+
+    async def __call__(self, scope, receive, send):
+        if self.done or scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+
+        if 'waiting' not in self.timeline.phases:  # the first of requests that arrive together
+            self.timeline.mark('waiting')
+
+        async def sent(message):
+            await send(message)
+            if message['type'] == 'http.response.start' and not self.done:
+                self.done = True
+                self.timeline.mark('first response')
+                if not self.quiet:
+                    print(f'started in {self.timeline.total * 1000:.1f} ms\n{self.timeline.report()}')
+
+        await self.app(scope, receive, sent)
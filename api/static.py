@@ -0,0 +1,168 @@
+"""
+Serving the client
+
+The client is a directory of static files, the largest of which is the compiled Elm (ui.js, ~290 KB). It is read
+once when the API starts, and each file is kept with precompressed gzip and, if the brotli package is installed,
+brotli variants. Every variant has a strong ETag, so a browser that has the file revalidates it with a 304.
+
+index.html is rewritten so that the files it refers to are fingerprinted, e.g. ui.js?v=<etag>, and a fingerprinted
+file is served as immutable, so it is not even revalidated until the client changes. index.html itself is always
+revalidated, which is how a browser learns of new fingerprints.
+
+usage:
+    python -m api
+    open http://localhost:8000/client/
+"""
+import gzip
+import hashlib
+import mimetypes
+import re
+from pathlib import Path
+from typing import NamedTuple, Union
+from urllib.parse import parse_qs
+
+from starlette.responses import PlainTextResponse, Response
+
+try:
+    import brotli
+except ImportError:  # optional, pip install brotli
+    brotli = None
+
+CLIENT = Path(__file__).parent.parent / 'client'
+INDEX = 'index.html'
+PREFERENCE = ('br', 'gzip')  # smallest first
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'no-cache'
+
+
+class Variant(NamedTuple):
+    body: bytes
+    etag: str
+
+
+class Asset(NamedTuple):
+    media_type: str
+    version: str  # the fingerprint of the identity encoding
+    variants: dict[str, Variant]  # by content coding, 'identity' first
+
+
+def compress(body: bytes) -> dict[str, bytes]:
+    """
+    :return: the body in each content coding available, with the codings that don't make it smaller left out
+    """
+    encoded = {'gzip': gzip.compress(body, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        encoded['br'] = brotli.compress(body, quality=11)
+    return {coding: data for coding, data in encoded.items() if len(data) < len(body)}
+
+
+def fingerprint(body: bytes) -> str:
+    return hashlib.sha256(body).hexdigest()[:20]
+
+
+def asset(path: Path, body: bytes) -> Asset:
+    version = fingerprint(body)
+    variants = {'identity': Variant(body, f'"{version}"')}
+    for coding, data in compress(body).items():
+        variants[coding] = Variant(data, f'"{version}-{coding}"')  # strong ETags differ between encodings
+    return Asset(mimetypes.guess_type(path.name)[0] or 'application/octet-stream', version, variants)
+
+
+def accepted(header: str) -> dict[str, float]:
+    """
+    :return: the quality of each content coding in an Accept-Encoding header
+    """
+    qualities = {}
+    for item in header.split(','):
+        coding, *parameters = (part.strip() for part in item.split(';'))
+        quality = 1.0
+        for parameter in parameters:
+            name, _, value = parameter.partition('=')
+            if name.strip() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if coding:
+            qualities[coding.lower()] = quality
+    return qualities
+
+
+def negotiate(found: Asset, header: str) -> str:
+    """
+    :return: the smallest content coding of the asset that an Accept-Encoding header accepts
+    """
+    qualities = accepted(header)
+    for coding in PREFERENCE:
+        if coding in found.variants and qualities.get(coding, qualities.get('*', 0.0)) > 0:
+            return coding
+    return 'identity'
+
+
+def matches(header: str, etag: str) -> bool:
+    """
+    :return: True if an If-None-Match header matches the ETag, by weak comparison
+    """
+    tags = [tag.strip() for tag in header.split(',')]
+    return '*' in tags or etag in (tag.removeprefix('W/') for tag in tags)
+
+
+class StaticAssets:
+    """
+    ASGI app serving a directory from memory, with precompressed variants, ETags and conditional GET
+    """
+
+    def __init__(self, directory: Union[str, Path] = CLIENT):
+        self.directory = Path(directory)
+        self.assets: dict[str, Asset] = {}
+        files = {path.relative_to(self.directory).as_posix(): path for path in sorted(self.directory.rglob('*'))}
+        files = {name: path for name, path in files.items() if path.is_file()}
+        for name, path in files.items():
+            if name != INDEX:
+                self.assets[name] = asset(path, path.read_bytes())
+        if INDEX in files:  # after the files it refers to, so it can refer to their fingerprints
+            self.assets[INDEX] = asset(files[INDEX], self.fingerprinted(files[INDEX].read_text()).encode())
+
+    def fingerprinted(self, html: str) -> str:
+        """
+        :return: the html with version query strings added to the src and href of files in the directory
+        """
+        def version(match: re.Match) -> str:
+            attribute, name = match.groups()
+            known = self.assets.get(name)
+            return match.group(0) if known is None else f'{attribute}="{name}?v={known.version}"'
+        return re.sub(r'\b(src|href)="([^"?#:]+)"', version, html)
+
+    def __len__(self):
+        return len(self.assets)
+
+    async def __call__(self, scope, receive, send):
+        response = self.respond(scope)
+        await response(scope, receive, send)
+
+    def respond(self, scope) -> Response:
+        if scope['method'] not in ('GET', 'HEAD'):
+            return PlainTextResponse('Method Not Allowed', 405, headers={'Allow': 'GET, HEAD'})
+        name = scope['path'].removeprefix(scope.get('root_path', '')).lstrip('/') or INDEX
+        found = self.assets.get(name)
+        if found is None:
+            return PlainTextResponse('Not Found', 404)
+
+        headers = {key.decode('latin-1'): value.decode('latin-1') for key, value in scope['headers']}
+        coding = negotiate(found, headers.get('accept-encoding', ''))
+        variant = found.variants[coding]
+        version = parse_qs(scope.get('query_string', b'').decode('latin-1')).get('v', [None])[0]
+        response_headers = {
+            'ETag': variant.etag,
+            'Cache-Control': IMMUTABLE if version == found.version else REVALIDATE,
+            'Vary': 'Accept-Encoding',
+        }
+        if matches(headers.get('if-none-match', ''), variant.etag):
+            return Response(status_code=304, headers=response_headers)
+        if coding != 'identity':
+            response_headers['Content-Encoding'] = coding
+        body = variant.body if scope['method'] == 'GET' else b''
+        response = Response(body, headers=response_headers, media_type=found.media_type)
+        if scope['method'] == 'HEAD':
+            response.headers['Content-Length'] = str(len(variant.body))
+        return response
@@ -0,0 +1,81 @@
+"""
+On-disk cache of the precomputed tables of each grid size
+
+A Grid builds its lookup tables (rays, neighbours, symmetry permutations and their byte tables) on first use, which
+takes 11 ms for a 4x4 grid and 50 ms for an 8x8 grid, in every new worker. The tables are only numbers, so once built
+they are written to the cache directory with marshal, and every later worker loads them in about a tenth of the time
+(0.6 ms for 4x4, 5 ms for 8x8). The directory is GRID_CACHE, or hold-that-line/tables in the user's cache directory
+(XDG_CACHE_HOME, ~/.cache by default) rather than in the package, which may be read only, and 0 disables the cache.
+
+A file is named by grid size and VERSION, which is bumped whenever the tables change, and by the Python version,
+since marshal's format may change between Python versions. A file that is missing, of another version or unreadable
+is ignored, and the tables are built and written again. Files are written whole to a temporary name and renamed,
+so workers starting together never read one that is half written.
+"""
+import marshal
+import os
+import sys
+import tempfile
+from pathlib import Path
+from typing import Union
+
+CACHE = Path('hold-that-line', 'tables')  # in the user's cache directory
+VERSION = 1
+NAMES = ('rays', 'neighbours', 'symmetries', 'inverses', 'node_bytes', 'diagonal_bytes')
+
+
+def directory() -> Union[Path, None]:
+    """
+    :return: the cache directory configured by the environment, or None if the cache is disabled
+    """
+    configured = os.environ.get('GRID_CACHE', '')
+    if configured == '0':
+        return None
+    if configured:
+        return Path(configured)
+    return Path(os.environ.get('XDG_CACHE_HOME') or Path.home() / '.cache') / CACHE
+
+
+def path(size: int, root: Path) -> Path:
+    return root / f'{size}-v{VERSION}-py{sys.version_info[0]}{sys.version_info[1]}.tables'
+
+
+def load(size: int, root: Union[Path, None] = None) -> Union[dict[str, tuple], None]:
+    """
+    :return: the cached tables of the grid size, or None if they are not cached
+    """
+    root = root or directory()
+    if root is None:
+        return None
+    try:
+        tables = marshal.loads(path(size, root).read_bytes())
+    except (OSError, EOFError, ValueError, TypeError):
+        return None
+    if not isinstance(tables, dict) or tables.get('size') != size or tables.get('version') != VERSION:
+        return None
+    if not all(isinstance(tables.get(name), tuple) for name in NAMES):
+        return None
+    return tables
+
+
+def save(size: int, tables: dict[str, tuple], root: Union[Path, None] = None) -> bool:
+    """
+    :return: True if the tables were written, False if the cache is disabled or can't be written, e.g. read only
+    """
+    root = root or directory()
+    if root is None:
+        return False
+    data = marshal.dumps({'size': size, 'version': VERSION, **{name: tables[name] for name in NAMES}})
+    try:
+        root.mkdir(parents=True, exist_ok=True)
+        descriptor, temporary = tempfile.mkstemp(dir=root, suffix='.tmp')
+        try:
+            with os.fdopen(descriptor, 'wb') as file:
+                file.write(data)
+            os.replace(temporary, path(size, root))
+        except BaseException:
+            os.unlink(temporary)
+            raise
+    except OSError:
+        return False
+    return True
@@ -0,0 +1,143 @@
+"""
+Round-robin tournament between computer players
+
+Every ordered pair of players meets on every grid size for a number of seeded games, so each player moves first
+as often as second. Games are played in parallel in a process pool and each result is written to a CSV file as
+soon as it arrives. A summary of win rates and thinking time is printed at the end.
+
+usage:
+    python -m api.tournament --players random greedy search --sizes 4 5 --games 20 --time-control 0.1
+"""
+import argparse
+import csv
+import itertools
+import sys
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from typing import NamedTuple
+
+from api.players import PLAYERS
+from api.position import Position
+
+GRACE = 0.05  # seconds a player may overrun the time control before forfeiting, allows for scheduling jitter
+
+
+class Match(NamedTuple):
+    first: str
+    second: str
+    size: int
+    seed: int
+    time_control: float
+
+
+class Result(NamedTuple):
+    first: str
+    second: str
+    size: int
+    seed: int
+    winner: int  # 1 or 2, the player that did not draw the last line
+    lines: int
+    forfeit: bool  # the loser ran out of time
+    first_ms: float  # total thinking time
+    second_ms: float
+
+
+def play(match: Match) -> Result:
+    players = (
+        PLAYERS[match.first](seed=f'{match.seed}/1'),
+        PLAYERS[match.second](seed=f'{match.seed}/2'),
+    )
+    elapsed = [0.0, 0.0]
+    position = Position(match.size)
+    turn = lines = 0
+    forfeit = False
+
+    while True:
+        if lines and position.game_over:
+            winner = turn + 1  # the other player drew the last line
+            break
+
+        started = time.perf_counter()
+        move = players[turn].move(position, deadline=started + match.time_control)
+        thinking = time.perf_counter() - started
+        elapsed[turn] += thinking
+        if thinking > match.time_control + GRACE:
+            winner, forfeit = 2 - turn, True
+            break
+
+        position = position.play(*move)
+        lines += 1
+        turn = 1 - turn
+
+    return Result(
+        first=match.first,
+        second=match.second,
+        size=match.size,
+        seed=match.seed,
+        winner=winner,
+        lines=lines,
+        forfeit=forfeit,
+        first_ms=round(elapsed[0] * 1000, 3),
+        second_ms=round(elapsed[1] * 1000, 3),
+    )
+
+
+def schedule(players, sizes, games, time_control, seed=0):
+    for first, second in itertools.permutations(players, 2):
+        for size in sizes:
+            for i in range(games):
+                yield Match(first, second, size, seed + i, time_control)
+
+
+def report(results: list[Result], file=sys.stdout):
+    games = defaultdict(int)
+    wins = defaultdict(int)
+    forfeits = defaultdict(int)
+    ms = defaultdict(float)
+    moves = defaultdict(int)
+
+    for result in results:
+        for player, side in ((result.first, 1), (result.second, 2)):
+            games[player] += 1
+            wins[player] += result.winner == side
+            forfeits[player] += result.forfeit and result.winner != side
+            ms[player] += result.first_ms if side == 1 else result.second_ms
+            # the first player plays the odd lines
+            moves[player] += (result.lines + 1) // 2 if side == 1 else result.lines // 2
+
+    print(f'{"player":<12}{"games":>8}{"win rate":>10}{"forfeits":>10}{"ms/move":>10}', file=file)
+    for player in sorted(games, key=lambda p: wins[p] / games[p], reverse=True):
+        print(
+            f'{player:<12}{games[player]:>8}{wins[player] / games[player]:>10.1%}{forfeits[player]:>10}'
+            f'{ms[player] / max(moves[player], 1):>10.3f}',
+            file=file,
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m api.tournament', description=__doc__.split('\n\n')[0])
+    parser.add_argument('--players', nargs='+', choices=sorted(PLAYERS), default=sorted(PLAYERS))
+    parser.add_argument('--sizes', nargs='+', type=int, default=[4])
+    parser.add_argument('--games', type=int, default=10, help='games per pairing, per grid size')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--time-control', type=float, default=0.1, help='seconds per move')
+    parser.add_argument('--processes', type=int, default=None, help='defaults to the number of CPUs')
+    parser.add_argument('--output', default='tournament.csv')
+    args = parser.parse_args(argv)
+
+    matches = list(schedule(args.players, args.sizes, args.games, args.time_control, args.seed))
+    results = []
+    with open(args.output, 'w', newline='') as file, ProcessPoolExecutor(args.processes) as pool:
+        writer = csv.writer(file)
+        writer.writerow(Result._fields)
+        for result in pool.map(play, matches, chunksize=max(1, len(matches) // 256)):
+            writer.writerow(result)
+            file.flush()  # results stream out as the games finish
+            results.append(result)
+
+    report(results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,419 @@
+"""
+Recording and replaying traffic
+
+When recording is enabled (RECORD=<directory>) every request to a game endpoint is appended to a rotating file in that
+directory as it is answered, so that the clicks of real players, invalid clicks, /error posts and abandoned games
+included, can be replayed against a local build. A file is started after RECORD_MAX_BYTES (16 MB by default), and only
+the latest RECORD_KEEP files (10 by default) are kept. A file is MAGIC and VERSION, then records of:
+
+    arrival time (d, seconds since the epoch), endpoint (B, an index into ENDPOINTS),
+    query string length (I), Accept header length (I), body length (I), then the query string, Accept header and body
+
+with all numbers little endian. The session and points of a request are in its query string and JSON body as sent.
+What an endpoint chooses for itself, e.g. the move of a computer player or the day of a puzzle, it notes in
+request.state.replay as query parameters, which are recorded in the query string too, so that a replay of the request
+makes the same choice.
+
+Replaying sends the recorded requests to a build, at their original timing (--speed 1), faster (--speed 10) or as fast
+as possible (--fast). The requests of a session are always sent in order, one at a time, and different sessions are
+sent concurrently (--concurrency). Given a second build (--against), the same requests are replayed against it
+afterwards, and the latency of each endpoint on both builds is reported with the responses that differ, e.g.
+
+    RECORD=traffic python -m api
+    python -m api.traffic replay traffic --target http://127.0.0.1:8000 --against http://127.0.0.1:8001 --fast
+
+A replay starts from new games, so it should be against builds that have not played the recorded sessions already.
+Sessions are renamed with --prefix to replay the same traffic against a build again.
+"""
+import argparse
+import http.client
+import json
+import os
+import statistics
+import struct
+import sys
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Iterable, Iterator, NamedTuple, Union
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+from api.sessions import DEFAULT_SESSION
+
+MAGIC = b'HTLT'
+VERSION = 2
+RECORD = struct.Struct('<dBIII')
+ENDPOINTS = (
+    ('GET', '/initialize'),
+    ('POST', '/node-clicked'),
+    ('POST', '/nodes-clicked'),
+    ('POST', '/games/nodes-clicked'),
+    ('POST', '/error'),
+    ('GET', '/state'),
+    ('POST', '/computer-move'),
+    ('GET', '/puzzle'),
+)
+INDEX = {endpoint: i for i, endpoint in enumerate(ENDPOINTS)}
+
+
+class Record(NamedTuple):
+    time: float
+    endpoint: int
+    query: bytes
+    accept: bytes
+    body: bytes
+
+    @property
+    def method(self) -> str:
+        return ENDPOINTS[self.endpoint][0]
+
+    @property
+    def path(self) -> str:
+        return ENDPOINTS[self.endpoint][1]
+
+    def sessions(self) -> set[str]:
+        """
+        :return: the sessions the request plays, which must be replayed in order
+        """
+        if self.path == '/games/nodes-clicked':
+            try:
+                return {click['session'] for click in json.loads(self.body)['clicks']}
+            except (ValueError, KeyError, TypeError):
+                return set()
+        return {dict(parse_qsl(self.query.decode('latin-1'))).get('session', DEFAULT_SESSION)}
+
+    def renamed(self, prefix: str) -> 'Record':
+        """
+        :return: the record with its sessions renamed, so that it plays new games
+        """
+        if not prefix:
+            return self
+        query = dict(parse_qsl(self.query.decode('latin-1')))
+        body = self.body
+        if self.path == '/games/nodes-clicked':
+            try:
+                clicks = json.loads(body)
+                for click in clicks['clicks']:
+                    click['session'] = prefix + click['session']
+                body = json.dumps(clicks).encode()
+            except (ValueError, KeyError, TypeError):
+                pass  # replayed as it was sent
+        else:
+            query['session'] = prefix + query.get('session', DEFAULT_SESSION)
+        return self._replace(query=urlencode(query).encode('latin-1'), body=body)
+
+
+class Recorder:
+    """
+    Appends records to the latest file of a directory, starting a new file once it is full
+    """
+
+    def __init__(self, directory: Union[str, Path] = 'traffic', max_bytes=16 * 2 ** 20, keep=10):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.keep = keep
+        self.records = 0
+        self.failures = 0  # records that could not be written, e.g. for a full disk
+        self._file = None
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_environment(cls) -> Union['Recorder', None]:
+        """
+        :return: a recorder configured by the environment, or None if recording is not enabled
+        """
+        directory = os.environ.get('RECORD', '')
+        if directory in ('', '0'):
+            return None
+        return cls(
+            directory,
+            max_bytes=int(os.environ.get('RECORD_MAX_BYTES', 16 * 2 ** 20)),
+            keep=int(os.environ.get('RECORD_KEEP', 10)),
+        )
+
+    def record(self, record: Record):
+        data = RECORD.pack(record.time, record.endpoint, len(record.query), len(record.accept), len(record.body)) \
+            + record.query + record.accept + record.body
+        with self._lock:
+            if self._file is None or self._bytes + len(data) > self.max_bytes:
+                self._rotate()
+            self._file.write(data)
+            self._file.flush()  # whole records, for a replay of a file that is still being written
+            self._bytes += len(data)
+            self.records += 1
+
+    def _rotate(self):
+        if self._file is not None:
+            self._file.close()
+        self.directory.mkdir(parents=True, exist_ok=True)
+        existing = files(self.directory)
+        number = int(existing[-1].stem.rsplit('-', 1)[1]) + 1 if existing else 1
+        self._file = open(self.directory / f'traffic-{number:06d}.rec', 'wb')
+        self._file.write(MAGIC + bytes((VERSION,)))
+        self._bytes = len(MAGIC) + 1
+        for stale in files(self.directory)[:-self.keep]:
+            stale.unlink(missing_ok=True)
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+def files(directory: Path) -> list[Path]:
+    """
+    :return: the record files of a directory, oldest first
+    """
+    return sorted(directory.glob('traffic-*.rec'))
+
+
+def read(path: Path) -> Iterator[Record]:
+    """
+    :return: the whole records of a file, ignoring one that was cut short
+    """
+    data = path.read_bytes()
+    if data[:len(MAGIC)] != MAGIC or data[len(MAGIC)] != VERSION:
+        raise ValueError(f'{path} is not a version {VERSION} traffic file')
+    offset = len(MAGIC) + 1
+    while offset + RECORD.size <= len(data):
+        arrived, endpoint, query, accept, body = RECORD.unpack_from(data, offset)
+        offset += RECORD.size
+        end = offset + query + accept + body
+        if end > len(data):
+            return
+        yield Record(
+            arrived,
+            endpoint,
+            data[offset:offset + query],
+            data[offset + query:offset + query + accept],
+            data[offset + query + accept:end],
+        )
+        offset = end
+
+
+def load(paths: Iterable[Union[str, Path]]) -> list[Record]:
+    """
+    :return: the records of the files, and of the files in the directories, in order of arrival
+    """
+    records = []
+    for path in map(Path, paths):
+        for file in files(path) if path.is_dir() else [path]:
+            records.extend(read(file))
+    return sorted(records, key=lambda record: record.time)  # written as they were answered
+
+
+class RecorderMiddleware:
+    """
+    ASGI middleware that records the requests to game endpoints, once they have been answered
+    """
+
+    def __init__(self, app, recorder: Recorder):
+        self.app = app
+        self.recorder = recorder
+
+    async def __call__(self, scope, receive, send):
+        endpoint = INDEX.get((scope.get('method'), scope.get('path'))) if scope['type'] == 'http' else None
+        if endpoint is None:
+            return await self.app(scope, receive, send)
+
+        arrived = time.time()
+        body = []
+        state = scope.setdefault('state', {})  # request.state, for what the endpoint chose
+
+        async def receive_body():
+            message = await receive()
+            if message['type'] == 'http.request':
+                body.append(message.get('body', b''))
+            return message
+
+        try:
+            await self.app(scope, receive_body, send)
+        finally:
+            accept = dict(scope['headers']).get(b'accept', b'')
+            try:
+                query = scope['query_string']
+                if state.get('replay'):
+                    query = urlencode({**dict(parse_qsl(query.decode('latin-1'))), **state['replay']}).encode('latin-1')
+                self.recorder.record(Record(arrived, endpoint, query, accept, b''.join(body)))
+            except Exception as error:  # the request was answered, recording it must not fail it
+                self.recorder.failures += 1
+                print('failed to record a request:', repr(error))
+
+
+class Response(NamedTuple):
+    status: int
+    body: bytes
+    seconds: float
+
+
+class Target:
+    """
+    A build to replay against, over HTTP, with a connection per thread
+    """
+
+    def __init__(self, url: str, timeout=30.0):
+        self.url = url
+        parts = urlsplit(url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def __str__(self):
+        return self.url
+
+    def send(self, record: Record) -> Response:
+        path = record.path + (f'?{record.query.decode("latin-1")}' if record.query else '')
+        headers = {'Content-Type': 'application/json'}
+        if record.accept:
+            headers['Accept'] = record.accept.decode('latin-1')
+        for attempt in range(2):  # once more on a new connection, if the server closed the one kept alive
+            connection = getattr(self._local, 'connection', None)
+            if connection is None:
+                connection = self._local.connection = http.client.HTTPConnection(self.host, self.port, self.timeout)
+            try:
+                started = time.perf_counter()
+                connection.request(record.method, path, body=record.body or None, headers=headers)
+                response = connection.getresponse()
+                body = response.read()
+                return Response(response.status, body, time.perf_counter() - started)
+            except (OSError, http.client.HTTPException):
+                connection.close()
+                self._local.connection = None
+                if attempt:
+                    raise
+
+
+def replay(records: list[Record], target, speed: Union[float, None] = 1.0, concurrency=8) -> list[Response]:
+    """
+    :param target: anything with send(record) -> Response
+    :param speed: how many times faster than they were recorded to send the requests, None for as fast as possible
+    :return: the response to each record
+    """
+    responses: list[Union[Response, None]] = [None] * len(records)
+    last: dict[str, Future] = {}  # the future of the latest request of each session
+    room = threading.BoundedSemaphore(concurrency * 16)  # requests waiting to be sent, so the futures are bounded
+
+    def send(i: int, waits: list[Future]):
+        try:
+            for future in waits:  # earlier requests, so they were queued first, and can't be queued behind this one
+                future.result()
+            responses[i] = target.send(records[i])
+        except Exception as error:  # reported as a failed response
+            responses[i] = Response(0, repr(error).encode(), 0.0)
+        finally:
+            room.release()
+
+    started = time.perf_counter()
+    first = records[0].time if records else 0.0
+    with ThreadPoolExecutor(concurrency) as pool:
+        for i, record in enumerate(records):
+            if speed is not None:
+                delay = (record.time - first) / speed - (time.perf_counter() - started)
+                if delay > 0:
+                    time.sleep(delay)
+            room.acquire()
+            sessions = record.sessions()
+            future = pool.submit(send, i, [last[session] for session in sessions if session in last])
+            for session in sessions:
+                last[session] = future
+    return responses
+
+
+def normalise(record: Record, response: Response) -> tuple[int, bytes]:
+    """
+    :return: the status and body of a response, without what differs between runs of the same build
+    """
+    if record.path == '/state' and response.status == 200:
+        try:
+            state = json.loads(response.body)
+            state.pop('version', None)  # counts the moves of every game in the process
+            return response.status, json.dumps(state, sort_keys=True).encode()
+        except ValueError:
+            pass
+    return response.status, response.body
+
+
+def percentile(values: list[float], fraction: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def report(records: list[Record], runs: dict[str, list[Response]], show=5, file=sys.stdout) -> list[int]:
+    """
+    prints the latency of each endpoint on each build, and the responses that differ if there are two builds
+    :return: the indices of the records whose responses differ
+    """
+    print(f'{"endpoint":<22}{"build":<28}{"requests":>9}{"failed":>8}'
+          f'{"p50 ms":>9}{"p90 ms":>9}{"p99 ms":>9}{"max ms":>9}', file=file)
+    for endpoint, (_, path) in enumerate(ENDPOINTS):
+        for name, responses in runs.items():
+            sent = [response for record, response in zip(records, responses) if record.endpoint == endpoint]
+            if not sent:
+                continue
+            seconds = [response.seconds * 1000 for response in sent if response.status]
+            failed = sum(not response.status or response.status >= 500 for response in sent)
+            quantiles = [percentile(seconds, q) for q in (0.5, 0.9, 0.99)] + [max(seconds)] if seconds else [0.0] * 4
+            print(f'{path:<22}{name:<28}{len(sent):>9}{failed:>8}' + ''.join(f'{q:>9.2f}' for q in quantiles),
+                  file=file)
+    for name, responses in runs.items():
+        seconds = [response.seconds for response in responses if response.status]
+        if seconds:
+            print(f'{name}: {len(responses)} requests, mean {statistics.mean(seconds) * 1000:.2f} ms', file=file)
+
+    if len(runs) == 2:
+        (a, first), (b, second) = runs.items()
+        differences = [
+            i for i, record in enumerate(records) if normalise(record, first[i]) != normalise(record, second[i])
+        ]
+        print(f'\n{len(differences)} of {len(records)} responses differ between {a} and {b}', file=file)
+        for i in differences[:show]:
+            record = records[i]
+            print(f'  #{i} {record.method} {record.path}?{record.query.decode("latin-1")} '
+                  f'{record.body.decode(errors="replace")}', file=file)
+            for name, response in ((a, first[i]), (b, second[i])):
+                print(f'    {name}: {response.status} {response.body[:200]!r}', file=file)
+        return differences
+    return []
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m api.traffic', description=__doc__.split('\n\n')[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    replaying = commands.add_parser('replay', help='replay recorded traffic against one build, or two to compare')
+    replaying.add_argument('paths', nargs='+', help='traffic files, or directories of them')
+    replaying.add_argument('--target', default='http://127.0.0.1:8000')
+    replaying.add_argument('--against', default=None, help='a second build, to compare with the target')
+    replaying.add_argument('--speed', type=float, default=1.0, help='times faster than recorded')
+    replaying.add_argument('--fast', action='store_true', help='as fast as possible')
+    replaying.add_argument('--concurrency', type=int, default=8, help='requests in flight')
+    replaying.add_argument('--prefix', default='', help='to rename the sessions, so that they are new games')
+
+    showing = commands.add_parser('show', help='print recorded traffic')
+    showing.add_argument('paths', nargs='+')
+
+    args = parser.parse_args(argv)
+    records = load(args.paths)
+
+    if args.command == 'show':
+        for record in records:
+            print(f'{record.time:.6f} {record.method} {record.path}?{record.query.decode("latin-1")} '
+                  f'{record.body.decode(errors="replace")}')
+        return
+
+    records = [record.renamed(args.prefix) for record in records]
+    runs = {}
+    for url in [args.target] + ([args.against] if args.against else []):
+        started = time.perf_counter()
+        runs[url] = replay(records, Target(url), None if args.fast else args.speed, args.concurrency)
+        print(f'replayed {len(records)} requests against {url} in {time.perf_counter() - started:.1f} s',
+              file=sys.stderr)
+    report(records, runs)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,196 @@
+"""
+Wire formats of payloads
+
+JSON is the default, and what the Elm client gets. A client that sends an Accept header for one of the other formats
+gets the same information as fewer bytes, which are also quicker to encode:
+
+    application/msgpack             the JSON structure as MessagePack, if msgpack is installed (pip install msgpack)
+    application/x-hold-that-line    a fixed binary layout, a payload being:
+
+        state (B, the index of msg in Game.STATES),
+        new line start x, start y, end x, end y (B, B, B, B, 255 if there is no new line),
+        legal nodes length (B, 255 if they were not asked for), legal nodes (a little endian bitmask over node indices),
+        heading length (B), heading (UTF-8, cut to 255 bytes), message length (I), message (UTF-8)
+
+    with all numbers little endian, and a list of payloads being their number (H) followed by the payloads.
+    A puzzle set up (see /puzzle) is its day (year H, month B, day B), grid size, N and player (B, B, B), its lines'
+    number (H) and their start x, start y, end x, end y (B, B, B, B), the solution's (255 if it wasn't asked for),
+    followed by the payload of the last click that set it up.
+"""
+import importlib.util
+import struct
+from typing import Union
+
+from starlette.responses import Response
+
+from api.game import Game
+from api.static import accepted
+
+JSON = 'application/json'
+MSGPACK = 'application/msgpack'
+BINARY = 'application/x-hold-that-line'
+# optional, and only imported when a client first asks for it, so that starting the API does not pay for it
+MSGPACK_INSTALLED = importlib.util.find_spec('msgpack') is not None
+FORMATS = (JSON, BINARY) + ((MSGPACK,) if MSGPACK_INSTALLED else ())  # JSON first, so it wins ties
+
+FIXED = struct.Struct('<B4BB')
+PUZZLE = struct.Struct('<HBBBBBH')
+NONE = 255
+STATES = {state: i for i, state in enumerate(Game.STATES)}
+
+
+def negotiate(accept: Union[str, None]) -> str:
+    """
+    :return: the format that an Accept header prefers, JSON if it accepts none of them
+    """
+    if not accept:
+        return JSON
+    qualities = accepted(accept)
+    best = max(FORMATS, key=lambda media_type: qualities.get(media_type, 0.0))
+    return best if qualities.get(best, 0.0) > 0 else JSON
+
+
+def reply(accept: Union[str, None], content):
+    """
+    :return: the payload or payloads as they are if JSON is wanted, for FastAPI to validate and serialise as usual,
+    otherwise a response with them encoded in the format wanted
+    """
+    media_type = negotiate(accept)
+    if media_type == JSON:
+        return content
+    encode = pack if media_type == BINARY else pack_msgpack
+    return Response(encode(content), media_type=media_type)
+
+
+def plain(content) -> Union[dict, list]:
+    """
+    :return: the payload or payloads as the dicts and lists that FastAPI would serialise as JSON
+    """
+    if isinstance(content, list):
+        return [plain(payload) for payload in content]
+    if hasattr(content, 'payload'):  # a puzzle set up
+        return {
+            'day': content.day.isoformat(),
+            'size': content.size,
+            'moves': content.moves,
+            'player': content.player,
+            'lines': [plain_line(line) for line in content.lines],
+            'solution': plain_line(content.solution),
+            'payload': plain(content.payload),
+        }
+    body = content.body
+    return {
+        'msg': content.msg,
+        'body': {
+            'newLine': plain_line(body.newLine),
+            'heading': body.heading,
+            'message': body.message,
+            'legalNodes': body.legalNodes,
+        },
+    }
+
+
+def plain_line(line) -> Union[dict, None]:
+    if line is None:
+        return None
+    return {'start': {'x': line.start.x, 'y': line.start.y}, 'end': {'x': line.end.x, 'y': line.end.y}}
+
+
+def ends(line) -> tuple[int, int, int, int]:
+    return (NONE,) * 4 if line is None else (line.start.x, line.start.y, line.end.x, line.end.y)
+
+
+def pack(content) -> bytes:
+    """
+    :return: the payload or payloads in the fixed binary layout
+    """
+    if isinstance(content, list):
+        return struct.pack('<H', len(content)) + b''.join(map(pack, content))
+    if hasattr(content, 'payload'):  # a puzzle set up
+        day = content.day
+        return PUZZLE.pack(day.year, day.month, day.day, content.size, content.moves, content.player,
+                           len(content.lines)) \
+            + bytes(number for line in content.lines + [content.solution] for number in ends(line)) \
+            + pack(content.payload)
+    body = content.body
+    if body.legalNodes is None:
+        legal = b''
+    else:
+        mask = int(body.legalNodes, 16)
+        legal = mask.to_bytes((mask.bit_length() + 7) // 8, 'little')
+    heading = (body.heading or '').encode()[:255].decode(errors='ignore').encode()  # whole characters
+    message = (body.message or '').encode()  # as long as an /error post, so not cut
+    return FIXED.pack(STATES[content.msg], *ends(body.newLine), NONE if body.legalNodes is None else len(legal)) \
+        + legal + bytes((len(heading),)) + heading + struct.pack('<I', len(message)) + message
+
+
+def pack_msgpack(content) -> bytes:
+    """
+    :return: the payload or payloads as MessagePack
+    """
+    import msgpack  # on first use, see MSGPACK_INSTALLED
+    return msgpack.packb(plain(content))
+
+
+def unpack(data: bytes, offset=0) -> tuple[dict, int]:
+    """
+    :return: the plain payload at the offset of data in the fixed binary layout, and the offset after it
+    """
+    state, *numbers, legal_length = FIXED.unpack_from(data, offset)
+    offset += FIXED.size
+    legal = None
+    if legal_length != NONE:
+        legal = format(int.from_bytes(data[offset:offset + legal_length], 'little'), 'x')
+        offset += legal_length
+    heading_length = data[offset]
+    heading = data[offset + 1:offset + 1 + heading_length].decode()
+    offset += 1 + heading_length
+    message_length, = struct.unpack_from('<I', data, offset)
+    message = data[offset + 4:offset + 4 + message_length].decode()
+    offset += 4 + message_length
+    payload = {
+        'msg': Game.STATES[state],
+        'body': {
+            'newLine': unpack_line(numbers),
+            'heading': heading,
+            'message': message,
+            'legalNodes': legal,
+        },
+    }
+    return payload, offset
+
+
+def unpack_list(data: bytes) -> list[dict]:
+    count, = struct.unpack_from('<H', data)
+    payloads = []
+    offset = 2
+    for _ in range(count):
+        payload, offset = unpack(data, offset)
+        payloads.append(payload)
+    return payloads
+
+
+def unpack_line(numbers) -> Union[dict, None]:
+    start_x, start_y, end_x, end_y = numbers
+    if start_x == NONE:
+        return None
+    return {'start': {'x': start_x, 'y': start_y}, 'end': {'x': end_x, 'y': end_y}}
+
+
+def unpack_puzzle(data: bytes) -> dict:
+    """
+    :return: the plain puzzle set up in the fixed binary layout
+    """
+    year, month, day, size, moves, player, count = PUZZLE.unpack_from(data)
+    offset = PUZZLE.size
+    lines = [unpack_line(data[offset + 4 * i:offset + 4 * i + 4]) for i in range(count + 1)]
+    payload, _ = unpack(data, offset + 4 * (count + 1))
+    return {
+        'day': f'{year:04}-{month:02}-{day:02}',
+        'size': size,
+        'moves': moves,
+        'player': player,
+        'lines': lines[:-1],
+        'solution': lines[-1],
+        'payload': payload,
+    }
@@ -0,0 +1,5 @@
+import os
+import tempfile
+
+_grid_cache = tempfile.TemporaryDirectory()  # so that the tests, and the APIs they launch, cache grid tables there
+os.environ['GRID_CACHE'] = _grid_cache.name
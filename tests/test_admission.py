@@ -0,0 +1,112 @@
+import asyncio
+import unittest
+from unittest import mock
+
+import httpx
+from fastapi import FastAPI
+
+from api.admission import Admission, AdmissionMiddleware, Gate, Policy
+
+
+class TestGate(unittest.IsolatedAsyncioTestCase):
+
+    async def test_enter_leave(self):
+
+        gate = Gate(limit=1, queue=1)
+        self.assertTrue(await gate.enter())
+        waiter = asyncio.create_task(gate.enter())
+        await asyncio.sleep(0)
+        self.assertEqual(gate.waiting, 1)
+        self.assertFalse(await gate.enter())  # the queue is full
+        gate.leave(0.5)
+        self.assertTrue(await waiter)
+        self.assertEqual((gate.active, gate.waiting, gate.admitted, gate.shed), (1, 0, 2, 1))
+        gate.leave(0.5)
+        self.assertEqual(gate.active, 0)
+
+    async def test_priority(self):
+
+        gate = Gate(limit=1, queue=3)
+        await gate.enter()
+        order = []
+
+        async def enter(priority):
+            await gate.enter(priority)
+            order.append(priority)
+
+        tasks = [asyncio.create_task(enter(priority)) for priority in (2, 0, 1)]
+        await asyncio.sleep(0)
+        for _ in tasks:
+            gate.leave()
+            await asyncio.sleep(0)
+        await asyncio.gather(*tasks)
+        self.assertListEqual(order, [0, 1, 2])
+
+    async def test_timed_out(self):
+
+        gate = Gate(limit=1, queue=1)
+        await gate.enter()
+        self.assertFalse(await gate.enter(wait=0.01))
+        self.assertEqual((gate.timed_out, gate.waiting), (1, 0))
+        gate.leave()
+        self.assertEqual(gate.active, 0)  # the place was not handed to the request that gave up
+
+    def test_retry_after(self):
+
+        gate = Gate(limit=2, queue=10)
+        self.assertEqual(gate.retry_after(), 1)
+        gate.seconds = 3.0
+        gate.waiting = 3
+        self.assertEqual(gate.retry_after(), 6)
+
+
+class TestAdmission(unittest.TestCase):
+
+    def test_from_environment(self):
+
+        with mock.patch.dict('os.environ', {}, clear=True):
+            self.assertIsNone(Admission.from_environment())  # off unless asked for
+        with mock.patch.dict('os.environ', {'ADMISSION': '1', 'ADMISSION_LIMIT': '4', 'ADMISSION_WAIT': '0.5'}):
+            admission = Admission.from_environment()
+            self.assertEqual((admission.shared.limit, admission.wait), (4, 0.5))
+
+
+class TestAdmissionMiddleware(unittest.IsolatedAsyncioTestCase):
+
+    async def test_shed(self):
+
+        release = asyncio.Event()
+        app = FastAPI()
+
+        @app.get('/slow')
+        async def slow():
+            await release.wait()
+            return 'slow'
+
+        @app.get('/fast')
+        async def fast():
+            return 'fast'
+
+        admission = Admission({'/slow': Policy(1, 1, 1)}, limit=10, wait=5)
+        app.add_middleware(AdmissionMiddleware, admission=admission)
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url='http://test') as client:
+            first = asyncio.create_task(client.get('/slow'))
+            second = asyncio.create_task(client.get('/slow'))
+            while admission.gates['/slow'].waiting < 1:
+                await asyncio.sleep(0.001)
+            shed = await client.get('/slow')
+            self.assertEqual(shed.status_code, 503)
+            self.assertIn('Retry-After', shed.headers)
+            self.assertEqual((await client.get('/fast')).status_code, 200)  # another endpoint is not held up
+            release.set()
+            self.assertEqual([(await first).status_code, (await second).status_code], [200, 200])
+
+        stats = admission.stats()
+        self.assertEqual(stats['endpoints']['/slow']['shed'], 1)
+        self.assertEqual(stats['endpoints']['/slow']['admitted'], 2)
+        self.assertEqual(stats['endpoints']['default']['admitted'], 1)
+        self.assertEqual(stats['shared']['active'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
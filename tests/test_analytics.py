@@ -0,0 +1,101 @@
+import sys
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+
+from api.analytics import GameStore, blocks
+from api.game import Game
+from api.models import Point
+from tests.data import TURNS
+from tests.utils import play_turn
+
+try:
+    import numpy
+    from api import queries
+except ImportError:  # numpy is only needed by the queries
+    numpy = None
+
+
+def sample_game(invalid=0) -> Game:
+    game = Game()
+    for _ in range(invalid):
+        game(Point(x=9, y=9))  # not a node
+        game.try_again()
+    for turn in TURNS:
+        play_turn(game, turn)
+    return game
+
+
+class TestAnalytics(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = Path(self.directory.name) / 'games.columns'
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    def test_game(self):
+
+        game = sample_game()
+        self.assertEqual(game.state, 'GAME_OVER')
+        self.assertEqual(len(game.lines), 2 * len(TURNS))
+        self.assertEqual(game.lines[:2], bytes((0, 8)))  # the first line, (0, 0) to (0, 2)
+        self.assertEqual(game.transitions[Game.STATES.index('VALID_START_NODE')], len(TURNS))
+        rehydrated = Game.from_bytes(game.to_bytes())
+        self.assertEqual((rehydrated.lines, rehydrated.transitions), (game.lines, game.transitions))
+
+    def test_batches(self):
+
+        store = GameStore(self.path, batch=2)
+        for _ in range(3):
+            store.add(sample_game())
+        self.assertEqual(len(store), 1)  # the first two were written
+        self.assertEqual([games for games, _ in blocks(self.path.read_bytes())], [2])
+        store.flush()
+        self.assertEqual([games for games, _ in blocks(self.path.read_bytes())], [2, 1])
+
+        data = self.path.read_bytes()
+        self.assertEqual(len(list(blocks(data[:-1]))), 1)  # the last block was cut short
+        _, columns = next(blocks(data))
+        self.assertEqual(bytes(columns['nodes'][:2 * len(TURNS)]), bytes(sample_game().lines))
+        self.assertEqual(bytes(columns['winner']), bytes((2, 2)))
+
+    def test_concurrent(self):
+
+        store = GameStore(self.path, batch=7)
+        game = sample_game()
+        switch = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)  # to switch threads between reading the batch and taking the lock, if it could
+        try:
+            adders = [threading.Thread(target=lambda: [store.add(game) for _ in range(500)]) for _ in range(4)]
+            flusher = threading.Thread(target=lambda: [store.flush() for _ in range(500)])
+            for thread in adders + [flusher]:
+                thread.start()
+            for thread in adders + [flusher]:
+                thread.join()
+        finally:
+            sys.setswitchinterval(switch)
+        store.flush()
+        written = list(blocks(self.path.read_bytes()))
+        self.assertEqual(sum(games for games, _ in written), 2000)
+        for games, columns in written:
+            self.assertEqual(len(columns['nodes']), games * len(game.lines))
+
+    @unittest.skipIf(numpy is None, 'numpy is not installed')
+    def test_queries(self):
+
+        store = GameStore(self.path)
+        store.add(sample_game(invalid=3))
+        for _ in range(3):
+            store.add(sample_game())
+        store.flush()
+
+        table = queries.load(self.path)
+        self.assertDictEqual(queries.game_lengths(table), {4: (4, len(TURNS))})
+        self.assertAlmostEqual(queries.invalid_click_rate(table), 3 / (4 * len(TURNS) * 2 + 3))
+        self.assertDictEqual(queries.opening_win_rates(table, 4), {(0, 2): (4, 0.0)})  # (0, 8) reflected
+
+if __name__ == '__main__':
+    unittest.main()
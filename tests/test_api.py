@@ -0,0 +1,145 @@
+import asyncio
+import json
+import unittest
+
+import httpx
+from fastapi.testclient import TestClient
+
+from api.__main__ import app, sessions
+from api.wire import BINARY, unpack
+from tests.data import TURNS
+
+
+def point(node):
+    return {'x': node.x, 'y': node.y}
+
+
+class TestApi(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.client = TestClient(app)
+
+    def test_session_clicks(self):
+
+        # two games of the sample game, one a line behind the other, and an invalid click in a third
+        clicks = [{'session': 'behind', 'point': point(node)} for node in TURNS[0]]
+        for turn in TURNS[:2]:
+            clicks.extend({'session': 'ahead', 'point': point(node)} for node in turn)
+        clicks.insert(1, {'session': 'invalid', 'point': {'x': 9, 'y': 9}})
+        response = self.client.post('/games/nodes-clicked', json={'clicks': clicks})
+        self.assertEqual(response.status_code, 200)
+        self.assertListEqual(
+            [payload['msg'] for payload in response.json()],
+            ['VALID_START_NODE', 'INVALID_START_NODE', 'VALID_END_NODE'] + ['VALID_START_NODE', 'VALID_END_NODE'] * 2,
+        )
+        self.assertEqual(len(sessions['behind'].path.nodes), len(sessions['ahead'].path.nodes) - 1)
+
+        # the clicks of a session are played in order
+        clicks = [{'session': 'ordered', 'point': point(node)} for turn in TURNS for node in turn]
+        response = self.client.post('/games/nodes-clicked', json={'clicks': clicks})
+        self.assertEqual(response.json()[-1]['msg'], 'GAME_OVER')
+
+    def test_clicks(self):
+
+        # on the first turn, an invalid end node stops the batch, and the next click is a start node again
+        self.client.get('/initialize', params={'session': 'batch'})
+        clicks = [point(TURNS[0][0]), {'x': 9, 'y': 9}, point(TURNS[0][1])]
+        response = self.client.post('/nodes-clicked', params={'session': 'batch'}, json={'points': clicks})
+        self.assertEqual(response.status_code, 200)
+        self.assertListEqual([payload['msg'] for payload in response.json()], ['VALID_START_NODE', 'INVALID_END_NODE'])
+        self.assertIsNone(sessions['batch'].start_node)
+        self.assertEqual(len(sessions['batch'].path.nodes), 0)
+
+        clicks = [point(node) for turn in TURNS[:2] for node in turn]
+        response = self.client.post('/nodes-clicked', params={'session': 'batch'}, json={'points': clicks})
+        self.assertListEqual([payload['msg'] for payload in response.json()],
+                             ['VALID_START_NODE', 'VALID_END_NODE'] * 2)
+
+        # an invalid start node later on, with only the last payload
+        clicks = [{'x': 3, 'y': 3}, point(TURNS[2][0])]
+        response = self.client.post('/nodes-clicked', params={'session': 'batch'},
+                                    json={'points': clicks, 'last': True})
+        self.assertListEqual([payload['msg'] for payload in response.json()], ['INVALID_START_NODE'])
+        self.assertIsNone(sessions['batch'].start_node)
+
+    def test_accept(self):
+
+        self.client.get('/initialize', params={'session': 'binary'})
+        response = self.client.post('/node-clicked', params={'session': 'binary'}, json=point(TURNS[0][0]))
+        self.assertEqual(response.headers['content-type'], 'application/json')
+        response = self.client.post(
+            '/node-clicked',
+            params={'session': 'binary'},
+            json=point(TURNS[0][1]),
+            headers={'Accept': BINARY},
+        )
+        self.assertEqual(response.headers['content-type'], BINARY)
+        payload, _ = unpack(response.content)
+        self.assertEqual(payload['body']['newLine'], {'start': point(TURNS[0][0]), 'end': point(TURNS[0][1])})
+
+
+    def test_state(self):
+
+        self.assertEqual(self.client.get('/state', params={'session': 'unknown'}).status_code, 404)
+        self.client.get('/initialize', params={'session': 'state'})
+        response = self.client.get('/state', params={'session': 'state'})
+        self.assertEqual((response.json()['state'], response.json()['path']), ('INITIALIZE', []))
+        etag = response.headers['etag']
+
+        # half a turn is not an accepted move
+        self.client.post('/node-clicked', params={'session': 'state'}, json=point(TURNS[0][0]))
+        response = self.client.get('/state', params={'session': 'state'}, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+
+        self.client.post('/node-clicked', params={'session': 'state'}, json=point(TURNS[0][1]))
+        response = self.client.get('/state', params={'session': 'state'}, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['etag'], etag)
+        self.assertEqual(response.json()['state'], 'VALID_END_NODE')
+        self.assertEqual(response.json()['player'], 2)
+        self.assertEqual(len(response.json()['path']), 3)
+
+
+class TestEvents(unittest.IsolatedAsyncioTestCase):
+
+    async def test_events(self):
+
+        sent = asyncio.Queue()
+        disconnected = asyncio.Event()
+
+        async def receive():
+            await disconnected.wait()
+            return {'type': 'http.disconnect'}
+
+        scope = {
+            'type': 'http', 'http_version': '1.1', 'method': 'GET', 'scheme': 'http', 'root_path': '',
+            'path': '/games/watched/events', 'raw_path': b'/games/watched/events', 'query_string': b'', 'headers': [],
+            'server': ('test', 80), 'client': ('test', 1234),
+        }
+        spectator = asyncio.create_task(app(scope, receive, sent.put))  # a stream that stays open, like a browser's
+
+        async def body() -> bytes:
+            message = await asyncio.wait_for(sent.get(), 5)
+            return message.get('body', b'')
+
+        start = await asyncio.wait_for(sent.get(), 5)
+        self.assertEqual(start['status'], 200)
+        self.assertIn((b'content-type', b'text/event-stream; charset=utf-8'), start['headers'])
+        self.assertEqual(await body(), b': connected\n\n')
+
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url='http://test') as client:
+            await client.get('/initialize', params={'session': 'watched'})
+            self.assertTrue((await body()).startswith(b'event: INITIALIZE\n'))
+            await client.post('/node-clicked', params={'session': 'watched'}, json=point(TURNS[0][0]))
+            await client.post('/node-clicked', params={'session': 'watched'}, json=point(TURNS[0][1]))
+        event, data = (await body()).decode().split('\n')[:2]
+        self.assertEqual(event, 'event: VALID_END_NODE')  # half a turn is not sent
+        self.assertEqual(json.loads(data[len('data: '):])['body']['newLine'],
+                         {'start': point(TURNS[0][0]), 'end': point(TURNS[0][1])})
+
+        disconnected.set()
+        await asyncio.wait_for(spectator, 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from api.book import OpeningBook, encode_key, openings, write
+from api.position import Position
+from api.puzzle import Solver, TooHard
+
+
+class TestOpeningBook(unittest.TestCase):
+
+    def setUp(self) -> None:
+
+        self.directory = tempfile.TemporaryDirectory()
+        self.positions = openings(3, 2)
+        # the book move of each position is its first move, so that lookups are predictable
+        moves = {encode_key(position): position.moves()[0] for position in self.positions}
+        write(Path(self.directory.name) / '3.book', 3, moves, max(p.nodes.bit_count() for p in self.positions))
+        self.book = OpeningBook(Path(self.directory.name))
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    def test_lookup(self):
+
+        self.assertEqual(len(self.book.book(3)), len(self.positions))
+        for position in self.positions:
+            self.assertEqual(self.book.lookup(position), position.moves()[0])
+            for symmetry in range(8):  # the images of the position are found by symmetry
+                image = position.transform(symmetry)
+                move = self.book.lookup(image)
+                print(f'{image}: {move}')
+                # the same move as the book move, up to the symmetries of the position itself
+                self.assertEqual(image.play(*move).canonical[1], position.play(*position.moves()[0]).canonical[1])
+
+    def test_missing(self):
+
+        position = Position(3)
+        for move in ((0, 2), (2, 8), (8, 6)):  # three lines deep, beyond the book
+            position = position.play(*move)
+        self.assertIsNone(self.book.lookup(position))
+        self.assertIsNone(self.book.lookup(Position(4)))  # no book for this size
+
+
+class TestBooks(unittest.TestCase):
+
+    def test_exact(self):
+
+        # the 4x4 book moves win soonest or lose latest, checked on the openings that are quick to solve
+        book = OpeningBook()
+        solver = Solver(budget=60_000)
+        checked = 0
+        for position in openings(4, 2):
+            try:
+                distance = solver.distance(position)
+            except TooHard:
+                continue
+            child = solver.distance(position.play(*book.lookup(position)))
+            self.assertEqual(child, 1 - distance if distance > 0 else -distance - 1)
+            checked += 1
+        self.assertGreaterEqual(checked, 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,182 @@
+import asyncio
+import time
+import unittest
+from concurrent.futures import Future
+
+from fastapi.testclient import TestClient
+
+from api import compute
+from api.compute import Rejected, Scheduler, think, unless_abandoned
+
+
+class Pool:
+    """
+    A process pool whose jobs finish when the test says so
+    """
+
+    def __init__(self):
+        self.jobs: list[tuple[tuple, Future]] = []
+
+    def submit(self, function, *args):
+        future = Future()
+        self.jobs.append((args, future))
+        return future
+
+    def finish(self, i: int, move=(0, 1), seconds=0.25):
+        self.jobs[i][1].set_result((move, seconds))
+
+    def shutdown(self, **kwargs):
+        pass
+
+
+def scheduler(processes=1, **kwargs) -> tuple[Scheduler, Pool]:
+    scheduler = Scheduler(processes, **kwargs)
+    scheduler._pool = pool = Pool()
+    scheduler._flags = [0] * processes
+    return scheduler, pool
+
+
+class TestScheduler(unittest.IsolatedAsyncioTestCase):
+
+    async def test_fair(self):
+
+        s, pool = scheduler(processes=1, per_session=3)
+        moves = [
+            asyncio.create_task(s.move(session, 'random', 4, b'', 1.0)) for session in ('a', 'a', 'a', 'b', 'c')
+        ]
+        await asyncio.sleep(0)
+        self.assertEqual((s.running, s.waiting), (1, 4))
+        for i in range(5):
+            pool.finish(i, move=(i, i + 1))  # the moves are numbered in the order the jobs were started
+            await asyncio.sleep(0.01)
+        started = [move.result()[0] for move in moves]
+        self.assertEqual(started, [0, 1, 4, 2, 3])  # a, then a, b and c in turn, then a again
+        stats = s.stats()
+        self.assertEqual((stats['submitted'], stats['completed'], stats['running'], stats['waiting']), (5, 5, 0, 0))
+        self.assertEqual(stats['compute']['max_ms'], 250)
+        self.assertGreater(stats['wait']['max_ms'], 0)
+
+    async def test_rejected(self):
+
+        s, pool = scheduler(processes=1, queue=2, per_session=2)
+        for session in ('a', 'a', 'b'):
+            asyncio.create_task(s.move(session, 'random', 4, b'', 1.0))
+        await asyncio.sleep(0)
+        with self.assertRaises(Rejected) as rejected:
+            await s.move('a', 'random', 4, b'', 1.0)  # a has two jobs already
+        self.assertEqual((rejected.exception.status, rejected.exception.retry_after), (503, 3))  # a second each
+        with self.assertRaises(Rejected):
+            await s.move('c', 'random', 4, b'', 1.0)  # the queue is full
+        self.assertEqual(s.counts['rejected'], 2)
+        self.assertNotIn('c', s._jobs)
+
+    async def test_cancel(self):
+
+        s, pool = scheduler(processes=1)
+        running = asyncio.create_task(s.move('a', 'search', 4, b'', 1.0))
+        waiting = asyncio.create_task(s.move('a', 'search', 4, b'', 1.0))
+        other = asyncio.create_task(s.move('b', 'search', 4, b'', 1.0))
+        await asyncio.sleep(0)
+        s.cancel('a')
+        for move in (running, waiting):
+            with self.assertRaises(Rejected) as rejected:
+                await move
+            self.assertEqual(rejected.exception.status, 409)
+        self.assertEqual(s._flags, [1])  # the running job's process is told to stop
+        self.assertEqual((s.waiting, list(s._turns)), (1, ['b']))
+
+        pool.finish(0)  # the process stops, and takes the next job
+        await asyncio.sleep(0.01)
+        self.assertEqual(len(pool.jobs), 2)
+        self.assertEqual(s._flags, [0])
+        pool.finish(1)
+        self.assertEqual(await other, (0, 1))
+        self.assertEqual((s.counts['cancelled'], s.counts['completed']), (2, 1))
+
+    async def test_cancel_from_thread(self):
+
+        s, pool = scheduler(processes=1)
+        move = asyncio.create_task(s.move('a', 'search', 4, b'', 1.0))
+        await asyncio.sleep(0)
+        await asyncio.to_thread(s.cancel, 'a')
+        with self.assertRaises(Rejected):
+            await move
+
+    async def test_expired(self):
+
+        s, pool = scheduler(processes=1, wait=0.05)
+        running = asyncio.create_task(s.move('a', 'search', 4, b'', 1.0))
+        waiting = asyncio.create_task(s.move('b', 'search', 4, b'', 1.0))
+        with self.assertRaises(Rejected) as rejected:
+            await waiting
+        self.assertEqual(rejected.exception.status, 503)
+        self.assertEqual((s.counts['expired'], s.waiting), (1, 0))
+        pool.finish(0)
+        self.assertEqual(await running, (0, 1))  # started in time, so it may think for its seconds
+
+    async def test_abandoned(self):
+
+        s, pool = scheduler(processes=1)
+        disconnected = asyncio.Event()
+
+        async def receive():
+            await disconnected.wait()
+            return {'type': 'http.disconnect'}
+
+        abandoned = asyncio.create_task(unless_abandoned(receive, s.move('a', 'search', 4, b'', 1.0)))
+        await asyncio.sleep(0.01)
+        self.assertEqual(s.running, 1)
+        disconnected.set()
+        self.assertIsNone(await abandoned)
+        self.assertEqual((s.counts['cancelled'], s._flags), (1, [1]))
+
+    async def test_failed(self):
+
+        s, pool = scheduler(processes=1)
+        move = asyncio.create_task(s.move('a', 'search', 4, b'', 1.0))
+        await asyncio.sleep(0)
+        pool.jobs[0][1].set_exception(ValueError('nope'))
+        with self.assertRaises(Rejected) as rejected:
+            await move
+        self.assertEqual(rejected.exception.status, 500)
+        self.assertEqual((s.counts['failed'], s.running), (1, 0))
+
+
+class TestThink(unittest.TestCase):
+
+    lines = bytes((0, 7, 7, 35, 35, 14))  # on a 6x6 grid, out of the opening book
+
+    def tearDown(self):
+        compute._flags = None
+
+    def test_move(self):
+
+        (start, end), seconds = think('search', 6, self.lines, 0.2, 0)
+        self.assertIn(start, (0, 14))
+        self.assertLess(seconds, 0.5)
+
+    def test_cancelled(self):
+
+        compute._flags = [1]
+        started = time.perf_counter()
+        think('search', 6, self.lines, 5.0, 0)
+        self.assertLess(time.perf_counter() - started, 1.0)
+
+
+class TestComputerMove(unittest.TestCase):
+
+    def test_computer_move(self):
+
+        from api.__main__ import app, scheduler, sessions
+        client = TestClient(app)
+        completed = client.get('/compute').json()['completed']  # by the tests that ran before
+        client.get('/initialize', params={'session': 'computer'})
+        response = client.post('/computer-move', params={'session': 'computer', 'player': 'random', 'seconds': 0.5})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['msg'], 'VALID_END_NODE')
+        self.assertEqual(len(sessions['computer'].lines), 2)  # one line
+
+        self.assertEqual(client.post('/computer-move', params={'player': 'nobody'}).status_code, 404)
+        self.assertEqual(client.post('/computer-move', params={'seconds': 60}).status_code, 422)
+        self.assertEqual(client.get('/compute').json()['completed'], completed + 1)
+        scheduler.shutdown()
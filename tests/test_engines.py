@@ -0,0 +1,138 @@
+import random
+import unittest
+
+from api.engines import BitmaskEngine, Cached, Engine, ReferenceEngine, Shadow, from_environment
+from api.game import Game
+from api.models import Grid, Path
+from api.sessions import Sessions
+from tests.data import TURNS, VALID_END_NODES
+from tests.utils import play_turn
+
+
+class Wrong(Engine):
+    """
+    forgets all of the path but its end
+    """
+
+    name = 'wrong'
+
+    def valid_end_nodes(self, grid, path, start_node):
+        end = Path([node for node in path.nodes if node == path._end])
+        return BitmaskEngine().valid_end_nodes(grid, end, start_node)
+
+
+def paths(size: int, games: int, seed=0):
+    """
+    :return: the path and its ends after every line of a number of random games
+    """
+    rng = random.Random(seed)
+    for _ in range(games):
+        game = Game(size)
+        while not game.game_over:
+            start = rng.choice(sorted(game.path.extrema if game.path else game.grid.nodes, key=str))
+            ends = game.valid_end_nodes(start)
+            if not ends:
+                continue
+            play_turn(game, (start, rng.choice(sorted(ends, key=str))))
+            yield game.path, game.path.extrema
+
+
+class TestEngines(unittest.TestCase):
+
+    def test_sample_game(self):
+
+        for engine in (ReferenceEngine(), BitmaskEngine()):
+            game = Game()
+            for i, turn in enumerate(TURNS):
+                self.assertSetEqual(engine.valid_end_nodes(game.grid, game.path, turn[0]), VALID_END_NODES[i])
+                play_turn(game, turn)
+
+    def test_bitmask_agrees(self):
+
+        reference, bitmask = ReferenceEngine(), BitmaskEngine()
+        for size in (3, 4, 5):
+            grid = Grid(size)
+            for path, ends in paths(size, 10):
+                for start in ends:
+                    self.assertSetEqual(
+                        bitmask.valid_end_nodes(grid, path, start),
+                        reference.valid_end_nodes(grid, path, start),
+                    )
+
+    def test_shadow(self):
+
+        shadow = Shadow(BitmaskEngine(), sample_rate=1)
+        grid = Grid(4)
+        game = Game()
+        for turn in TURNS:
+            shadow.valid_end_nodes(grid, game.path, turn[0])
+            play_turn(game, turn)
+        shadow.join()
+        stats = shadow.stats()
+        self.assertEqual((stats['calls'], stats['checked'], stats['mismatched']), (len(TURNS), len(TURNS), 0))
+        self.assertGreater(stats['speedup'], 1)
+
+        shadow = Shadow(Wrong(), sample_rate=1)
+        game = Game()
+        for turn in TURNS:
+            shadow.valid_end_nodes(grid, game.path, turn[0])
+            play_turn(game, turn)
+        shadow.join()
+        self.assertGreater(shadow.stats()['mismatched'], 0)
+        self.assertEqual(shadow.stats()['mismatches'][0]['start'], str(TURNS[1][0]))
+
+    def test_cached(self):
+
+        cached = Cached(ReferenceEngine(), capacity=1000)
+        reference = ReferenceEngine()
+        grid = Grid(4)
+        for _ in range(2):  # the same games again, from the cache
+            for path, ends in paths(4, 5):
+                for start in ends:
+                    self.assertSetEqual(
+                        cached.valid_end_nodes(grid, path, start),
+                        reference.valid_end_nodes(grid, path, start),
+                    )
+        stats = cached.stats()['cache']
+        self.assertEqual(stats['hits'], stats['misses'])
+        self.assertEqual(stats['evictions'], 0)
+
+        game = Game()
+        play_turn(game, TURNS[0])
+        reversed_path = Path(list(reversed(game.path.nodes)))  # the same position, with its ends the other way round
+        cached.valid_end_nodes(grid, game.path, game.path._start)
+        hits = cached.hits
+        cached.valid_end_nodes(grid, reversed_path, game.path._start)
+        self.assertEqual(cached.hits, hits + 1)
+
+        cached = Cached(ReferenceEngine(), capacity=2)
+        for path, ends in paths(4, 1):
+            cached.valid_end_nodes(grid, path, ends[0])
+        self.assertEqual(len(cached), 2)
+        self.assertGreater(cached.stats()['cache']['evictions'], 0)
+
+        self.assertIsInstance(from_environment(), Cached)
+
+    def test_game_engine(self):
+
+        shadow = Shadow(BitmaskEngine(), sample_rate=0)
+        game = Game(engine=shadow)
+        for turn in TURNS:
+            play_turn(game, turn)
+        self.assertEqual(game.state, 'GAME_OVER')
+        self.assertGreater(shadow.calls, 0)
+        self.assertIsInstance(Game().engine, ReferenceEngine)  # the engine is the game's own
+
+        sessions = Sessions(engine=Cached(ReferenceEngine()))
+        for session in ('a', 'b'):
+            game = sessions[session]
+            for turn in TURNS:
+                play_turn(game, turn)
+            self.assertEqual(game.state, 'GAME_OVER')
+        self.assertGreater(sessions.engine.hits, 0)
+        sessions.hibernate()
+        self.assertIs(sessions['a'].engine, sessions.engine)
+
+
+if __name__ == '__main__':
+    unittest.main()
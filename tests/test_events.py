@@ -0,0 +1,42 @@
+import asyncio
+import unittest
+
+from api.events import Channels, encode
+
+
+class TestChannels(unittest.IsolatedAsyncioTestCase):
+
+    async def test_publish(self):
+
+        channels = Channels(maxsize=4)
+        streams = [channels.stream('game') for _ in range(3)]
+        for stream in streams:
+            self.assertEqual(await anext(stream), b': connected\n\n')  # subscribed
+        self.assertEqual(len(channels), 3)
+
+        channels.publish('game', 'VALID_END_NODE', {'x': 1})
+        channels.publish('other', 'VALID_END_NODE', {'x': 2})  # nobody is watching this game
+        frames = [await anext(stream) for stream in streams]
+        self.assertEqual(frames[0], encode('VALID_END_NODE', {'x': 1}))
+        self.assertTrue(all(frame is frames[0] for frame in frames))  # serialised once
+
+        for stream in streams:
+            await stream.aclose()
+        self.assertEqual(len(channels), 0)
+
+    async def test_drop_slow_subscriber(self):
+
+        channels = Channels(maxsize=2)
+        stream = channels.stream('game')
+        await anext(stream)
+        for i in range(3):  # one more than the subscriber can hold
+            channels.publish('game', 'VALID_END_NODE', i)
+        await asyncio.sleep(0)  # let the fan out run
+
+        self.assertEqual(len(channels), 0)
+        frames = [frame async for frame in stream]
+        self.assertEqual(frames, [encode('VALID_END_NODE', 1)])  # the oldest frame made way for the end of stream
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,4 +1,5 @@
 import unittest
+from unittest import mock
 
 from api.game import Game
 from api.models import Line, Point, Path
@@ -76,6 +77,64 @@ class TestGame(unittest.TestCase):
                             print(f'expected: {e}')
                             raise
 
+    def test__try_again(self):
+
+        # an invalid click on the first turn lets the player try again
+        game = Game()
+        game(Point(x=0, y=0))
+        game(Point(x=1, y=2))  # not octilinear
+        self.assertEqual(game.state, 'INVALID_END_NODE')
+        self.assertIsNone(game.start_node)
+        game(Point(x=9, y=9))  # not on the grid
+        self.assertEqual(game.state, 'INVALID_START_NODE')
+        play_turn(game, TURNS[0])
+        self.assertEqual(game.state, 'VALID_END_NODE')
+
+    def test__precompute(self):
+
+        game = Game()
+        for i, turn in enumerate(TURNS[:-1]):
+            play_turn(game, turn)
+            game.precompute()
+            length, cache = game._end_nodes
+            self.assertEqual(length, len(game.path.nodes))
+            self.assertSetEqual(set(cache), set(game.path.extrema))
+            self.assertSetEqual(game.valid_end_nodes(TURNS[i + 1][0]), VALID_END_NODES[i + 1])
+
+        # results for a shorter path are not used once the path has grown
+        game = Game()
+        play_turn(game, TURNS[0])
+        stale = game._end_nodes
+        play_turn(game, TURNS[1])
+        stale[1][TURNS[2][0]] = set()
+        self.assertSetEqual(game.valid_end_nodes(TURNS[2][0]), VALID_END_NODES[2])
+
+        # the next line is played while a precompute is starting, which must not replace the longer path's end nodes
+        game = Game()
+        play_turn(game, TURNS[0])
+
+        def copy(nodes):
+            play_turn(game, TURNS[1])  # meanwhile, in the request thread
+            return Path(nodes)
+
+        with mock.patch('api.game.Path', side_effect=copy):
+            game.precompute()
+        self.assertEqual(game._end_nodes[0], len(game.path.nodes))
+        self.assertSetEqual(game.valid_end_nodes(TURNS[2][0]), VALID_END_NODES[2])
+
+    def test__legal_nodes(self):
+
+        def points(mask: int) -> set[Point]:
+            return {point for i, point in enumerate(game.grid.points) if mask >> i & 1}
+
+        game = Game()
+        for i, (start, end) in enumerate(TURNS):
+            self.assertSetEqual(points(game.legal_nodes()), VALID_START_NODES[i])
+            game(start)
+            self.assertSetEqual(points(game.legal_nodes()), VALID_END_NODES[i])
+            game(end)
+        self.assertEqual(game.legal_nodes(), 0)  # game over
+
     def test__new_line(self):
 
         # verify all the new lines of the sample game are represented properly
@@ -0,0 +1,33 @@
+import pickle
+import unittest
+
+from api.models import Grid
+from api.utils import is_octilinear
+
+
+class TestGrid(unittest.TestCase):
+
+    def test___new__(self):
+
+        self.assertIs(Grid(4), Grid(4))  # shared by every game
+        self.assertIsNot(Grid(4), Grid(5))
+        self.assertIs(pickle.loads(pickle.dumps(Grid(4))), Grid(4))
+        self.assertEqual(len(Grid(5).nodes), 25)
+
+    def test_registry_size(self):
+
+        for size in range(3, 4 + Grid.registry_size):
+            Grid(size)
+        self.assertLessEqual(len(Grid._registry), Grid.registry_size)
+        self.assertEqual(Grid(3).size, 3)  # rebuilt once dropped
+
+    def test_nodes_octilinear_to(self):
+
+        grid = Grid(4)
+        for point in grid.nodes:
+            expected = {node for node in grid.nodes if node != point and is_octilinear(point.direction_to(node))}
+            self.assertSetEqual(set(grid.nodes_octilinear_to(point)), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+import unittest
+
+from api.models import Point
+from api.players import PLAYERS, GreedyPlayer, SearchPlayer
+from api.position import Position
+from api.puzzle import PUZZLES, read
+from api.tournament import Match, play
+from tests.data import TURNS
+
+
+class TestPlayers(unittest.TestCase):
+
+    def test_move(self):
+
+        position = Position()
+        for name, player in PLAYERS.items():
+            move = player(seed=0).move(position)
+            print(f'{name}: {move}')
+            self.assertIn(move, position.moves())
+
+    def test_search_wins(self):
+
+        # after six lines of the sample game, drawing (3, 3) to (1, 3) is the only line that wins
+        # (the sample game went on to (0, 3) and lost)
+        position = Position()
+        index = position.grid.index
+        for start, end in TURNS[:6]:
+            position = position.play(index[start], index[end])
+        self.assertEqual(SearchPlayer(seed=0).move(position), (index[Point(x=3, y=3)], index[Point(x=1, y=3)]))
+
+    def test_greedy_avoids_last_line(self):
+
+        # after seven lines of the sample game neither line is the last, the greedy player should see that
+        position = Position()
+        index = position.grid.index
+        for start, end in TURNS[:7]:
+            position = position.play(index[start], index[end])
+        for seed in range(5):
+            move = GreedyPlayer(seed=seed).move(position)
+            self.assertTrue(position.play(*move).moves())
+
+    def test_greedy_forces_win(self):
+
+        # in the puzzles that win in 1, the solution is the only line after which every reply is the last
+        for puzzle in read(PUZZLES / '4.txt'):
+            if puzzle.moves == 1:
+                position = puzzle.position
+                move = GreedyPlayer(seed=0).choose(position)
+                self.assertEqual(position.play(*move).key, position.play(*puzzle.solution).key)
+
+    def test_play(self):
+
+        for first in PLAYERS:
+            result = play(Match(first, 'random', 4, seed=0, time_control=1))
+            print(result)
+            self.assertIn(result.winner, (1, 2))
+            self.assertGreater(result.lines, 0)
+            self.assertFalse(result.forfeit)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,46 @@
+import unittest
+
+from api.game import Game
+from api.position import Position
+from tests.data import TURNS, PATH_NODES, VALID_END_NODES, VALID_START_NODES
+
+
+class TestPosition(unittest.TestCase):
+
+    def test_play(self):
+
+        position = Position()
+        points, index = position.grid.points, position.grid.index
+        for i, (start, end) in enumerate(TURNS):
+            print(f'\nTurn {i + 1}: {position}')
+            self.assertSetEqual({points[node] for node in position.valid_start_nodes}, VALID_START_NODES[i])
+            self.assertSetEqual(
+                {points[node] for node in position.valid_end_nodes(index[start])},
+                VALID_END_NODES[i],
+            )
+            position = position.play(index[start], index[end])
+            self.assertSetEqual(set(position.path), set(PATH_NODES[i]))
+            self.assertEqual(position.game_over, i == len(TURNS) - 1)
+
+    def test_from_path(self):
+
+        game = Game()
+        for turn in TURNS[:5]:
+            for point in turn:
+                game(point)
+        position = Position.from_path(game.path)
+        self.assertSetEqual(set(position.path), set(PATH_NODES[4]))
+        self.assertSetEqual(
+            {position.grid.points[node] for node in position.valid_start_nodes},
+            set(game.path.extrema),
+        )
+
+    def test_key(self):
+
+        index = Position().grid.index
+        start, end = (index[point] for point in TURNS[0])
+        self.assertEqual(Position().play(start, end), Position().play(end, start))  # either direction
+
+
+if __name__ == '__main__':
+    unittest.main()
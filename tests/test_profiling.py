@@ -0,0 +1,45 @@
+import tempfile
+import unittest
+
+from api.profiling import Profiler, capture, _capture
+
+
+def scope(headers=()):
+    return {'type': 'http', 'method': 'POST', 'path': '/node-clicked', 'headers': list(headers)}
+
+
+class TestProfiler(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.profiler = Profiler(self.directory.name, keep=2)
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    def test_wanted(self):
+
+        self.assertIsNone(self.profiler.wanted(scope()))  # no header and no sampling
+        self.assertFalse(self.profiler.wanted(scope([(b'x-profile', b'1')])).memory)
+        self.assertTrue(self.profiler.wanted(scope([(b'x-profile', b'memory')])).memory)
+        self.profiler.sample_rate = 1
+        self.assertIsNotNone(self.profiler.wanted(scope()))
+
+    def test_save(self):
+
+        for _ in range(3):
+            current = self.profiler.wanted(scope([(b'x-profile', b'memory')]))
+            token = _capture.set(current)
+            with capture():
+                sum(range(1000))
+            _capture.reset(token)
+            self.profiler.save(current)
+
+        captures = self.profiler.captures()
+        print(captures)
+        self.assertEqual(len(captures), 2)  # the oldest was rotated out
+        self.assertTrue(all(c['memory'] for c in captures))
+
+
+if __name__ == '__main__':
+    unittest.main()
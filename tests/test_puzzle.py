@@ -0,0 +1,143 @@
+import datetime
+import io
+import random
+import tempfile
+import unittest
+from pathlib import Path
+
+from fastapi.testclient import TestClient
+
+from api.players import SearchPlayer
+from api.position import Position
+from api.puzzle import PUZZLES, Puzzle, Puzzles, Solver, TooHard, canonical, generate, puzzles, read, sample
+from api.wire import BINARY, unpack_puzzle
+
+
+class TestSolver(unittest.TestCase):
+
+    def test_distance(self):
+
+        memo = {}
+
+        def minimax(position: Position) -> int:  # without pruning, the lines to the end, won if even
+            if position.key not in memo:
+                results = [minimax(position.play(*move)) for move in position.moves()]
+                losing = [d for d in results if d % 2]  # lines to the end that the opponent loses
+                memo[position.key] = min(losing) + 1 if losing else max(results, default=-1) + 1
+            return memo[position.key]
+
+        solver = Solver(budget=100_000)
+        rng = random.Random(1)
+        for _ in range(5):
+            position, history = Position(4), []
+            while position.moves():
+                history.append(position)
+                position = position.play(*rng.choice(position.moves()))
+            self.assertEqual(solver.distance(position), 0)  # the opponent drew the last line
+            for position in history[-4:]:
+                expected = minimax(position)
+                self.assertEqual(solver.distance(position), expected if expected % 2 == 0 else -expected)
+
+    def test_budget(self):
+
+        with self.assertRaises(TooHard):
+            Solver(budget=10).distance(Position(5).play(0, 6))
+
+    def test_sample(self):
+
+        puzzles, solved = sample(4, seed=3, games=5, moves=(1, 2, 3))
+        self.assertGreater(solved, 0)
+        self.assertEqual(puzzles, sample(4, seed=3, games=5, moves=(1, 2, 3))[0])  # seeded
+        solver = Solver(budget=100_000)
+        for puzzle in puzzles:
+            self.assertEqual(solver.puzzle(puzzle.position, puzzle.lines), puzzle)
+
+
+class TestPuzzle(unittest.TestCase):
+
+    def test_format(self):
+
+        puzzle = Puzzle.parse('1 d4a4 4 a1a3 a1b1 b1d3 a3c3 d3d2 c3d4')
+        self.assertEqual((puzzle.moves, puzzle.solution, puzzle.size, len(puzzle.lines)), (1, (15, 12), 4, 6))
+        self.assertEqual(puzzle.player, 1)
+        self.assertEqual(Puzzle.parse(str(puzzle)), puzzle)
+
+    def test_symmetry(self):
+
+        puzzle = Puzzle.parse('1 d4a4 4 a1a3 a1b1 b1d3 a3c3 d3d2 c3d4')
+        mirror = [3 - node % 4 + node // 4 * 4 for node in range(16)]
+        mirrored = Puzzle(1, (mirror[15], mirror[12]), 4, tuple((mirror[s], mirror[e]) for s, e in puzzle.lines))
+        self.assertNotEqual(mirrored.position.key, puzzle.position.key)
+        self.assertEqual(canonical(mirrored), canonical(puzzle))
+
+    def test_pool(self):
+        """
+        a sample of the puzzles of each grid size, solved again from scratch, and by the search player
+        """
+        rng = random.Random(0)
+        for size in (4, 5, 6):
+            pool = read(PUZZLES / f'{size}.txt')
+            self.assertEqual({puzzle.moves for puzzle in pool}, {1, 2, 3})
+            self.assertEqual(len({canonical(puzzle) for puzzle in pool}), len(pool))
+            for puzzle in rng.sample(pool, 5):
+                self.assertEqual(Solver(budget=100_000).puzzle(puzzle.position, puzzle.lines), puzzle)
+                move = SearchPlayer(seed=0).choose(puzzle.position)
+                self.assertLess(Solver(budget=100_000).distance(puzzle.position.play(*move)), 0)  # a win, if slower
+
+
+class TestGenerate(unittest.TestCase):
+
+    def test_generate(self):
+
+        with tempfile.TemporaryDirectory() as directory:
+            directory = Path(directory)
+            added = generate(4, (1, 2), count=5, seconds=60, processes=1, batch=5, directory=directory,
+                             file=io.StringIO())
+            self.assertEqual(added, {1: 5, 2: 5})
+            pool = read(directory / '4.txt')
+            self.assertEqual(len(pool), 10)
+
+            added = generate(4, (1, 2, 3), count=5, seconds=60, processes=1, batch=5, directory=directory,
+                             file=io.StringIO())
+            self.assertEqual(added, {3: 5})  # there are enough of the others
+            self.assertEqual(len({canonical(puzzle) for puzzle in read(directory / '4.txt')}), 15)
+
+
+class TestPuzzles(unittest.TestCase):
+
+    def test_daily(self):
+
+        pool = Puzzles()
+        day = datetime.date(2026, 1, 1)
+        self.assertEqual(pool.daily(4, 2, day), pool.daily(4, 2, day))
+        self.assertEqual(pool.daily(4, 2, day).moves, 2)
+        week = {pool.daily(5, 1, day + datetime.timedelta(days=i)) for i in range(7)}
+        self.assertGreater(len(week), 1)
+        self.assertIsNone(pool.daily(4, 9, day))
+        self.assertIsNone(pool.daily(9, 1, day))
+
+    def test_api(self):
+
+        from api.__main__ import app, sessions
+        client = TestClient(app)
+        response = client.get('/puzzle', params={'session': 'puzzle', 'size': 5, 'moves': 2, 'day': '2026-01-01'})
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        puzzle = Puzzles().daily(5, 2, datetime.date(2026, 1, 1))
+        self.assertEqual((body['size'], body['moves'], body['player']), (5, 2, puzzle.player))
+        self.assertIsNone(body['solution'])
+        self.assertEqual(body['payload']['msg'], 'VALID_END_NODE')
+        self.assertEqual(bytes(sessions['puzzle'].lines), bytes(node for line in puzzle.lines for node in line))
+
+        packed = client.get('/puzzle', params={'session': 'puzzle', 'size': 5, 'moves': 2, 'day': '2026-01-01'},
+                            headers={'Accept': BINARY})
+        self.assertEqual(unpack_puzzle(packed.content), body)
+
+        solution = client.get('/puzzle', params={'session': 'puzzle', 'size': 5, 'moves': 2, 'day': '2026-01-01',
+                                                 'solution': True}).json()['solution']
+        client.post('/node-clicked', params={'session': 'puzzle'}, json=solution['start'])
+        self.assertEqual(client.post('/node-clicked', params={'session': 'puzzle'}, json=solution['end']).json()['msg'],
+                         'VALID_END_NODE')
+        self.assertEqual(client.get('/puzzle', params={'size': 9}).status_code, 404)
+        self.assertEqual(client.get('/puzzle', params={'size': 99999}).status_code, 422)
+        self.assertNotIn(99999, puzzles._pools)
@@ -0,0 +1,45 @@
+import unittest
+
+from api.game import Game
+from api.models import Point
+from api.records import chunks, format_record, generate, replay, replay_chunk
+from tests.data import TURNS
+
+SAMPLE = '4 a1a3 a1b1 b1d3 a3c3 d3d2 c3d4 d4a4 d2d1 d1c1'
+
+
+class TestRecords(unittest.TestCase):
+
+    def test_format_record(self):
+
+        moves = [tuple(point.y * 4 + point.x for point in turn) for turn in TURNS]
+        self.assertEqual(format_record(4, moves), SAMPLE)
+
+    def test_replay(self):
+
+        self.assertEqual(replay(1, SAMPLE)[2:], (9, 2, None))  # lines, winner, first invalid line
+        self.assertEqual(replay(1, '4 a1a3 a1b1')[2:], (2, None, None))  # unfinished
+        self.assertEqual(replay(1, '4 a1a3 a1b1 a1c1')[2:], (2, None, 3))  # a1 is no longer an end of the path
+        self.assertEqual(replay(1, '4 a1a3 b1e1')[2:], (1, None, 2))  # off the grid
+        self.assertEqual(replay(1, '4 a1a3 a3')[2:], (1, None, 2))  # not a line
+        self.assertEqual(replay(1, 'four a1a3'), (1, 0, 0, None, 0))  # not a grid size
+        self.assertEqual(replay(1, '99 a1a3'), (1, 0, 0, None, 0))  # more columns than letters
+        self.assertEqual(replay_chunk([(1, 'a1a3'), (2, SAMPLE)])[1][2:], (9, 2, None))  # the archive goes on
+
+    def test_replay_agrees_with_game(self):
+
+        records = list(chunks(generate(20, [3, 4, 5], seed=1), 20))[0]
+        for (number, record), result in zip(records, replay_chunk(records)):
+            size, *moves = record.split()
+            game = Game(int(size))
+            for move in moves:
+                for node in (move[:2], move[2:]):
+                    game(Point(x=ord(node[0]) - ord('a'), y=int(node[1:]) - 1))
+            print(record, result)
+            self.assertEqual(game.state, 'GAME_OVER')
+            self.assertEqual(game.winner, result.winner)
+            self.assertEqual(len(moves), result.lines)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+import random
+import unittest
+
+from api.models import Point
+from api.players import SearchPlayer
+from api.position import Position
+from api.regions import solve
+from tests.data import TURNS
+
+
+def won(position: Position, known: dict) -> bool:
+    """
+    the plain search, for comparison: the player with no lines to play has won
+    """
+    if position not in known:
+        moves = position.moves()
+        known[position] = not moves or any(not won(position.play(*move), known) for move in moves)
+    return known[position]
+
+
+def split_positions(size: int, games: int, seed=0) -> list[Position]:
+    """
+    :return: the first split position of each of a number of random games
+    """
+    rng = random.Random(seed)
+    positions = []
+    for _ in range(games):
+        position = Position(size)
+        while position.moves():
+            position = position.play(*rng.choice(position.moves()))
+            if position.split and not position.game_over:
+                positions.append(position)
+                break
+    return positions
+
+
+class TestRegions(unittest.TestCase):
+
+    def test_split(self):
+
+        # the sample game splits after five lines, the nodes (2, 0) and (3, 0) left to one end
+        position = Position()
+        points, index = position.grid.points, position.grid.index
+        for i, (start, end) in enumerate(TURNS):
+            position = position.play(index[start], index[end])
+            self.assertEqual(position.split, i >= 4)
+            if i == 4:
+                self.assertSetEqual(
+                    {points[node] for node in range(16) if position.region(position.start) >> node & 1},
+                    {Point(x=2, y=0), Point(x=3, y=0)},
+                )
+        for position in split_positions(4, 20):
+            self.assertFalse(position.region(position.start) & position.region(position.end))
+            for move in position.moves():
+                self.assertTrue(position.play(*move).split)  # the regions only ever shrink
+
+    def test_solve(self):
+
+        known = {}
+        for size in (4, 5):
+            for position in split_positions(size, 40):
+                if position.nodes.bit_count() < size * size // 2:
+                    continue  # too slow to check by plain search
+                print(position)
+                self.assertEqual(solve(position), won(position, known))
+
+    def test_not_split(self):
+
+        self.assertIsNone(solve(Position()))
+        index = Position().grid.index
+        self.assertIsNone(solve(Position().play(*(index[point] for point in TURNS[0]))))
+
+    def test_budget(self):
+
+        position = max(split_positions(5, 40), key=lambda position: -position.nodes.bit_count())
+        self.assertIsNone(solve(position, budget=1))
+
+    def test_search(self):
+
+        for position in split_positions(4, 10, seed=1):
+            self.assertEqual(
+                SearchPlayer(seed=0).negamax(position, 64),
+                SearchPlayer(seed=0, budget=0).negamax(position, 64),
+            )
+
+    def test_exhausted(self):
+
+        # once a split position can't be solved within the budget, the rest of the move is searched as usual
+        for position in split_positions(4, 10, seed=1):
+            player = SearchPlayer(seed=0, budget=1)
+            self.assertEqual(player.negamax(position, 64), SearchPlayer(seed=0, budget=0).negamax(position, 64))
+            self.assertTrue(player.exhausted)
+            self.assertEqual(player.splits, {position.key: True})  # its children are known to have split
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+import asyncio
+import unittest
+
+from api.selfplay import VERSION, Coordinator, receive, send, work
+from api.tournament import Match, play, schedule
+
+MATCHES = list(schedule(['random', 'greedy'], [3, 4], 3, time_control=5.0))
+
+
+class TestSelfPlay(unittest.IsolatedAsyncioTestCase):
+
+    async def serve(self, coordinator: Coordinator) -> tuple[asyncio.Task, int]:
+        started = asyncio.get_running_loop().create_future()
+        serving = asyncio.create_task(coordinator.serve('127.0.0.1', 0, started))
+        return serving, await started
+
+    def assertPlayed(self, results):
+        expected = [play(match) for match in MATCHES]
+        self.assertListEqual([result[:7] for result in results], [result[:7] for result in expected])  # not the ms
+
+    async def test_workers(self):
+
+        coordinator = Coordinator(MATCHES, batch=2)
+        serving, port = await self.serve(coordinator)
+        played = await asyncio.gather(work(port=port, processes=1, name='a'), work(port=port, processes=1, name='b'))
+        self.assertEqual(sum(played), len(MATCHES))
+        self.assertPlayed(await serving)
+        self.assertEqual(sum(coordinator.workers.values()), len(MATCHES))
+
+    async def test_worker_dies(self):
+
+        coordinator = Coordinator(MATCHES, batch=2)
+        serving, port = await self.serve(coordinator)
+
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        await send(writer, 'hello', VERSION, 'dying', 1)
+        kind, *_ = await receive(reader)  # takes a batch, and dies with it
+        self.assertEqual(kind, 'batch')
+        writer.close()
+
+        self.assertEqual(await work(port=port, processes=1, name='survivor'), len(MATCHES))
+        self.assertPlayed(await serving)
+        self.assertGreater(coordinator.reassigned, 0)
+
+    async def test_silent_worker(self):
+
+        coordinator = Coordinator(MATCHES[:2], batch=1, timeout=0.1)
+        serving, port = await self.serve(coordinator)
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        await send(writer, 'hello', VERSION, 'silent', 1)
+        await receive(reader)
+        await asyncio.sleep(0.2)  # takes too long, and is dropped
+        await work(port=port, processes=1)
+        self.assertEqual(len(await serving), 2)
+        self.assertEqual(coordinator.reassigned, 2)
+        writer.close()
+
+    async def test_worker_fails(self):
+
+        coordinator = Coordinator(MATCHES, batch=2)
+        serving, port = await self.serve(coordinator)
+
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        await send(writer, 'hello', VERSION, 'failing', 1)
+        kind, i, _ = await receive(reader)  # takes a batch, and fails to play it
+        await send(writer, 'failed', i, 'RuntimeError()')
+        while (await receive(reader))[1] != i:  # until the coordinator hands it out again
+            pass
+        writer.close()
+
+        self.assertEqual(await work(port=port, processes=1, name='survivor'), len(MATCHES))
+        self.assertPlayed(await serving)
+        self.assertEqual(coordinator.failures[i], 1)
+
+    async def test_malformed(self):
+
+        coordinator = Coordinator(MATCHES, batch=2)
+        serving, port = await self.serve(coordinator)
+
+        for malformed in (b'42', b'["results", 0, [[1, 2]]]', b'["results", 0, []]', b'["results", [0], []]'):
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            await send(writer, 'hello', VERSION, 'malformed', 1)
+            self.assertEqual((await receive(reader))[:2], ['batch', 0])  # each takes batch 0, and is dropped with it
+            writer.write(malformed + b'\n')
+            await reader.read()  # until it is dropped
+            writer.close()
+        self.assertEqual(coordinator.reassigned, 8)
+
+        self.assertEqual(await work(port=port, processes=1, name='survivor'), len(MATCHES))
+        self.assertPlayed(await serving)
+
+    async def test_batch_fails(self):
+
+        coordinator = Coordinator([Match('nobody', 'greedy', 3, 0, 5.0)], batch=1)
+        serving, port = await self.serve(coordinator)
+        self.assertEqual(await work(port=port, processes=1), 0)  # is told it is done, rather than wait forever
+        with self.assertRaisesRegex(RuntimeError, 'batch 0 failed 3 times'):
+            await serving
+        self.assertEqual(coordinator.reassigned, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+import random
+import unittest
+
+from api.engines import BitmaskEngine, Cached
+from api.game import Game
+from api.sessions import Sessions
+from tests.data import TURNS
+from tests.utils import play_turn
+
+
+def state(game: Game):
+    return game.state, game.player, game.start_node, game.end_node, game.new_line, game.path.nodes, game.error, \
+        game.lines, game.transitions
+
+
+class TestSessions(unittest.TestCase):
+
+    def test_hibernate(self):
+
+        sessions = Sessions(idle=3600)
+        for i, turn in enumerate(TURNS):
+            session = f'turn {i + 1}'
+            game = sessions[session]
+            for played in TURNS[:i]:
+                play_turn(game, played)
+            game(turn[0])  # leave the turn half played
+        expected = {session: state(game) for session, (game, _) in sessions._games.items()}
+
+        self.assertEqual(sessions.hibernate(), len(TURNS))
+        self.assertEqual(sessions.memory()['live'], 0)
+        self.assertEqual(len(sessions), len(TURNS))
+
+        for i, turn in enumerate(TURNS):
+            session = f'turn {i + 1}'
+            game = sessions[session]  # rehydrated
+            self.assertEqual(state(game), expected[session])
+            game(turn[1])
+            self.assertIn(game.state, ('VALID_END_NODE', 'GAME_OVER'))
+
+    def test_snapshot(self):
+
+        sessions = Sessions(idle=3600)
+        self.assertIsNone(sessions.snapshot('unknown'))
+        game = sessions['played']
+        play_turn(game, TURNS[0])
+        game(TURNS[1][0])  # half a turn, which is not in the snapshot
+        snapshot = sessions.snapshot('played')
+        self.assertIs(snapshot, game.snapshot)
+        self.assertEqual((snapshot.state, snapshot.player, len(snapshot.path)), ('VALID_END_NODE', 2, 3))
+
+        sessions.hibernate()
+        rehydrated = sessions.snapshot('played')
+        self.assertEqual(rehydrated, snapshot)  # the same version, so pollers still get a 304
+        self.assertNotIn('played', sessions._games)  # reading a snapshot does not rehydrate the game
+
+        game = sessions['played']
+        game(TURNS[1][0])  # the start node again, which is an invalid end node
+        self.assertIsNone(game.new_line)
+        sessions.hibernate()
+        self.assertEqual(sessions.snapshot('played'), snapshot)  # still the same body for the same version
+
+    def test_idle(self):
+
+        sessions = Sessions(idle=3600)
+        sessions['played'](TURNS[0][0])
+        sessions.reset('new')
+        self.assertEqual(sessions.hibernate(before=0), 0)  # nothing has been idle that long
+        self.assertEqual(sessions.hibernate(), 2)
+        self.assertEqual(sessions['played'].start_node, TURNS[0][0])
+
+    def test_memory(self):
+
+        sessions = Sessions(idle=3600, engine=Cached(BitmaskEngine()))
+        rng = random.Random(0)
+        for i in range(20):  # random games, which fill the cache shared by every game
+            game = sessions.reset(f'game {i}', 5)
+            while game.state != 'GAME_OVER':
+                start = rng.choice([game.path.nodes[0], game.path.nodes[-1]] if game.path.nodes else game.grid.points)
+                ends = sorted(game.valid_end_nodes(start), key=game.grid.index.get)
+                if ends:
+                    play_turn(game, (start, rng.choice(ends)))
+        self.assertGreater(len(sessions.engine._positions), 100)
+        memory = sessions.memory()
+        self.assertEqual(memory['live'], 20)
+        self.assertLess(memory['live_bytes_per_game'], 20_000)  # the engine and its cache are not counted
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+import subprocess
+import sys
+import unittest
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from api.benchmark import launch
+from api.startup import PHASES, FirstResponse, Timeline
+
+
+class TestStartup(unittest.TestCase):
+
+    def test_timeline(self):
+
+        timeline = Timeline(started=0.0)
+        seconds = timeline.mark('imports')
+        self.assertGreater(seconds, 0)
+        timeline.mark('app')
+        self.assertListEqual(list(timeline.phases), ['imports', 'app'])
+        self.assertAlmostEqual(timeline.total, sum(timeline.phases.values()))
+        self.assertIn('total', timeline.report())
+        self.assertSetEqual(set(timeline.to_dict()), {'imports', 'app', 'total'})
+
+    def test_first_response(self):
+
+        timeline = Timeline()
+        app = FastAPI()
+        app.get('/')(lambda: 'ok')
+        app.add_middleware(FirstResponse, timeline=timeline, quiet=True)
+        client = TestClient(app)
+        client.get('/')
+        phases = dict(timeline.phases)
+        self.assertListEqual(list(phases), ['waiting', 'first response'])
+        client.get('/')
+        self.assertDictEqual(timeline.phases, phases)  # only the first response
+
+    def test_deferred_imports(self):
+
+        code = 'import sys, api.__main__; print(sorted({"uvicorn", "msgpack"} & set(sys.modules)))'
+        output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True).stdout
+        self.assertEqual(output.strip().splitlines()[-1], '[]')
+
+    def test_launch(self):
+
+        seconds, phases = launch({})
+        self.assertListEqual(list(phases), [*PHASES, 'total'])
+        self.assertGreater(seconds, phases['imports'])
+
+
+if __name__ == '__main__':
+    unittest.main()
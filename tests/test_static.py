@@ -0,0 +1,87 @@
+import gzip
+import tempfile
+import unittest
+from pathlib import Path
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from api.static import StaticAssets, accepted, matches, brotli
+
+INDEX = '<script src="ui.js"></script><script src="https://example.com/other.js"></script>'
+SCRIPT = 'var Elm = {};\n' * 1000
+
+
+class TestStaticAssets(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        (Path(self.directory.name) / 'index.html').write_text(INDEX)
+        (Path(self.directory.name) / 'ui.js').write_text(SCRIPT)
+        self.assets = StaticAssets(self.directory.name)
+        app = FastAPI()
+        app.mount('/client', self.assets)
+        self.client = TestClient(app)
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    def test_fingerprinted(self):
+
+        response = self.client.get('/client/')
+        version = self.assets.assets['ui.js'].version
+        self.assertEqual(response.text, INDEX.replace('"ui.js"', f'"ui.js?v={version}"'))  # others left alone
+        self.assertEqual(response.headers['cache-control'], 'no-cache')
+        response = self.client.get(f'/client/ui.js?v={version}')
+        self.assertIn('immutable', response.headers['cache-control'])
+        self.assertEqual(self.client.get('/client/ui.js?v=stale').headers['cache-control'], 'no-cache')
+
+    def test_compressed(self):
+
+        response = self.client.get('/client/ui.js', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.headers['content-encoding'], 'gzip')
+        self.assertEqual(response.headers['vary'], 'Accept-Encoding')
+        self.assertEqual(int(response.headers['content-length']), len(gzip.compress(SCRIPT.encode(), 9, mtime=0)))
+        self.assertEqual(response.text, SCRIPT)  # decompressed by the client
+        response = self.client.get('/client/ui.js', headers={'Accept-Encoding': 'identity'})
+        self.assertNotIn('content-encoding', response.headers)
+        self.assertEqual(response.text, SCRIPT)
+        response = self.client.get('/client/ui.js', headers={'Accept-Encoding': 'gzip;q=0, br;q=0'})
+        self.assertNotIn('content-encoding', response.headers)
+
+    @unittest.skipIf(brotli is None, 'brotli is not installed')
+    def test_brotli(self):
+
+        response = self.client.get('/client/ui.js', headers={'Accept-Encoding': 'gzip, br'})
+        self.assertEqual(response.headers['content-encoding'], 'br')
+        self.assertEqual(response.text, SCRIPT)
+
+    def test_not_modified(self):
+
+        response = self.client.get('/client/ui.js', headers={'Accept-Encoding': 'gzip'})
+        etag = response.headers['etag']
+        response = self.client.get('/client/ui.js', headers={'Accept-Encoding': 'gzip', 'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response.headers['etag'], etag)
+        # each encoding has its own ETag
+        response = self.client.get('/client/ui.js', headers={'Accept-Encoding': 'identity', 'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+
+    def test_errors(self):
+
+        self.assertEqual(self.client.get('/client/missing.js').status_code, 404)
+        self.assertEqual(self.client.post('/client/ui.js').status_code, 405)
+        response = self.client.head('/client/ui.js', headers={'Accept-Encoding': 'identity'})
+        self.assertEqual((response.content, response.headers['content-length']), (b'', str(len(SCRIPT))))
+
+    def test_headers(self):
+
+        self.assertDictEqual(accepted('gzip;q=0.5, br , *;q=0'), {'gzip': 0.5, 'br': 1.0, '*': 0.0})
+        self.assertTrue(matches('"a", W/"b"', '"b"'))
+        self.assertTrue(matches('*', '"b"'))
+        self.assertFalse(matches('', '"b"'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from api import tables
+from api.models import Grid
+
+
+class TestTables(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.root = Path(self.directory.name)
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    def test_save_load(self):
+
+        built = Grid(5)._tables()
+        self.assertIsNone(tables.load(5, self.root))
+        self.assertTrue(tables.save(5, built, self.root))
+        loaded = tables.load(5, self.root)
+        for name in tables.NAMES:
+            self.assertEqual(loaded[name], built[name])
+        self.assertIsNone(tables.load(6, self.root))
+
+    def test_invalid(self):
+
+        tables.path(4, self.root).write_bytes(b'not marshal')
+        self.assertIsNone(tables.load(4, self.root))
+        tables.save(5, Grid(5)._tables(), self.root)
+        tables.path(5, self.root).rename(tables.path(4, self.root))  # the tables of another size
+        self.assertIsNone(tables.load(4, self.root))
+
+    def test_cached_grid(self):
+
+        tables.save(4, Grid(4)._tables(), self.root)
+        with mock.patch.dict('os.environ', {'GRID_CACHE': self.directory.name}):
+            Grid._registry.pop(4, None)
+            with mock.patch.object(Grid, '_tables', side_effect=AssertionError('built')):
+                grid = Grid(4)
+        self.assertEqual(len(grid.lines), sum(len(ray) for rays in grid.rays for ray in rays))
+        self.assertEqual(grid.transform(1, 1, 0), (1 << 3, 0))  # (0, 0) rotates to (3, 0)
+
+    def test_disabled(self):
+
+        with mock.patch.dict('os.environ', {'GRID_CACHE': '0'}):
+            self.assertIsNone(tables.directory())
+            self.assertFalse(tables.save(4, Grid(4)._tables()))
+
+    def test_directory(self):
+
+        with mock.patch.dict('os.environ', {'GRID_CACHE': '', 'XDG_CACHE_HOME': self.directory.name}):
+            self.assertEqual(tables.directory(), self.root / 'hold-that-line' / 'tables')  # not in the package
+        with mock.patch.dict('os.environ', {'GRID_CACHE': self.directory.name}):
+            self.assertEqual(tables.directory(), self.root)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,255 @@
+import datetime
+import io
+import json
+import tempfile
+import threading
+import time
+import unittest
+from pathlib import Path
+
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+from api.traffic import INDEX, MAGIC, Record, Recorder, RecorderMiddleware, Response, files, load, read, replay, \
+    report
+from tests.data import TURNS
+
+
+def record(endpoint, query=b'', body=b'', arrived=0.0) -> Record:
+    return Record(arrived, INDEX[endpoint], query, b'application/json', body)
+
+
+class TestRecorder(unittest.TestCase):
+
+    def test_round_trip(self):
+
+        with tempfile.TemporaryDirectory() as directory:
+            recorder = Recorder(directory)
+            records = [
+                record(('GET', '/initialize'), b'session=a', arrived=1.0),
+                record(('POST', '/node-clicked'), b'session=a', b'{"x":0,"y":0}', arrived=2.0),
+            ]
+            for r in records:
+                recorder.record(r)
+            self.assertEqual(list(read(files(Path(directory))[0])), records)  # readable while still being written
+            recorder.close()
+            self.assertEqual(load([directory]), records)
+
+    def test_large(self):
+
+        with tempfile.TemporaryDirectory() as directory:
+            recorder = Recorder(directory)
+            clicks = record(('POST', '/games/nodes-clicked'), b'', b'x' * 100_000)  # more than 64 KB
+            recorder.record(clicks)
+            recorder.close()
+            self.assertEqual(load([directory]), [clicks])
+
+    def test_cut_short(self):
+
+        with tempfile.TemporaryDirectory() as directory:
+            recorder = Recorder(directory)
+            recorder.record(record(('GET', '/state'), b'session=a'))
+            recorder.record(record(('GET', '/state'), b'session=b'))
+            recorder.close()
+            path = files(Path(directory))[0]
+            path.write_bytes(path.read_bytes()[:-3])
+            self.assertEqual([r.query for r in read(path)], [b'session=a'])
+
+            path.write_bytes(b'nope')
+            with self.assertRaises(ValueError):
+                list(read(path))
+
+    def test_rotate(self):
+
+        with tempfile.TemporaryDirectory() as directory:
+            recorder = Recorder(directory, max_bytes=120, keep=2)
+            for i in range(10):  # two records to a file
+                recorder.record(record(('POST', '/error'), body=b'x' * 15, arrived=float(i)))
+            recorder.close()
+            kept = files(Path(directory))
+            self.assertEqual([path.name for path in kept], ['traffic-000004.rec', 'traffic-000005.rec'])
+            self.assertTrue(all(path.read_bytes().startswith(MAGIC) and path.stat().st_size <= 120 for path in kept))
+            self.assertEqual([r.time for r in load([directory])], [6.0, 7.0, 8.0, 9.0])
+            self.assertEqual(recorder.records, 10)
+
+    def test_sessions(self):
+
+        self.assertEqual(record(('GET', '/state'), b'session=a&x=1').sessions(), {'a'})
+        self.assertEqual(record(('GET', '/state')).sessions(), {'default'})
+        clicks = json.dumps({'clicks': [{'session': 'a', 'x': 0, 'y': 0}, {'session': 'b', 'x': 1, 'y': 1}]})
+        self.assertEqual(record(('POST', '/games/nodes-clicked'), body=clicks.encode()).sessions(), {'a', 'b'})
+        self.assertEqual(record(('POST', '/games/nodes-clicked'), body=b'nonsense').sessions(), set())
+
+    def test_renamed(self):
+
+        renamed = record(('POST', '/node-clicked'), b'session=a', b'{"x":0,"y":0}').renamed('run-')
+        self.assertEqual(renamed.sessions(), {'run-a'})
+        self.assertEqual(renamed.body, b'{"x":0,"y":0}')
+        clicks = json.dumps({'clicks': [{'session': 'a', 'x': 0, 'y': 0}]}).encode()
+        self.assertEqual(record(('POST', '/games/nodes-clicked'), body=clicks).renamed('run-').sessions(), {'run-a'})
+        self.assertEqual(record(('GET', '/state')).renamed('run-').sessions(), {'run-default'})
+
+
+class TestRecorderMiddleware(unittest.TestCase):
+
+    def test_records_game_endpoints(self):
+
+        app = FastAPI()
+
+        @app.post('/node-clicked')
+        async def clicked(request: Request):
+            return await request.json()
+
+        @app.get('/state')
+        def state():
+            return {}
+
+        with tempfile.TemporaryDirectory() as directory:
+            recorder = Recorder(directory)
+            app.add_middleware(RecorderMiddleware, recorder=recorder)
+            client = TestClient(app)
+            self.assertEqual(client.post('/node-clicked?session=a', json={'x': 1, 'y': 2}).json(), {'x': 1, 'y': 2})
+            client.get('/state?session=a')
+            client.get('/other')  # not recorded
+            recorder.close()
+
+            first, second = load([directory])
+            self.assertEqual((first.method, first.path, first.query), ('POST', '/node-clicked', b'session=a'))
+            self.assertEqual(json.loads(first.body), {'x': 1, 'y': 2})
+            self.assertEqual((second.path, second.body), ('/state', b''))
+            self.assertLessEqual(first.time, second.time)
+
+    def test_failure(self):
+
+        app = FastAPI()
+
+        @app.get('/state')
+        def state():
+            return {}
+
+        with tempfile.TemporaryDirectory() as directory:
+            recorder = Recorder(directory)
+            recorder.close()
+            recorder.record = lambda record: 1 / 0
+            app.add_middleware(RecorderMiddleware, recorder=recorder)
+            self.assertEqual(TestClient(app).get('/state').status_code, 200)  # answered, but not recorded
+            self.assertEqual(recorder.failures, 1)
+
+
+class Fake:
+    """
+    A build that answers with the request's query, slowly for session a, and notes the order of each session
+    """
+
+    def __init__(self):
+        self.order: dict[str, list[int]] = {}
+        self.lock = threading.Lock()
+
+    def send(self, r: Record) -> Response:
+        session, = r.sessions()
+        if session == 'a':
+            time.sleep(0.01)
+        with self.lock:
+            self.order.setdefault(session, []).append(int(r.time))
+        if session == 'broken':
+            raise ConnectionError('refused')
+        return Response(200, r.query, 0.001)
+
+
+class TestReplay(unittest.TestCase):
+
+    def test_sessions_in_order(self):
+
+        records = [record(('GET', '/state'), f'session={"ab"[i % 2]}'.encode(), arrived=float(i)) for i in range(40)]
+        target = Fake()
+        responses = replay(records, target, speed=None, concurrency=4)
+        self.assertEqual([response.body for response in responses], [r.query for r in records])
+        self.assertEqual(target.order['a'], list(range(0, 40, 2)))
+        self.assertEqual(target.order['b'], list(range(1, 40, 2)))
+
+    def test_speed(self):
+
+        records = [record(('GET', '/state'), b'session=b', arrived=i * 0.5) for i in range(3)]
+        started = time.perf_counter()
+        replay(records, Fake(), speed=10)
+        self.assertGreaterEqual(time.perf_counter() - started, 0.1)
+
+    def test_failures(self):
+
+        responses = replay([record(('GET', '/state'), b'session=broken')], Fake(), speed=None)
+        self.assertEqual(responses[0].status, 0)
+        self.assertIn(b'refused', responses[0].body)
+
+    def test_report(self):
+
+        records = [record(('GET', '/state'), b'session=a'), record(('GET', '/initialize'), b'session=a')]
+        same = Response(200, b'{"version": 3, "board": 1}', 0.002)
+        runs = {
+            'one': [same, Response(200, b'{}', 0.001)],
+            'two': [same._replace(body=b'{"version": 7, "board": 1}'), Response(500, b'', 0.001)],
+        }
+        output = io.StringIO()
+        self.assertEqual(report(records, runs, file=output), [1])  # /state versions differ between processes
+        self.assertIn('1 of 2 responses differ between one and two', output.getvalue())
+        self.assertEqual(report(records, {'one': runs['one']}, file=io.StringIO()), [])
+
+
+class Client:
+    """
+    A build to replay against, in this process
+    """
+
+    def __init__(self, app):
+        self.client = TestClient(app)
+
+    def send(self, r: Record) -> Response:
+        path = r.path + (f'?{r.query.decode("latin-1")}' if r.query else '')
+        response = self.client.request(r.method, path, content=r.body or None, headers={'Accept': r.accept.decode()})
+        return Response(response.status_code, response.content, 0.0)
+
+
+class TestRecordReplay(unittest.TestCase):
+
+    def test_computer_move(self):
+
+        from api.__main__ import app, scheduler, sessions
+        with tempfile.TemporaryDirectory() as directory:
+            recorder = Recorder(directory)
+            client = TestClient(RecorderMiddleware(app, recorder))
+            recorded = [client.get('/initialize', params={'session': 'computer'})]
+
+            def clicked(point):
+                body = {'x': point.x, 'y': point.y}
+                recorded.append(client.post('/node-clicked', params={'session': 'computer'}, json=body))
+
+            for point in TURNS[0]:
+                clicked(point)
+            recorded.append(client.post('/computer-move', params={'session': 'computer', 'player': 'random'}))
+            game = sessions['computer']
+            start = game.path.nodes[-1]
+            clicked(start)
+            clicked(min(game.valid_end_nodes(start), key=game.grid.index.get))  # a line only the move played allows
+            recorder.close()
+            scheduler.shutdown()
+
+            records = [r.renamed('replayed-') for r in load([directory])]
+            self.assertIn(b'move=', records[3].query)
+            replayed = replay(records, Client(app), speed=None)
+        self.assertEqual([(r.status, r.body) for r in replayed], [(r.status_code, r.content) for r in recorded])
+        self.assertEqual(sessions['replayed-computer'].lines, game.lines)
+
+    def test_puzzle(self):
+
+        from api.__main__ import app
+        with tempfile.TemporaryDirectory() as directory:
+            recorder = Recorder(directory)
+            client = TestClient(RecorderMiddleware(app, recorder))
+            recorded = [client.get('/puzzle', params={'session': 'puzzled', 'moves': 1, 'solution': True})]
+            for point in recorded[0].json()['solution'].values():  # the winning line, only on this day's puzzle
+                recorded.append(client.post('/node-clicked', params={'session': 'puzzled'}, json=point))
+            recorder.close()
+
+            records = [r.renamed('replayed-') for r in load([directory])]
+            self.assertIn(f'day={datetime.date.today().isoformat()}'.encode(), records[0].query)
+            replayed = replay(records, Client(app), speed=None)
+        self.assertEqual([(r.status, r.body) for r in replayed], [(r.status_code, r.content) for r in recorded])
@@ -0,0 +1,75 @@
+import unittest
+
+from fastapi.encoders import jsonable_encoder
+
+from api.__main__ import Payload, StateUpdate, respond
+from api.game import Game
+from api.wire import BINARY, JSON, MSGPACK, MSGPACK_INSTALLED, negotiate, pack, plain, unpack, unpack_list
+from tests.data import TURNS
+from tests.utils import play_turn
+
+
+def payloads():
+    """
+    :return: a payload of each state of the sample game, with and without the legal nodes
+    """
+    game = Game()
+    yield respond(game)
+    for turn in TURNS:
+        game(turn[0])
+        yield respond(game, legal=True)
+        game(turn[1])
+        yield respond(game)
+    game(TURNS[0][0])  # not an end of the path
+    yield respond(game, legal=True)
+
+
+class TestWire(unittest.TestCase):
+
+    def test_plain(self):
+
+        for payload in payloads():
+            self.assertDictEqual(plain(payload), jsonable_encoder(payload))
+
+    def test_pack(self):
+
+        for payload in payloads():
+            data = pack(payload)
+            self.assertEqual(unpack(data), (plain(payload), len(data)))
+        self.assertListEqual(unpack_list(pack(list(payloads()))), plain(list(payloads())))
+
+        game = Game()
+        play_turn(game, TURNS[0])
+        self.assertLess(len(pack(respond(game))), len(str(jsonable_encoder(respond(game)))) / 3)
+
+    def test_pack_long(self):
+
+        game = Game()
+        game.error = 'x' * 100_000  # as posted to /error
+        game.state = 'ERROR'
+        data = pack(respond(game))
+        self.assertEqual(unpack(data), (plain(respond(game)), len(data)))
+
+        payload = Payload(msg='INITIALIZE', body=StateUpdate(heading='é' * 200))  # 400 bytes
+        self.assertEqual(unpack(pack(payload))[0]['body']['heading'], 'é' * 127)
+
+    @unittest.skipUnless(MSGPACK_INSTALLED, 'msgpack is not installed')
+    def test_msgpack(self):
+        import msgpack
+
+        for payload in payloads():
+            self.assertDictEqual(msgpack.unpackb(msgpack.packb(plain(payload))), jsonable_encoder(payload))
+        self.assertEqual(negotiate('application/msgpack'), MSGPACK)
+
+    def test_negotiate(self):
+
+        self.assertEqual(negotiate(None), JSON)
+        self.assertEqual(negotiate('*/*'), JSON)
+        self.assertEqual(negotiate('text/html'), JSON)  # nothing acceptable, so the default
+        self.assertEqual(negotiate(BINARY), BINARY)
+        self.assertEqual(negotiate(f'{JSON};q=0.5, {BINARY}'), BINARY)
+        self.assertEqual(negotiate(f'{JSON}, {BINARY}'), JSON)
+
+
+if __name__ == '__main__':
+    unittest.main()